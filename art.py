@@ -1,4 +1,4 @@
-import os.path, json, time, traceback
+import os.path, json, time, traceback, textwrap
 import random # import random only so art scripts don't have to
 import numpy as np
 
@@ -24,6 +24,11 @@ DEFAULT_FRAME_DELAY = 0.1
 DEFAULT_LAYER_Z = 0
 DEFAULT_LAYER_Z_OFFSET = 0.5
 
+# text alignments for write_text
+TEXT_LEFT = 0
+TEXT_CENTER = 1
+TEXT_RIGHT = 2
+
 ART_DIR = 'art/'
 ART_FILE_EXTENSION = 'psci'
 
@@ -78,6 +83,17 @@ uv_types_reverse = {
     uv_types[UV_FLIP270]: UV_FLIP270
 }
 
+def layout_text(text, width, wrap=True):
+    "Return list of lines for given text, word wrapped or cut to given width."
+    lines = []
+    for line in text.split('\n'):
+        if wrap and len(line) > width:
+            # wrap() returns nothing for an all-whitespace line
+            lines += textwrap.wrap(line, width) or ['']
+        else:
+            lines.append(line[:width])
+    return lines
+
 
 class Art:
     """
@@ -111,6 +127,9 @@ class Art:
         self.charset, self.palette = charset, palette
         self.command_stack = CommandStack(self)
         self.unsaved_changes = False
+        # our file's modified time right after we last saved it, lets hot
+        # reload tell our own saves from changes made elsewhere
+        self.saved_mtime = None
         self.width, self.height = width, height
         # selected char/fg/bg/xform
         self.selected_char = self.charset.get_char_index('A') or 2
@@ -131,6 +150,8 @@ class Art:
         # table of {frame_number: bool} changed frames, processed each update()
         self.char_changed_frames, self.uv_changed_frames = {}, {}
         self.fg_changed_frames, self.bg_changed_frames = {}, {}
+        self.changed_tile_bounds = {}
+        "Table of {frame_number: [left, top, right, bottom]} tiles changed"
         self.renderables = []
         "List of TileRenderables using us - each new Renderable adds itself"
         self.instances = []
@@ -310,14 +331,13 @@ class Art:
     def clear_frame_layer(self, frame, layer, bg_color=0, fg_color=None):
         "Clear given layer of given frame to transparent BG + no characters."
         # "clear" UVs to UV_NORMAL
-        for y in range(self.height):
-            for x in range(self.width):
-                self.uv_mods[frame][layer][y][x] = uv_types[UV_NORMAL]
-                self.uv_maps[frame][layer][y][x] = UV_NORMAL
-                self.chars[frame][layer][y][x] = 0
-                self.fg_colors[frame][layer][y][x] = fg_color or 0
-                self.bg_colors[frame][layer][y][x] = bg_color
+        self.uv_mods[frame][layer] = uv_types[UV_NORMAL]
+        self.uv_maps[frame][layer] = UV_NORMAL
+        self.chars[frame][layer] = 0
+        self.fg_colors[frame][layer] = fg_color or 0
+        self.bg_colors[frame][layer] = bg_color
         # tell this frame to update
+        self.changed_tile_bounds.pop(frame, None)
         self.char_changed_frames[frame] = True
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
@@ -440,11 +460,36 @@ class Art:
     
     def mark_frame_changed(self, frame):
         "Given frame at given index as changed for next render."
+        self.changed_tile_bounds.pop(frame, None)
         self.char_changed_frames[frame] = True
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
         self.uv_changed_frames[frame] = True
     
+    def is_frame_changed(self, frame):
+        "Return True if given frame has any changes pending for next render."
+        return self.char_changed_frames.get(frame, False) or \
+            self.fg_changed_frames.get(frame, False) or \
+            self.bg_changed_frames.get(frame, False) or \
+            self.uv_changed_frames.get(frame, False)
+    
+    def mark_tile_changed(self, frame, x, y):
+        """
+        Grow given frame's changed tile bounds to include given tile, so that
+        renderables only re-upload the affected part of their buffers.
+        """
+        self.mark_region_changed(frame, x, y, x + 1, y + 1)
+    
+    def mark_region_changed(self, frame, x0, y0, x1, y1):
+        "Grow given frame's changed tile bounds to include given tile region."
+        bounds = self.changed_tile_bounds.get(frame, None)
+        if bounds:
+            bounds[0], bounds[1] = min(bounds[0], x0), min(bounds[1], y0)
+            bounds[2], bounds[3] = max(bounds[2], x1), max(bounds[3], y1)
+        # frames changed with no bounds have changed in their entirety
+        elif not self.is_frame_changed(frame):
+            self.changed_tile_bounds[frame] = [x0, y0, x1, y1]
+    
     def mark_all_frames_changed(self):
         "Mark all frames as changed for next render."
         for frame in range(self.frames):
@@ -555,6 +600,7 @@ class Art:
         "Set character index for given frame/layer/x,y tile."
         self.chars[frame][layer][y][x] = char_index
         # next update, tell renderables on the changed frame to update buffers
+        self.mark_tile_changed(frame, x, y)
         self.char_changed_frames[frame] = True
     
     def set_color_at(self, frame, layer, x, y, color_index, fg=True):
@@ -570,6 +616,7 @@ class Art:
         # so use the same code path with different parameters
         update_array = self.fg_colors[frame] if fg else self.bg_colors[frame]
         update_array[layer][y][x] = color_index
+        self.mark_tile_changed(frame, x, y)
         self.fg_changed_frames[frame] = True
         self.bg_changed_frames[frame] = True
     
@@ -592,6 +639,45 @@ class Art:
                 continue
             self.set_color_at(frame, layer, x, y, new_color_index, fg=False)
     
+    def set_tiles_in_region(self, frame, layer, x, y, width, height,
+                            char_index=None, fg=None, bg=None):
+        """
+        Set character index and/or colors for every tile in given region.
+        char_index may be one index or a (height, width) array of them.
+        Tiles are only marked changed if their contents actually change.
+        """
+        region = (layer, slice(y, y + height), slice(x, x + width))
+        char_changed, color_changed = False, False
+        if char_index is not None:
+            char_index = np.asarray(char_index, dtype=np.float32)
+            # arrays hold each tile's value once per vertex
+            if char_index.ndim > 0:
+                char_index = char_index[..., np.newaxis]
+            chars = self.chars[frame][region]
+            if not (chars == char_index).all():
+                chars[:] = char_index
+                char_changed = True
+        for color, array in [(fg, self.fg_colors[frame]),
+                             (bg, self.bg_colors[frame])]:
+            if color is None:
+                continue
+            # same index resolution as set_color_at
+            if 0 < color >= len(self.palette.colors):
+                color %= len(self.palette.colors)
+            colors = array[region]
+            if not (colors == color).all():
+                colors[:] = color
+                color_changed = True
+        if not char_changed and not color_changed:
+            return
+        self.mark_region_changed(frame, x, y, min(x + width, self.width),
+                                 min(y + height, self.height))
+        if char_changed:
+            self.char_changed_frames[frame] = True
+        if color_changed:
+            self.fg_changed_frames[frame] = True
+            self.bg_changed_frames[frame] = True
+    
     def set_char_transform_at(self, frame, layer, x, y, transform):
         """
         Set character transform (X/Y flip, 0/90/180/270 rotate) for given
@@ -600,6 +686,7 @@ class Art:
         self.uv_mods[frame][layer][y][x] = uv_types[transform]
         # keep mapping, used only for quick access, in sync
         self.uv_maps[frame][layer][y][x] = transform
+        self.mark_tile_changed(frame, x, y)
         self.uv_changed_frames[frame] = True
     
     def set_tile_at(self, frame, layer, x, y, char_index=None, fg=None, bg=None,
@@ -728,7 +815,8 @@ class Art:
             do_fg = self.fg_changed_frames[r.frame]
             do_bg = self.bg_changed_frames[r.frame]
             if do_char or do_fg or do_bg or do_uvs:
-                r.update_tile_buffers(do_char, do_uvs, do_fg, do_bg)
+                r.update_tile_buffers(do_char, do_uvs, do_fg, do_bg,
+                                      self.changed_tile_bounds.get(r.frame, None))
         # update instances if we chaned
         if self.changed_this_frame() and self.instances:
             for instance in self.instances:
@@ -740,6 +828,7 @@ class Art:
             self.fg_changed_frames[f] = False
             self.bg_changed_frames[f] = False
             self.uv_changed_frames[f] = False
+        self.changed_tile_bounds = {}
         self.updated_this_tick = True
     
     def save_to_file(self):
@@ -796,7 +885,9 @@ class Art:
         d['frames'] = frames
         # MAYBE-TODO: below gives not-so-pretty-printing, find out way to control
         # formatting for better output
-        json.dump(d, open(self.filename, 'w'), sort_keys=True, indent=1)
+        with open(self.filename, 'w') as f:
+            json.dump(d, f, sort_keys=True, indent=1)
+        self.saved_mtime = os.path.getmtime(self.filename)
         end_time = time.time()
         self.set_unsaved_changes(False)
         #self.app.log('saved %s to disk in %.5f seconds' % (self.filename, end_time - start_time))
@@ -972,38 +1063,64 @@ class Art:
     def clear_line(self, frame, layer, line_y, fg_color_index=None,
                    bg_color_index=None):
         "Clear characters on given horizontal line, to optional given colors."
-        # TODO: use numpy slicing to do this much more quickly!
-        for x in range(self.width):
-            self.set_char_index_at(frame, layer, x, line_y, 0)
-            if fg_color_index:
-                self.set_color_at(frame, layer, x, line_y, fg_color_index)
-            if bg_color_index:
-                self.set_color_at(frame, layer, x, line_y, bg_color_index, False)
+        # negative lines count up from the bottom
+        if line_y < 0:
+            line_y += self.height
+        self.set_tiles_in_region(frame, layer, 0, line_y, self.width, 1, 0,
+                                 fg_color_index or None, bg_color_index or None)
     
     def write_string(self, frame, layer, x, y, text, fg_color_index=None,
                      bg_color_index=None, right_justify=False):
         """
         Write given string starting at given frame/layer/x,y tile, with
         optional given colors, left-justified by default.
-        Any characters not in character set's mapping data are ignored.
+        Characters not in character set's mapping data are drawn as index 0.
+        Tiles that already hold the given text and colors aren't touched.
         """
         if y >= self.height:
             return
+        # negative lines count up from the bottom, eg console input line
+        if y < 0:
+            y += self.height
+        if y < 0:
+            self.app.log("Can't write string at line %s of %s, which is only %s lines tall" % (y - self.height, self.filename, self.height), error=True)
+            return
         x %= self.width
         if right_justify:
-            x_offset = -len(text)
-        else:
-            x_offset = 0
+            x -= len(text)
         # never let string drawing go out of bounds
-        text = text[:self.width - (x+x_offset)]
-        for char in text:
-            idx = self.charset.get_char_index(char)
-            self.set_char_index_at(frame, layer, x+x_offset, y, idx)
-            if fg_color_index is not None:
-                self.set_color_at(frame, layer, x+x_offset, y, fg_color_index, True)
-            if bg_color_index is not None:
-                self.set_color_at(frame, layer, x+x_offset, y, bg_color_index, False)
-            x_offset += 1
+        if x < 0:
+            text, x = text[-x:], 0
+        text = text[:self.width - x]
+        if len(text) == 0:
+            return
+        char_indices = self.charset.get_char_indices(text)[np.newaxis]
+        self.set_tiles_in_region(frame, layer, x, y, len(text), 1, char_indices,
+                                 fg_color_index, bg_color_index)
+    
+    def write_text(self, frame, layer, x, y, text, fg_color_index=None,
+                   bg_color_index=None, width=None, align=TEXT_LEFT, wrap=True):
+        """
+        Write given (possibly multi-line) string as a block starting at given
+        frame/layer/x,y tile, each line aligned within given width - by
+        default, the rest of the Art's width. Lines longer than this are
+        word wrapped, or cut off if wrap is False.
+        Returns number of lines written.
+        """
+        width = width or self.width - x
+        lines = layout_text(text, width, wrap)
+        for i, line in enumerate(lines):
+            if y + i >= self.height:
+                return i
+            if align == TEXT_CENTER:
+                line_x = x + (width - len(line)) // 2
+            elif align == TEXT_RIGHT:
+                line_x = x + width - len(line)
+            else:
+                line_x = x
+            self.write_string(frame, layer, line_x, y + i, line,
+                              fg_color_index, bg_color_index)
+        return len(lines)
     
     def composite_to(self, src_frame, src_layer, src_x, src_y, width, height,
                      dest_art, dest_frame, dest_layer, dest_x, dest_y):
@@ -1160,6 +1277,31 @@ class ArtFromDisk(Art):
     def first_update(self):
         # do nothing on first update during Art.init; we update after loading
         pass
+    
+    def reload_from_disk(self):
+        """
+        Replace our contents with those of our file, keeping this object
+        (and renderables, instances etc using it) in place.
+        Returns False if file couldn't be loaded.
+        """
+        new_art = ArtFromDisk(self.filename, self.app)
+        if not new_art.valid:
+            return False
+        for prop in ['width', 'height', 'charset', 'palette', 'quad_width',
+                     'quad_height', 'layers', 'layers_z', 'layers_visibility',
+                     'layer_names', 'frames', 'frame_delays', 'chars',
+                     'fg_colors', 'bg_colors', 'uv_mods', 'uv_maps']:
+            setattr(self, prop, getattr(new_art, prop))
+        self.active_frame = min(self.active_frame, self.frames - 1)
+        self.active_layer = min(self.active_layer, self.layers - 1)
+        # renderables re-upload everything in update() below
+        for r in self.renderables:
+            if r.frame >= self.frames:
+                r.frame = 0
+        self.geo_changed = True
+        self.mark_all_frames_changed()
+        self.update()
+        return True
 
 
 class ArtInstance(Art):
@@ -1177,6 +1319,7 @@ class ArtInstance(Art):
         self.instances = None
         self.char_changed_frames, self.uv_changed_frames = {}, {}
         self.fg_changed_frames, self.bg_changed_frames = {}, {}
+        self.changed_tile_bounds = {}
         # init lists that should be retained across refreshes
         self.scripts = []
         self.script_rates = []
@@ -101,6 +101,38 @@ class Camera:
              [wx, wy, wz, 0]]
         return np.array(m, dtype=np.float32)
     
+    def get_visible_bounds(self, plane_z=0):
+        """
+        Return world space (left, top, right, bottom) of area visible on an
+        XY plane at given Z, or None if the view doesn't fully intersect it.
+        """
+        if self.look_x is None:
+            return None
+        tan_y = math.tan(self.fov * math.pi / 360)
+        tan_x = tan_y * self.app.window_width / self.app.window_height
+        side, upward, forward = self.look_x, self.look_y, self.look_z
+        xs, ys = [], []
+        # cast rays through each corner of the view, find where they hit plane
+        for cx, cy in [(-1, -1), (1, -1), (-1, 1), (1, 1)]:
+            vx, vy = cx * tan_x, cy * tan_y
+            dx = side.x * vx + upward.x * vy + forward.x
+            dy = side.y * vx + upward.y * vy + forward.y
+            dz = side.z * vx + upward.z * vy + forward.z
+            if dz >= 0 or plane_z >= self.z:
+                return None
+            t = (plane_z - self.z) / dz
+            xs.append(self.x + dx * t)
+            ys.append(self.y + dy * t)
+        return min(xs), max(ys), max(xs), min(ys)
+    
+    def get_pixels_per_unit(self, plane_z=0):
+        "Return approximate # of screen pixels per world unit at given Z."
+        distance = self.z - plane_z
+        if distance <= 0:
+            return float('inf')
+        view_height = 2 * distance * math.tan(self.fov * math.pi / 360)
+        return self.app.window_height / view_height
+    
     def pan(self, dx, dy, keyboard=False):
         # modify pan speed based on zoom according to a factor
         m = (self.pan_zoom_increase_factor * self.z) / self.min_zoom
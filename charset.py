@@ -1,43 +1,47 @@
-import os.path, string, time
+import os.path, string, hashlib
+import numpy as np
 from PIL import Image
 
 from texture import Texture
 
 CHARSET_DIR = 'charsets/'
 CHARSET_FILE_EXTENSION = 'char'
+# subdir of cache dir where processed charset images + glyph data are stored
+CHARSET_CACHE_DIR = 'charsets/'
 
 
 class CharacterSetLord:
     
-    # time in ms between checks for hot reload
-    hot_reload_check_interval = 2 * 1000
-    
     def __init__(self, app):
         self.app = app
-        self.last_check = 0
     
-    def check_hot_reload(self):
-        if self.app.get_elapsed_time() - self.last_check < self.hot_reload_check_interval:
-            return
-        self.last_check = self.app.get_elapsed_time()
-        changed = None
+    def watch(self, charset):
+        "Hot reload given charset when its data or image file changes."
+        self.app.fw.watch(charset.filename, self.file_changed)
+        self.app.fw.watch(charset.image_filename, self.file_changed)
+    
+    def file_changed(self, filename):
         for charset in self.app.charsets:
-            if charset.has_updated():
-                changed = charset.filename
-                # reload data and image even if only one changed
-                try:
-                    success = charset.load_char_data()
-                    if success:
-                        self.app.log('CharacterSetLord: success reloading %s' % charset.filename)
-                    else:
-                        self.app.log('CharacterSetLord: failed reloading %s' % charset.filename, True)
-                except:
+            if not filename in [charset.filename, charset.image_filename]:
+                continue
+            # reload data and image even if only one changed
+            try:
+                success = charset.load_char_data()
+                if success:
+                    self.app.log('CharacterSetLord: success reloading %s' % charset.filename)
+                    # data may now point to a different image
+                    self.watch(charset)
+                else:
                     self.app.log('CharacterSetLord: failed reloading %s' % charset.filename, True)
+            except:
+                self.app.log('CharacterSetLord: failed reloading %s' % charset.filename, True)
 
 
 class CharacterSet:
     
     transparent_color = (0, 0, 0)
+    use_cache = True
+    "If True, store processed image and glyph data in cache dir"
     
     def __init__(self, app, src_filename, log):
         self.init_success = False
@@ -51,9 +55,6 @@ class CharacterSet:
         self.name = os.path.splitext(self.name)[0]
         # image filename discovered by character data load process
         self.image_filename = None
-        # remember last modified times for data and image files
-        self.last_data_change = os.path.getmtime(self.filename)
-        self.last_image_change = 0
         # do most stuff in load_char_data so we can hot reload
         if not self.load_char_data():
             return
@@ -66,6 +67,8 @@ class CharacterSet:
     def load_char_data(self):
         "carries out majority of CharacterSet init, including loading image"
         char_data_src = open(self.filename, encoding='utf-8').readlines()
+        # keep for cache key, mapping changes invalidate glyph data
+        self.char_data_src = char_data_src
         # allow comments: discard any line in char data starting with //
         # (make sure this doesn't muck up legit mapping data)
         char_data = []
@@ -79,8 +82,6 @@ class CharacterSet:
             self.app.log("Couldn't find character set image %s" % self.image_filename)
             return False
         self.image_filename = img_filename
-        # now that we know the image file's name, store its last modified time
-        self.last_image_change = os.path.getmtime(self.image_filename)
         # second line = character set dimensions
         second_line = char_data.pop(0).strip().split(',')
         self.map_width, self.map_height = int(second_line[0]), int(second_line[1])
@@ -115,6 +116,11 @@ class CharacterSet:
                 self.char_mapping[char] = self.char_mapping[char.lower()]
         # last valid index a character can be
         self.last_index = self.map_width * self.map_height
+        # codepoint: char index array, for mapping whole strings at once
+        self.char_lookup = np.zeros(max([ord(c) for c in self.char_mapping] + [0]) + 1,
+                                    dtype=np.float32)
+        for char, index in self.char_mapping.items():
+            self.char_lookup[ord(char)] = index
         # load image
         self.load_image_data()
         self.set_char_dimensions()
@@ -122,27 +128,108 @@ class CharacterSet:
         self.base_filename = os.path.splitext(os.path.basename(self.filename))[0]
         return True
     
+    def get_cache_filename(self):
+        """
+        Return cache filename for current image + mapping data: charset name
+        plus a hash of the data, so older versions can be found and pruned.
+        """
+        h = hashlib.sha1()
+        h.update(open(self.image_filename, 'rb').read())
+        h.update(bytes(''.join(self.char_data_src), 'utf-8'))
+        h.update(bytes(str((self.transparent_color, self.map_width, self.map_height)), 'utf-8'))
+        return '%s%s%s.%s.npz' % (self.app.cache_dir, CHARSET_CACHE_DIR,
+                                  os.path.splitext(self.name)[0], h.hexdigest())
+    
+    def prune_cache(self, cache_filename):
+        "Delete cached data for older versions of this charset than given file."
+        cache_dir, current = os.path.split(cache_filename)
+        prefix = current.rsplit('.', 2)[0]
+        for filename in os.listdir(cache_dir):
+            if filename == current or not filename.endswith('.npz'):
+                continue
+            if filename.rsplit('.', 2)[0] == prefix:
+                try: os.remove(os.path.join(cache_dir, filename))
+                except: pass
+    
     def load_image_data(self):
-        # load and process image
-        img = Image.open(self.image_filename)
-        img = img.convert('RGBA')
+        cache_filename = self.get_cache_filename() if self.use_cache else None
+        if not cache_filename or not self.load_cached_image_data(cache_filename):
+            self.process_image_data()
+            if cache_filename:
+                self.save_cached_image_data(cache_filename)
+        self.image_height, self.image_width = self.pixels.shape[:2]
         # flip for openGL
-        img = img.transpose(Image.FLIP_TOP_BOTTOM)
-        self.image_width, self.image_height = img.size
+        self.texture = Texture(np.flipud(self.pixels).tobytes(),
+                               self.image_width, self.image_height)
+        # keep image for later, eg image conversion
+        self.image_data = Image.fromarray(self.pixels, 'RGBA')
+        # (re)generated on demand from new image
+        self.char_ink = None
+    
+    def process_image_data(self):
+        "Load image and compute per-character data from it."
+        img = Image.open(self.image_filename).convert('RGBA')
+        self.pixels = np.array(img, dtype=np.uint8)
         # any pixel that is "transparent color" will be made fully transparent
         # any pixel that isn't will be opaque + tinted FG color
-        for y in range(self.image_height):
-            for x in range(self.image_width):
-                # TODO: PIL pixel access shows up in profiler, use numpy array
-                # assignment instead
-                color = img.getpixel((x, y))
-                if color[:3] == self.transparent_color[:3]:
-                    # MAYBE-TODO: does keeping non-alpha color improve sampling?
-                    img.putpixel((x, y), (color[0], color[1], color[2], 0))
-        self.texture = Texture(img.tobytes(), self.image_width, self.image_height)
-        # flip image data back and save it for later, eg image conversion
-        img = img.transpose(Image.FLIP_TOP_BOTTOM)
-        self.image_data = img
+        # MAYBE-TODO: does keeping non-alpha color improve sampling?
+        transparent = np.all(self.pixels[:, :, :3] == self.transparent_color[:3], axis=2)
+        self.pixels[transparent, 3] = 0
+        # split image into (character, pixel row, pixel column, RGBA)
+        h, w = self.pixels.shape[:2]
+        cw, ch = int(w / self.map_width), int(h / self.map_height)
+        chars = self.pixels[:self.map_height * ch, :self.map_width * cw]
+        chars = chars.reshape(self.map_height, ch, self.map_width, cw, 4)
+        chars = chars.transpose(0, 2, 1, 3, 4).reshape(-1, ch, cw, 4)
+        self.char_masks = chars[:, :, :, 3] > 0
+        self.char_solid_pixels = self.char_masks.sum(axis=(1, 2))
+        self.char_coverage = self.char_solid_pixels / max(cw * ch, 1)
+        # average RGB of each char, with non-solid pixels counting as black
+        solid = self.char_masks[:, :, :, np.newaxis]
+        self.char_colors = (chars[:, :, :, :3] * solid).mean(axis=(1, 2)) / 255
+        # bounds of solid pixels: left, top, right, bottom (exclusive)
+        # empty characters get all zeroes
+        self.char_bounds = np.zeros((len(chars), 4), dtype=np.int32)
+        cols, rows = self.char_masks.any(axis=1), self.char_masks.any(axis=2)
+        not_empty = self.char_solid_pixels > 0
+        self.char_bounds[:, 0] = np.argmax(cols, axis=1)
+        self.char_bounds[:, 1] = np.argmax(rows, axis=1)
+        self.char_bounds[:, 2] = cw - np.argmax(cols[:, ::-1], axis=1)
+        self.char_bounds[:, 3] = ch - np.argmax(rows[:, ::-1], axis=1)
+        self.char_bounds[~not_empty] = 0
+    
+    def load_cached_image_data(self, cache_filename):
+        "Load processed image + char data from cache, return True on success."
+        if not os.path.exists(cache_filename):
+            return False
+        try:
+            data = np.load(cache_filename)
+            self.pixels = data['pixels']
+            n, ch, cw = data['mask_shape']
+            masks = np.unpackbits(data['char_masks'])[:n * ch * cw]
+            self.char_masks = masks.reshape(n, ch, cw).astype(bool)
+            self.char_solid_pixels = data['char_solid_pixels']
+            self.char_coverage = data['char_coverage']
+            self.char_colors = data['char_colors']
+            self.char_bounds = data['char_bounds']
+        except:
+            return False
+        return True
+    
+    def save_cached_image_data(self, cache_filename):
+        try:
+            if not os.path.exists(os.path.dirname(cache_filename)):
+                os.mkdir(os.path.dirname(cache_filename))
+            np.savez(cache_filename, pixels=self.pixels,
+                     mask_shape=np.array(self.char_masks.shape),
+                     char_masks=np.packbits(self.char_masks),
+                     char_solid_pixels=self.char_solid_pixels,
+                     char_coverage=self.char_coverage,
+                     char_colors=self.char_colors,
+                     char_bounds=self.char_bounds)
+            self.prune_cache(cache_filename)
+        except Exception as e:
+            self.app.log("Couldn't cache character set data %s: %s" % (cache_filename, e))
     
     def set_char_dimensions(self):
         # store character dimensions and UV size
@@ -157,35 +244,36 @@ class CharacterSet:
         self.app.log('  char map width/height is %s x %s' % (self.map_width, self.map_height))
         self.app.log('  last character index: %s' % self.last_index)
     
-    def has_updated(self):
-        "return True if source image file has changed since last check"
-        # tolerate bad filenames in data, don't check stamps on nonexistent ones
-        if not self.image_filename or not os.path.exists(self.filename) or \
-           not os.path.exists(self.image_filename):
-            return False
-        data_changed = os.path.getmtime(self.filename) > self.last_data_change
-        img_changed = os.path.getmtime(self.image_filename) > self.last_image_change
-        if data_changed:
-            self.last_data_change = time.time()
-        if img_changed:
-            self.last_image_change = time.time()
-        return data_changed or img_changed
-    
     def get_char_index(self, char):
         return self.char_mapping.get(char, 0)
     
+    def get_char_indices(self, text):
+        "Return array of character indices for given string, 0 if unmapped."
+        codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+        in_range = codes < len(self.char_lookup)
+        return np.where(in_range, self.char_lookup[np.where(in_range, codes, 0)], 0)
+    
+    def get_char_ink(self):
+        """
+        Return (coverage, color) arrays indexed by character: fraction of each
+        character's pixels that are solid, and average RGB of its pixels with
+        non-solid ones counting as black. Used for low detail rendering.
+        """
+        if self.char_ink is None:
+            self.char_ink = self.char_coverage, self.char_colors
+        return self.char_ink
+    
     def get_solid_pixels_in_char(self, char_index):
         "Returns # of solid pixels in character at given index"
-        tile_x = int(char_index % self.map_width)
-        tile_y = int(char_index / self.map_width)
-        x_start = self.char_width * tile_x
-        x_end = x_start + self.char_width
-        y_start = self.char_height * tile_y
-        y_end = y_start + self.char_height
-        pixels = 0
-        for x in range(x_start, x_end):
-            for y in range(y_start, y_end):
-                color = self.image_data.getpixel((x, y))
-                if color[3] > 0:
-                    pixels += 1
-        return pixels
+        return int(self.char_solid_pixels[char_index])
+    
+    def get_char_mask(self, char_index):
+        "Returns 2D bool array, True where character at given index is solid"
+        return self.char_masks[char_index]
+    
+    def get_char_bounds(self, char_index):
+        """
+        Returns (left, top, right, bottom) pixel bounds of solid pixels in
+        character at given index, right/bottom exclusive; all 0 if empty.
+        """
+        return tuple(int(i) for i in self.char_bounds[char_index])
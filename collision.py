@@ -1,4 +1,5 @@
-import math
+import math, random, time, hashlib
+import numpy as np
 from collections import namedtuple
 
 from renderable import TileRenderable
@@ -38,14 +39,34 @@ __pdoc__['Contact'] = "Represents a contact between two objects."
 ShapeOverlap = namedtuple('ShapeOverlap', ['x', 'y', 'dist', 'area', 'other'])
 __pdoc__['ShapeOverlap'] = "Represents a CollisionShape's overlap with another."
 
+CollisionStats = namedtuple('CollisionStats', ['passes', 'pairs_tested',
+                                               'overlaps_resolved', 'sleeping',
+                                               'time'])
+__pdoc__['CollisionStats'] = "Summary of CollisionLord's last update, time in ms."
+
+RaycastHit = namedtuple('RaycastHit', ['x', 'y', 'dist', 'shape', 'obj'])
+__pdoc__['RaycastHit'] = "Where a ray first enters a shape, and distance along ray."
+
 
 class CollisionShape:
     """
     Abstract class for a shape that can overlap and collide with other shapes.
     Shapes are part of a Collideable which in turn is part of a GameObject.
     """
+    sleeping = False
+    "If True, CollisionLord skips resolving this (dynamic) shape's overlaps"
+    still_ticks = 0
+    "Number of updates this shape has stayed in place"
+    still_x = still_y = None
+    """
+    Location shape has stayed within CollisionLord.sleep_epsilon of since
+    still_ticks started counting, None if it needs resetting
+    """
     def resolve_overlaps_with_shapes(self, shapes):
-        "Resolve this shape's overlap(s) with given list of shapes."
+        """
+        Resolve this shape's overlap(s) with given list of shapes.
+        Returns number of overlaps that pushed shapes apart.
+        """
         overlaps = []
         for other in shapes:
             if other is self:
@@ -53,24 +74,40 @@ class CollisionShape:
             overlap = self.get_overlap(other)
             if overlap.dist < 0:
                 overlaps.append(overlap)
+        return self.resolve_overlaps(overlaps)
+    
+    def resolve_overlaps(self, overlaps):
+        """
+        Resolve given list of this shape's (already found) ShapeOverlaps.
+        Returns number of overlaps that pushed shapes apart.
+        """
         if len(overlaps) == 0:
-            return
+            return 0
         # resolve collisions in order of largest -> smallest overlap
         overlaps.sort(key=lambda item: item.area, reverse=True)
+        resolved = 0
         for i,old_overlap in enumerate(overlaps):
             # resolve first overlap without recalculating
             overlap = self.get_overlap(old_overlap.other) if i > 0 else overlaps[0]
-            self.resolve_overlap(overlap)
+            if self.resolve_overlap(overlap):
+                resolved += 1
+        return resolved
     
     def resolve_overlap(self, overlap):
-        "Resolve this shape's given overlap."
+        """
+        Resolve this shape's given overlap.
+        Returns True if shapes were pushed apart.
+        """
         other = overlap.other
+        # anything touching a sleeping shape wakes it up
+        if other.sleeping:
+            self.go.world.cl.wake_shape(other)
         # tell objects they're overlapping, pass penetration vector
         a_coll_b, a_started_b = self.go.overlapped(other.go, overlap)
         b_coll_a, b_started_a = other.go.overlapped(self.go, overlap)
         # if either object says it shouldn't collide with other, don't
         if not a_coll_b or not b_coll_a:
-            return
+            return False
         # push shapes apart according to mass
         total_mass = max(0, self.go.mass) + max(0, other.go.mass)
         if self.go.is_dynamic():
@@ -97,32 +134,13 @@ class CollisionShape:
             world.try_object_method(self.go, self.go.started_colliding, [other.go])
         if b_started_a:
             world.try_object_method(other.go, other.go.started_colliding, [self.go])
+        # overlaps no longer shrink once they're near zero
+        return overlap.dist < -self.go.world.cl.resolved_epsilon
     
     def get_overlapping_static_shapes(self):
-        "Return a list of static shapes that overlap with this shape."
-        overlapping_shapes = []
-        shape_left, shape_top, shape_right, shape_bottom = self.get_box()
-        # add padding to overlapping tiles check
-        if False:
-            padding = 0.01
-            shape_left -= padding
-            shape_top -= padding
-            shape_right += padding
-            shape_bottom += padding
-        for obj in self.go.world.objects.values():
-            if obj is self.go or not obj.should_collide() or obj.is_dynamic():
-                continue
-            # always check non-tile-based static shapes
-            if obj.collision_shape_type != CST_TILE:
-                overlapping_shapes += obj.collision.shapes
-            else:
-                # skip if even bounds don't overlap
-                obj_left, obj_top, obj_right, obj_bottom = obj.get_edges()
-                if not boxes_overlap(shape_left, shape_top, shape_right, shape_bottom,
-                                     obj_left, obj_top, obj_right, obj_bottom):
-                    continue
-                overlapping_shapes += obj.collision.get_shapes_overlapping_box(shape_left, shape_top, shape_right, shape_bottom)
-        return overlapping_shapes
+        "Return a list of static shapes that might overlap with this shape."
+        return self.go.world.cl.get_static_shapes_in_box(*self.get_box(),
+                                                         exclude_object=self.go)
 
 
 class CircleCollisionShape(CollisionShape):
@@ -144,6 +162,32 @@ class CircleCollisionShape(CollisionShape):
         "Return True if this circle overlaps given line segment."
         return circle_overlaps_line(self.x, self.y, self.radius, x1, y1, x2, y2)
     
+    def get_array_row(self):
+        "Return this shape's values for CollisionLord.get_shape_arrays."
+        return CST_CIRCLE, self.x, self.y, self.radius, self.radius, self.radius
+    
+    def get_ray_time(self, x, y, dx, dy):
+        """
+        Return time (0-1) at which ray from given point along given vector
+        enters this shape, 0 if it starts inside, or None if it misses.
+        """
+        if self.is_point_inside(x, y):
+            return 0
+        return circle_sweep_time(x, y, dx, dy, self.x, self.y, self.radius)
+    
+    def get_sweep_time(self, other, dx, dy, epsilon=0):
+        """
+        Return time (0-1) at which this shape moving by given vector first
+        touches given other, or None if it doesn't or is already touching.
+        """
+        if type(other) is CircleCollisionShape:
+            return circle_sweep_time(self.x, self.y, dx, dy, other.x, other.y,
+                                     self.radius + other.radius, epsilon)
+        elif type(other) is AABBCollisionShape:
+            return circle_box_sweep_time(self.x, self.y, dx, dy, self.radius,
+                                         other.x, other.y, other.halfwidth,
+                                         other.halfheight, epsilon)
+    
     def get_overlap(self, other):
         "Return ShapeOverlap data for this shape's overlap with given other."
         if type(other) is CircleCollisionShape:
@@ -180,6 +224,35 @@ class AABBCollisionShape(CollisionShape):
         left, top, right, bottom = self.get_box()
         return box_overlaps_line(left, top, right, bottom, x1, y1, x2, y2)
     
+    def get_array_row(self):
+        "Return this shape's values for CollisionLord.get_shape_arrays."
+        return CST_AABB, self.x, self.y, 0., self.halfwidth, self.halfheight
+    
+    def get_ray_time(self, x, y, dx, dy):
+        """
+        Return time (0-1) at which ray from given point along given vector
+        enters this shape, 0 if it starts inside, or None if it misses.
+        """
+        t = box_entry_time(x, y, dx, dy, self.x, self.y,
+                           self.halfwidth, self.halfheight)
+        return None if t is None else max(0, t)
+    
+    def get_sweep_time(self, other, dx, dy, epsilon=0):
+        """
+        Return time (0-1) at which this shape moving by given vector first
+        touches given other, or None if it doesn't or is already touching.
+        """
+        if type(other) is AABBCollisionShape:
+            return box_sweep_time(self.x, self.y, dx, dy, other.x, other.y,
+                                  self.halfwidth + other.halfwidth,
+                                  self.halfheight + other.halfheight, epsilon)
+        elif type(other) is CircleCollisionShape:
+            # same as circle moving the opposite way
+            return circle_box_sweep_time(other.x, other.y, -dx, -dy,
+                                         other.radius, self.x, self.y,
+                                         self.halfwidth, self.halfheight,
+                                         epsilon)
+    
     def get_overlap(self, other):
         "Return ShapeOverlap data for this shape's overlap with given other."
         if type(other) is AABBCollisionShape:
@@ -198,6 +271,56 @@ class AABBCollisionShape(CollisionShape):
         return ShapeOverlap(x=px, y=py, dist=pdist1, area=area, other=other)
 
 
+class CollisionFilter:
+    """
+    Which objects CollisionLord queries return: include/exclude lists of
+    object names, class names and collision types (CT_*), resolved into sets
+    once. Includes are processed before excludes. Non-colliding objects are
+    never returned. Build once and reuse for queries made every update.
+    """
+    def __init__(self, world, include_object_names=[], include_class_names=[],
+                 exclude_object_names=[], exclude_class_names=[],
+                 include_collision_types=[], exclude_collision_types=[]):
+        self.include_names = set(include_object_names)
+        self.exclude_names = set(exclude_object_names)
+        self.include_types = set(include_collision_types)
+        self.exclude_types = set(exclude_collision_types)
+        def get_classes(class_names):
+            classes = [world.get_class_by_name(name) for name in class_names]
+            return tuple([c for c in classes if c])
+        self.include_classes = get_classes(include_class_names)
+        # if no given class names exist, nothing can pass
+        self.include_nothing = len(include_class_names) > 0 and \
+            len(self.include_classes) == 0
+        self.exclude_classes = get_classes(exclude_class_names)
+        self.check_classes = len(self.include_classes + self.exclude_classes) > 0
+        # class filter results by object class
+        self.class_results = {}
+    
+    def allows(self, obj):
+        "Return True if given object passes this filter."
+        if self.include_nothing or not obj.should_collide():
+            return False
+        if self.include_names and not obj.name in self.include_names:
+            return False
+        if obj.name in self.exclude_names:
+            return False
+        if self.include_types and not obj.collision_type in self.include_types:
+            return False
+        if obj.collision_type in self.exclude_types:
+            return False
+        if not self.check_classes:
+            return True
+        obj_class = type(obj)
+        result = self.class_results.get(obj_class, None)
+        if result is None:
+            result = not self.include_classes or issubclass(obj_class, self.include_classes)
+            if self.exclude_classes and issubclass(obj_class, self.exclude_classes):
+                result = False
+            self.class_results[obj_class] = result
+        return result
+
+
 class Collideable:
     "Collision component for GameObjects. Contains a list of shapes."
     use_art_offset = False
@@ -228,9 +351,38 @@ class Collideable:
         elif self.go.collision_shape_type == CST_TILE:
             self.tile_shapes.clear()
             self._create_merged_tile_boxes()
-        # update renderables once if static
-        if not self.go.is_dynamic():
-            self.update_renderables()
+    
+    def remove_shapes(self):
+        "Remove our shapes from CollisionLord, eg while pooled."
+        for shape in self.shapes:
+            self.cl._remove_shape(shape)
+        self.contacts = {}
+    
+    def restore_shapes(self):
+        "Create shapes again after remove_shapes, at game object's location."
+        self.renderables, self.shapes = [], []
+        self.create_shapes()
+    
+    def get_renderables(self):
+        """
+        Return debug renderables for our shapes, creating them if needed:
+        they're only created once collision viz is first shown.
+        """
+        if len(self.renderables) == len(self.shapes):
+            return self.renderables
+        if self.go.collision_shape_type == CST_CIRCLE:
+            renderable_class = CircleCollisionRenderable
+        elif self.go.collision_shape_type == CST_TILE:
+            renderable_class = TileBoxCollisionRenderable
+        else:
+            renderable_class = BoxCollisionRenderable
+        self.renderables = []
+        for shape in self.shapes:
+            r = renderable_class(shape)
+            # update renderable once to set location correctly
+            r.update()
+            self.renderables.append(r)
+        return self.renderables
     
     def _clear_shapes(self):
         for r in self.renderables:
@@ -246,7 +398,6 @@ class Collideable:
         y = self.go.y + self.go.col_offset_y
         shape = self.cl._add_circle_shape(x, y, self.go.col_radius, self.go)
         self.shapes = [shape]
-        self.renderables = [CircleCollisionRenderable(shape)]
     
     def _create_box(self):
         x = self.go.x # + self.go.col_offset_x
@@ -256,7 +407,6 @@ class Collideable:
                                       self.go.col_height / 2,
                                       self.go)
         self.shapes = [shape]
-        self.renderables = [BoxCollisionRenderable(shape)]
     
     def _create_merged_tile_boxes(self):
         "Create AABB shapes for a CST_TILE object"
@@ -266,52 +416,28 @@ class Collideable:
             self.go.app.dev_log("%s: Couldn't find collision layer with name '%s'" % (self.go.name, self.go.col_layer_name))
             return
         layer = self.go.art.layer_names.index(self.go.col_layer_name)
-        # tile is available if it's not empty and not already covered by a shape
-        def tile_available(tile_x, tile_y):
-            return self.go.art.get_char_index_at(frame, layer, tile_x, tile_y) != 0 and not (tile_x, tile_y) in self.tile_shapes
-        def tile_range_available(start_x, end_x, start_y, end_y):
-            for y in range(start_y, end_y + 1):
-                for x in range(start_x, end_x + 1):
-                    if not tile_available(x, y):
-                        return False
-            return True
-        for y in range(self.go.art.height):
-            for x in range(self.go.art.width):
-                if not tile_available(x, y):
-                    continue
-                # determine how big we can make this box
-                # first fill left to right
-                end_x = x
-                while end_x < self.go.art.width - 1 and tile_available(end_x + 1, y):
-                    end_x += 1
-                # then fill top to bottom
-                end_y = y
-                while end_y < self.go.art.height - 1 and tile_range_available(x, end_x, y, end_y + 1):
-                    end_y += 1
-                # compute origin and halfsizes of box covering tile range
-                wx1, wy1 = self.go.get_tile_loc(x, y, tile_center=True)
-                wx2, wy2 = self.go.get_tile_loc(end_x, end_y, tile_center=True)
-                wx = (wx1 + wx2) / 2
-                halfwidth = (end_x - x) * self.go.art.quad_width
-                halfwidth /= 2
-                halfwidth += self.go.art.quad_width / 2
-                wy = (wy1 + wy2) / 2
-                halfheight = (end_y - y) * self.go.art.quad_height
-                halfheight /= 2
-                halfheight += self.go.art.quad_height / 2
-                shape = self.cl._add_box_shape(wx, wy, halfwidth, halfheight,
-                                               self.go)
-                # fill in cell(s) in our tile collision dict,
-                # write list of tiles shape covers to shape.tiles
-                for tile_y in range(y, end_y + 1):
-                    for tile_x in range(x, end_x + 1):
-                        self.tile_shapes[(tile_x, tile_y)] = shape
-                        shape.tiles.append((tile_x, tile_y))
-                r = TileBoxCollisionRenderable(shape)
-                # update renderable once to set location correctly
-                r.update()
-                self.shapes.append(shape)
-                self.renderables.append(r)
+        for x, y, end_x, end_y in self.cl.get_tile_box_ranges(self.go.art,
+                                                              frame, layer):
+            # compute origin and halfsizes of box covering tile range
+            wx1, wy1 = self.go.get_tile_loc(x, y, tile_center=True)
+            wx2, wy2 = self.go.get_tile_loc(end_x, end_y, tile_center=True)
+            wx = (wx1 + wx2) / 2
+            halfwidth = (end_x - x) * self.go.art.quad_width
+            halfwidth /= 2
+            halfwidth += self.go.art.quad_width / 2
+            wy = (wy1 + wy2) / 2
+            halfheight = (end_y - y) * self.go.art.quad_height
+            halfheight /= 2
+            halfheight += self.go.art.quad_height / 2
+            shape = self.cl._add_box_shape(wx, wy, halfwidth, halfheight,
+                                           self.go)
+            # fill in cell(s) in our tile collision dict,
+            # write list of tiles shape covers to shape.tiles
+            for tile_y in range(y, end_y + 1):
+                for tile_x in range(x, end_x + 1):
+                    self.tile_shapes[(tile_x, tile_y)] = shape
+                    shape.tiles.append((tile_x, tile_y))
+            self.shapes.append(shape)
     
     def get_shape_overlapping_point(self, x, y):
         "Return shape if it's overlapping given point, None if no overlap."
@@ -341,6 +467,7 @@ class Collideable:
         for shape in self.shapes:
             shape.x = obj.x + obj.col_offset_x
             shape.y = obj.y + obj.col_offset_y
+            self.cl.shape_moved(shape)
     
     def set_shape_color(self, shape, new_color):
         "Set the color of a given shape's debug LineRenderable."
@@ -348,16 +475,17 @@ class Collideable:
             shape_index = self.shapes.index(shape)
         except ValueError:
             return
-        self.renderables[shape_index].color = new_color
-        self.renderables[shape_index].build_geo()
-        self.renderables[shape_index].rebind_buffers()
+        r = self.get_renderables()[shape_index]
+        r.color = new_color
+        r.build_geo()
+        r.rebind_buffers()
     
     def update_renderables(self):
-        for r in self.renderables:
+        for r in self.get_renderables():
             r.update()
     
     def render(self):
-        for r in self.renderables:
+        for r in self.get_renderables():
             r.render()
     
     def destroy(self):
@@ -368,6 +496,79 @@ class Collideable:
             self.cl._remove_shape(shape)
 
 
+class SpatialHash:
+    """
+    Uniform grid that files shapes under every cell their bounds touch, so
+    shapes that might overlap a given box can be found without testing
+    every shape (ie a broadphase).
+    """
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        "Dict of shape lists by (x, y) cell coordinates"
+        self.shape_cells = {}
+        "Dict of (left, bottom, right, top) cell range covered, by shape"
+    
+    def get_cell_range(self, left, top, right, bottom):
+        "Return (left, bottom, right, top) range of cells given box touches."
+        size = self.cell_size
+        # shapes' get_box returns top and bottom in either order
+        if top < bottom:
+            top, bottom = bottom, top
+        return (math.floor(left / size), math.floor(bottom / size),
+                math.floor(right / size), math.floor(top / size))
+    
+    def insert(self, shape):
+        cell_range = self.get_cell_range(*shape.get_box())
+        self.shape_cells[shape] = cell_range
+        left, bottom, right, top = cell_range
+        for y in range(bottom, top + 1):
+            for x in range(left, right + 1):
+                self.cells.setdefault((x, y), []).append(shape)
+    
+    def remove(self, shape):
+        cell_range = self.shape_cells.pop(shape, None)
+        if not cell_range:
+            return
+        left, bottom, right, top = cell_range
+        for y in range(bottom, top + 1):
+            for x in range(left, right + 1):
+                cell = self.cells[(x, y)]
+                cell.remove(shape)
+                if len(cell) == 0:
+                    self.cells.pop((x, y))
+    
+    def get_shape_cells(self, shape):
+        "Return list of (x, y) cells given shape is filed under."
+        cell_range = self.shape_cells.get(shape)
+        if not cell_range:
+            return []
+        left, bottom, right, top = cell_range
+        return [(x, y) for y in range(bottom, top + 1)
+                for x in range(left, right + 1)]
+    
+    def update(self, shape):
+        "Re-file given shape if it's moved into a different set of cells."
+        if self.get_cell_range(*shape.get_box()) == self.shape_cells.get(shape):
+            return
+        self.remove(shape)
+        self.insert(shape)
+    
+    def query(self, left, top, right, bottom):
+        "Return list of shapes filed in any cell given box touches."
+        # dict rather than set to keep results in a stable order
+        shapes = {}
+        cell_left, cell_bottom, cell_right, cell_top = self.get_cell_range(left, top, right, bottom)
+        for y in range(cell_bottom, cell_top + 1):
+            for x in range(cell_left, cell_right + 1):
+                for shape in self.cells.get((x, y), ()):
+                    shapes[shape] = True
+        return list(shapes)
+    
+    def clear(self):
+        self.cells, self.shape_cells = {}, {}
+
+
 class CollisionLord:
     """
     Collision manager object, tracks Collideables, detects overlaps and
@@ -378,11 +579,43 @@ class CollisionLord:
     Number of times to resolve collisions per update. Lower at own risk;
     multi-object collisions require multiple iterations to settle correctly.
     """
+    cell_size = 4.
+    """
+    Size of broadphase grid cells, in world units. Works best a bit larger
+    than a typical dynamic shape.
+    """
+    use_broadphase = True
+    "If False, test every dynamic shape against every other shape"
+    resolved_epsilon = 0.0001
+    "Overlaps shallower than this don't count as resolved, for early exit"
+    use_sleeping = True
+    "If True, skip dynamic shapes that have stayed in place for a while"
+    sleep_epsilon = 0.001
+    "Distance a shape can move per update and still be considered still"
+    sleep_ticks = 30
+    "Number of updates a shape must stay still before it sleeps"
+    use_batch_narrowphase = True
+    """
+    If True, test all candidate pairs' overlaps at once in numpy arrays at
+    the start of each pass; only overlapping pairs are handled in Python.
+    """
+    min_batch_shapes = 16
+    "Below this many colliding dynamic shapes, test pairs one at a time"
+    sweep_skin = 0.01
+    """
+    Distance past first contact that swept (fast moving) objects are stopped,
+    so update() still resolves and reports the collision.
+    """
     def __init__(self, world):
         self.world = world
         self.ticks = 0
         # list of objects processed for collision this frame
         self.collisions_this_frame = []
+        self.stats = CollisionStats(0, 0, 0, 0, 0)
+        "CollisionStats for last update"
+        # tile box ranges by collision layer contents, kept across resets
+        # so reloaded states and respawned level geometry don't recompute
+        self.tile_box_cache = {}
         self.reset()
     
     def report(self):
@@ -392,47 +625,608 @@ class CollisionLord:
     
     def reset(self):
         self.dynamic_shapes, self.static_shapes = [], []
+        # dynamic shapes are re-filed as they move; static shapes only when
+        # their objects are created, destroyed or explicitly moved
+        self.dynamic_hash = SpatialHash(self.cell_size)
+        self.static_hash = SpatialHash(self.cell_size)
+        # dynamic shapes colliding this update, and those of them awake
+        self.valid_shapes, self.awake_shapes = {}, []
+        # (kind, x, y, radius, halfwidth, halfheight) arrays of all static
+        # shapes, rebuilt when they change
+        self.static_arrays = None
+        # same for colliding dynamic shapes, mirrored each pass
+        self.dynamic_arrays = None
+        # shapes, and each hash's cells, that changed since batched overlap
+        # tests; None outside of a pass
+        self.moved_shapes, self.moved_cells = None, None
     
-    def _add_circle_shape(self, x, y, radius, game_object):
-        shape = CircleCollisionShape(x, y, radius, game_object)
+    def _add_shape(self, shape, game_object):
         if game_object.is_dynamic():
             self.dynamic_shapes.append(shape)
+            self.dynamic_hash.insert(shape)
         else:
             self.static_shapes.append(shape)
+            self.static_hash.insert(shape)
+            self.static_arrays = None
+            self.mark_shape_moved(shape, self.static_hash)
         return shape
     
+    def _add_circle_shape(self, x, y, radius, game_object):
+        shape = CircleCollisionShape(x, y, radius, game_object)
+        return self._add_shape(shape, game_object)
+    
     def _add_box_shape(self, x, y, halfwidth, halfheight, game_object):
         shape = AABBCollisionShape(x, y, halfwidth, halfheight, game_object)
-        if game_object.is_dynamic():
-            self.dynamic_shapes.append(shape)
-        else:
-            self.static_shapes.append(shape)
-        return shape
+        return self._add_shape(shape, game_object)
     
     def _remove_shape(self, shape):
         if shape in self.dynamic_shapes:
+            self.mark_shape_moved(shape, self.dynamic_hash)
+            self.wake_shapes_near(shape, self.dynamic_hash)
             self.dynamic_shapes.remove(shape)
+            self.dynamic_hash.remove(shape)
+            # shape may be removed mid-update, eg by a collision callback
+            self.valid_shapes.pop(shape, None)
         elif shape in self.static_shapes:
+            self.mark_shape_moved(shape, self.static_hash)
+            self.wake_shapes_near(shape, self.static_hash)
             self.static_shapes.remove(shape)
+            self.static_hash.remove(shape)
+            self.static_arrays = None
+    
+    def shape_moved(self, shape):
+        "Update broadphase for given shape's new location and/or size."
+        if shape in self.dynamic_hash.shape_cells:
+            # cells shape left and entered both need retesting
+            self.mark_shape_moved(shape, self.dynamic_hash)
+            self.dynamic_hash.update(shape)
+            self.mark_shape_moved(shape, self.dynamic_hash)
+            if shape.sleeping and self.is_shape_moved(shape):
+                self.wake_shape(shape)
+        elif shape in self.static_hash.shape_cells:
+            # wake anything a moving static shape might have been or now
+            # be touching
+            self.mark_shape_moved(shape, self.static_hash)
+            self.wake_shapes_near(shape, self.static_hash)
+            self.static_hash.update(shape)
+            self.mark_shape_moved(shape, self.static_hash)
+            self.wake_shapes_near(shape, self.static_hash)
+            self.static_arrays = None
+    
+    def mark_shape_moved(self, shape, spatial_hash):
+        "Note that batched overlap results near given shape are out of date."
+        if self.moved_shapes is None:
+            return
+        self.moved_shapes[shape] = True
+        self.moved_cells[spatial_hash].update(spatial_hash.get_shape_cells(shape))
+    
+    def is_shape_region_moved(self, shape, spatial_hash):
+        """
+        Return True if given dynamic shape, or any shape near it in given
+        hash, has moved since batched overlap tests.
+        """
+        if shape in self.moved_shapes:
+            return True
+        moved_cells = self.moved_cells[spatial_hash]
+        if len(moved_cells) == 0:
+            return False
+        # without broadphase every shape is a candidate for every other
+        if not self.use_broadphase:
+            return True
+        # both hashes use the same grid
+        left, bottom, right, top = self.dynamic_hash.shape_cells[shape]
+        for y in range(bottom, top + 1):
+            for x in range(left, right + 1):
+                if (x, y) in moved_cells:
+                    return True
+        return False
+    
+    def is_shape_moved(self, shape):
+        """
+        Return True if given shape has moved away from where it started
+        staying still. Measuring from there rather than from last update
+        catches shapes creeping slower than sleep_epsilon per update.
+        """
+        if shape.still_x is None:
+            return True
+        return abs(shape.x - shape.still_x) > self.sleep_epsilon or \
+            abs(shape.y - shape.still_y) > self.sleep_epsilon
+    
+    def wake_shape(self, shape):
+        "Stop given dynamic shape sleeping, resolve its overlaps again."
+        shape.still_ticks = 0
+        shape.still_x = shape.still_y = None
+        if not shape.sleeping:
+            return
+        shape.sleeping = False
+        # shapes woken mid-update get resolved in remaining passes
+        if shape in self.valid_shapes:
+            self.awake_shapes.append(shape)
+    
+    def wake_shapes_near(self, shape, spatial_hash):
+        """
+        Wake every dynamic shape in the cells given shape is filed under in
+        given hash, eg before it moves away or is removed, so they notice.
+        """
+        # both hashes use the same grid
+        for cell in spatial_hash.get_shape_cells(shape):
+            for other in self.dynamic_hash.cells.get(cell, ()):
+                if other is not shape:
+                    self.wake_shape(other)
+    
+    def is_object_still(self, obj):
+        "Return True if given object is static, or all its shapes are asleep."
+        if not obj.is_dynamic():
+            return True
+        return all(shape.sleeping and shape in self.valid_shapes
+                   for shape in obj.collision.shapes)
+    
+    def refresh_sleeping_contacts(self, obj):
+        """
+        Keep given object's contacts with other still objects going, on both
+        sides: nothing rechecks overlaps between shapes that don't move.
+        Contacts with moving objects are left to their own overlap checks.
+        """
+        contacts = obj.collision.contacts
+        for obj_name,contact in contacts.items():
+            other = self.world.objects.get(obj_name, None)
+            if not other or not self.is_object_still(other):
+                continue
+            contacts[obj_name] = contact._replace(timestamp=self.ticks)
+            other_contact = other.collision.contacts.get(obj.name, None)
+            if other_contact:
+                other.collision.contacts[obj.name] = other_contact._replace(timestamp=self.ticks)
+    
+    def update_sleeping(self, shape):
+        "Put given shape to sleep if it's stayed still long enough."
+        if not self.use_sleeping or self.is_shape_moved(shape):
+            shape.still_ticks = 0
+            shape.sleeping = False
+            # start counting still updates from here
+            shape.still_x, shape.still_y = shape.x, shape.y
+            return
+        shape.still_ticks += 1
+        if shape.still_ticks >= self.sleep_ticks:
+            shape.sleeping = True
+    
+    def get_static_shapes_in_box(self, left, top, right, bottom,
+                                 exclude_object=None):
+        """
+        Return list of collideable static shapes that might overlap given box,
+        except those belonging to given object.
+        """
+        if not self.use_broadphase:
+            return self._get_all_static_shapes_in_box(left, top, right, bottom,
+                                                      exclude_object)
+        shapes = []
+        for shape in self.static_hash.query(left, top, right, bottom):
+            obj = shape.go
+            if obj is exclude_object or not obj.should_collide() or obj.is_dynamic():
+                continue
+            shapes.append(shape)
+        return shapes
+    
+    def _get_all_static_shapes_in_box(self, left, top, right, bottom,
+                                      exclude_object):
+        "Brute force version of get_static_shapes_in_box, checks every object."
+        shapes = []
+        for obj in self.world.objects.values():
+            if obj is exclude_object or not obj.should_collide() or obj.is_dynamic():
+                continue
+            # always check non-tile-based static shapes
+            if obj.collision_shape_type != CST_TILE:
+                shapes += obj.collision.shapes
+            else:
+                # skip if even bounds don't overlap
+                obj_left, obj_top, obj_right, obj_bottom = obj.get_edges()
+                if not boxes_overlap(left, top, right, bottom,
+                                     obj_left, obj_top, obj_right, obj_bottom):
+                    continue
+                shapes += obj.collision.get_shapes_overlapping_box(left, top, right, bottom)
+        return shapes
+    
+    def get_dynamic_shapes_in_box(self, left, top, right, bottom, valid_shapes):
+        "Return list of shapes in given set that might overlap given box."
+        if not self.use_broadphase:
+            return list(valid_shapes)
+        return [shape for shape in self.dynamic_hash.query(left, top, right, bottom)
+                if shape in valid_shapes]
+    
+    def get_dynamic_candidates(self, shape):
+        "Return list of other colliding dynamic shapes that might overlap given shape."
+        return [other for other in self.get_dynamic_shapes_in_box(*shape.get_box(),
+                                                                  self.valid_shapes)
+                if other is not shape]
+    
+    def get_static_candidates(self, shape):
+        "Return list of static shapes that might overlap given dynamic shape."
+        return shape.get_overlapping_static_shapes()
+    
+    def get_tile_box_ranges(self, art, frame, layer):
+        """
+        Return list of (x, y, end_x, end_y) tile ranges of boxes covering
+        given Art layer's non-blank tiles, cached by layer contents.
+        """
+        mask = art.chars[frame][layer][:, :, 0] != 0
+        key = (mask.shape, hashlib.sha1(np.packbits(mask)).digest())
+        ranges = self.tile_box_cache.get(key, None)
+        if ranges is None:
+            ranges = get_tile_box_ranges(mask)
+            self.tile_box_cache[key] = ranges
+        return ranges
+    
+    def can_sweep_hit(self, obj, other):
+        "Return True if given object sweeping its shapes can hit given other."
+        return other is not obj and other.should_collide() and \
+            obj.can_collide_with(other) and other.can_collide_with(obj)
+    
+    def walk_hash_cells(self, spatial_hash, x, y, dx, dy, halfwidth=0,
+                        halfheight=0):
+        """
+        Yield (time 0-1, list of shapes) for given hash's cells along move of
+        box with given center and half size by given vector, nearest first.
+        Shapes in several cells are yielded more than once.
+        """
+        size = self.cell_size
+        for entry_time, cells in sweep_grid(x / size, y / size,
+                                            dx / size, dy / size,
+                                            halfwidth / size, halfheight / size):
+            shapes = []
+            for cell in cells:
+                shapes += spatial_hash.cells.get(cell, ())
+            yield entry_time, shapes
+    
+    def walk_tile_cells(self, obj, x, y, dx, dy, halfwidth=0, halfheight=0):
+        """
+        Like walk_hash_cells, but through given CST_TILE object's tile grid,
+        yielding the shapes of its non-blank tiles.
+        """
+        obj_left, obj_top, obj_right, obj_bottom = obj.get_edges()
+        # tile grid runs left to right, top to bottom
+        tile_width, tile_height = obj.art.quad_width, obj.art.quad_height
+        tile_shapes = obj.collision.tile_shapes
+        for entry_time, cells in sweep_grid((x - obj_left) / tile_width,
+                                            (obj_top - y) / tile_height,
+                                            dx / tile_width, -dy / tile_height,
+                                            halfwidth / tile_width,
+                                            halfheight / tile_height):
+            yield entry_time, [tile_shapes[cell] for cell in cells
+                               if cell in tile_shapes]
+    
+    def sweep_shape(self, shape, dx, dy):
+        """
+        Return (time 0-1, other shape) for first shape given shape hits moving
+        by given vector from where it is now, or (None, None) if it hits
+        nothing. Shapes it's already touching are left for update() to resolve.
+        """
+        left, bottom, right, top = shape.get_box()
+        halfwidth, halfheight = (right - left) / 2, abs(top - bottom) / 2
+        hit_time, hit_shape = None, None
+        tested, tile_objects = set(), {}
+        for spatial_hash in [self.dynamic_hash, self.static_hash]:
+            for entry_time, others in self.walk_hash_cells(spatial_hash,
+                                                           shape.x, shape.y,
+                                                           dx, dy, halfwidth,
+                                                           halfheight):
+                if hit_time is not None and entry_time > hit_time:
+                    break
+                for other in others:
+                    # tile grids get their own, finer walk below
+                    if other.go.collision_shape_type == CST_TILE:
+                        tile_objects[other.go] = True
+                        continue
+                    if other in tested:
+                        continue
+                    tested.add(other)
+                    if not self.can_sweep_hit(shape.go, other.go):
+                        continue
+                    t = shape.get_sweep_time(other, dx, dy, self.resolved_epsilon)
+                    if t is not None and (hit_time is None or t < hit_time):
+                        hit_time, hit_shape = t, other
+        for obj in tile_objects:
+            if not self.can_sweep_hit(shape.go, obj):
+                continue
+            for entry_time, others in self.walk_tile_cells(obj, shape.x, shape.y,
+                                                           dx, dy, halfwidth,
+                                                           halfheight):
+                if hit_time is not None and entry_time > hit_time:
+                    break
+                for other in others:
+                    if other in tested:
+                        continue
+                    tested.add(other)
+                    t = shape.get_sweep_time(other, dx, dy, self.resolved_epsilon)
+                    if t is not None and (hit_time is None or t < hit_time):
+                        hit_time, hit_shape = t, other
+        return hit_time, hit_shape
+    
+    def sweep_object(self, obj, dx, dy):
+        """
+        Return (time 0-1, other shape) for first shape any of given object's
+        shapes hits moving by given vector, or (None, None).
+        """
+        hit_time, hit_shape = None, None
+        for shape in obj.collision.shapes:
+            t, other = self.sweep_shape(shape, dx, dy)
+            if t is not None and (hit_time is None or t < hit_time):
+                hit_time, hit_shape = t, other
+        return hit_time, hit_shape
+    
+    def get_query_candidates(self, left, top, right, bottom, collision_filter):
+        "Return list of shapes that might overlap given box and pass given filter."
+        shapes = self.dynamic_hash.query(left, top, right, bottom)
+        shapes += self.static_hash.query(left, top, right, bottom)
+        if collision_filter:
+            return [shape for shape in shapes if collision_filter.allows(shape.go)]
+        return [shape for shape in shapes if shape.go.should_collide()]
+    
+    def sort_by_distance(self, shapes, x, y):
+        "Sort given list of shapes by distance of their centers from given point."
+        shapes.sort(key=lambda shape: (shape.x - x) ** 2 + (shape.y - y) ** 2)
+        return shapes
+    
+    def get_shapes_at_point(self, x, y, collision_filter=None):
+        "Return list of colliding shapes given point is inside, nearest first."
+        shapes = [shape for shape in self.get_query_candidates(x, y, x, y,
+                                                               collision_filter)
+                  if shape.is_point_inside(x, y)]
+        return self.sort_by_distance(shapes, x, y)
+    
+    def get_shapes_in_box(self, left, top, right, bottom, collision_filter=None):
+        "Return list of colliding shapes overlapping given box, nearest first."
+        x, y = (left + right) / 2, (top + bottom) / 2
+        box = AABBCollisionShape(x, y, abs(right - left) / 2,
+                                 abs(top - bottom) / 2, None)
+        shapes = [shape for shape in self.get_query_candidates(left, top, right,
+                                                               bottom,
+                                                               collision_filter)
+                  if box.get_overlap(shape).dist <= 0]
+        return self.sort_by_distance(shapes, x, y)
+    
+    def get_shapes_in_circle(self, x, y, radius, collision_filter=None):
+        "Return list of colliding shapes overlapping given circle, nearest first."
+        circle = CircleCollisionShape(x, y, radius, None)
+        shapes = [shape for shape in self.get_query_candidates(*circle.get_box(),
+                                                               collision_filter)
+                  if circle.get_overlap(shape).dist <= 0]
+        return self.sort_by_distance(shapes, x, y)
+    
+    def raycast(self, x1, y1, x2, y2, collision_filter=None,
+                ignore_objects=[], first_hit_only=False):
+        """
+        Return list of RaycastHits for colliding shapes the line from x1,y1 to
+        x2,y2 passes through, nearest first, except given objects'. Walks the
+        broadphase grid and tile collision grids along the line, so with
+        first_hit_only only shapes near the nearest hit are tested.
+        """
+        dx, dy = x2 - x1, y2 - y1
+        # shape: time ray enters it
+        hits = {}
+        nearest = None
+        tested, tile_objects = set(), {}
+        def allows(obj):
+            if obj in ignore_objects:
+                return False
+            if collision_filter:
+                return collision_filter.allows(obj)
+            return obj.should_collide()
+        def walk(cells, tiles=False):
+            nonlocal nearest
+            for entry_time, shapes in cells:
+                if first_hit_only and nearest is not None and entry_time > nearest:
+                    break
+                for shape in shapes:
+                    # tile grids get their own, finer walk
+                    if not tiles and shape.go.collision_shape_type == CST_TILE:
+                        tile_objects[shape.go] = True
+                        continue
+                    if shape in tested:
+                        continue
+                    tested.add(shape)
+                    if not allows(shape.go):
+                        continue
+                    t = shape.get_ray_time(x1, y1, dx, dy)
+                    if t is None:
+                        continue
+                    hits[shape] = t
+                    if nearest is None or t < nearest:
+                        nearest = t
+        for spatial_hash in [self.dynamic_hash, self.static_hash]:
+            walk(self.walk_hash_cells(spatial_hash, x1, y1, dx, dy))
+        for obj in tile_objects:
+            if allows(obj):
+                walk(self.walk_tile_cells(obj, x1, y1, dx, dy), True)
+        length = math.sqrt(dx * dx + dy * dy)
+        results = []
+        for shape, t in sorted(hits.items(), key=lambda item: item[1]):
+            results.append(RaycastHit(x=x1 + dx * t, y=y1 + dy * t,
+                                      dist=length * t, shape=shape,
+                                      obj=shape.go))
+        return results[:1] if first_hit_only else results
+    
+    def has_line_of_sight(self, x1, y1, x2, y2, collision_filter=None,
+                          ignore_objects=[]):
+        """
+        Return True if no colliding shapes (except given objects') lie on the
+        line from x1,y1 to x2,y2. Stops at the first shape found.
+        """
+        return len(self.raycast(x1, y1, x2, y2, collision_filter,
+                                ignore_objects, True)) == 0
+    
+    def get_shape_arrays(self, shapes):
+        """
+        Return (kind, x, y, radius, halfwidth, halfheight) arrays of given
+        shapes' current values, and set each shape's array_index into them.
+        """
+        for i,shape in enumerate(shapes):
+            shape.array_index = i
+        rows = np.array([shape.get_array_row() for shape in shapes],
+                        dtype=np.float64).reshape(-1, 6)
+        return tuple(rows.T)
+    
+    def get_batch_overlaps(self, shapes, get_candidates, arrays, other_arrays):
+        """
+        Test given dynamic shapes against candidates returned by given
+        function all at once, using given arrays for shapes and candidates.
+        Returns dict of overlap lists (in candidate order) by shape, and
+        number of pairs tested.
+        """
+        candidates = [get_candidates(shape) for shape in shapes]
+        counts = [len(others) for others in candidates]
+        others = [other for shape_others in candidates for other in shape_others]
+        owners = np.repeat(np.arange(len(shapes)), counts)
+        a_indices = np.array([shape.array_index for shape in shapes], dtype=int)[owners]
+        b_indices = np.array([other.array_index for other in others], dtype=int)
+        px, py, dist, area = get_overlaps_batch(
+            [column[a_indices] for column in arrays],
+            [column[b_indices] for column in other_arrays])
+        batch = {shape: [] for shape in shapes}
+        # only overlapping pairs come back to Python
+        hits = np.flatnonzero(dist < 0)
+        for i,owner,x,y,d,a in zip(hits.tolist(), owners[hits].tolist(),
+                                   px[hits].tolist(), py[hits].tolist(),
+                                   dist[hits].tolist(), area[hits].tolist()):
+            overlap = ShapeOverlap(x=x, y=y, dist=d, area=a, other=others[i])
+            batch[shapes[owner]].append(overlap)
+        return batch, len(others)
+    
+    def resolve_pass(self, get_candidates, spatial_hash, other_arrays=None):
+        """
+        Resolve every awake shape's overlaps with candidates returned by given
+        function, in order. If given arrays for candidates, test all pairs at
+        once first. Returns (pairs tested, overlaps resolved).
+        """
+        shapes = [shape for shape in self.awake_shapes if shape in self.valid_shapes]
+        batch, tested, resolved = {}, 0, 0
+        if other_arrays is not None:
+            batch, tested = self.get_batch_overlaps(shapes, get_candidates,
+                                                    self.dynamic_arrays,
+                                                    other_arrays)
+        self.moved_shapes = {}
+        self.moved_cells = {self.dynamic_hash: set(), self.static_hash: set()}
+        # shapes woken during a pass are appended to list as we go
+        for shape in self.awake_shapes:
+            if not shape in self.valid_shapes:
+                continue
+            overlaps = batch.pop(shape, None)
+            # batched results are exact as long as nothing nearby has moved
+            # since, otherwise test again now, as shapes are resolved in order
+            if overlaps is not None and \
+               not self.is_shape_region_moved(shape, spatial_hash):
+                resolved += shape.resolve_overlaps(overlaps)
+                continue
+            others = get_candidates(shape)
+            tested += len(others)
+            resolved += shape.resolve_overlaps_with_shapes(others)
+        self.moved_shapes, self.moved_cells = None, None
+        return tested, resolved
     
     def update(self):
         "Resolve overlaps between all relevant world objects."
+        start_time = time.perf_counter()
+        # filter shape lists for anything out of room etc, once per update;
+        # dict for fast membership tests that keeps shape order
+        self.valid_shapes, self.awake_shapes = {}, []
+        for shape in self.dynamic_shapes:
+            # objects may have moved their shapes without telling us
+            self.dynamic_hash.update(shape)
+            if not shape.go.should_collide():
+                continue
+            self.valid_shapes[shape] = True
+            self.update_sleeping(shape)
+            if not shape.sleeping:
+                self.awake_shapes.append(shape)
+        use_batch = self.use_batch_narrowphase and \
+                    len(self.valid_shapes) >= self.min_batch_shapes
+        if use_batch and self.static_arrays is None:
+            self.static_arrays = self.get_shape_arrays(self.static_shapes)
+        passes, pairs_tested, overlaps_resolved = 0, 0, 0
         for i in range(self.iterations):
-            # filter shape lists for anything out of room etc
-            valid_dynamic_shapes = []
-            for shape in self.dynamic_shapes:
-                if shape.go.should_collide():
-                    valid_dynamic_shapes.append(shape)
-            for shape in valid_dynamic_shapes:
-                shape.resolve_overlaps_with_shapes(valid_dynamic_shapes)
-            for shape in valid_dynamic_shapes:
-                static_shapes = shape.get_overlapping_static_shapes()
-                shape.resolve_overlaps_with_shapes(static_shapes)
+            passes += 1
+            dynamic_arrays, static_arrays = None, None
+            if use_batch:
+                # mirror dynamic shapes' current locations for batched tests
+                self.dynamic_arrays = self.get_shape_arrays(list(self.valid_shapes))
+                dynamic_arrays = self.dynamic_arrays
+            tested, resolved = self.resolve_pass(self.get_dynamic_candidates,
+                                                 self.dynamic_hash,
+                                                 dynamic_arrays)
+            pairs_tested += tested
+            if use_batch:
+                # dynamic shapes have moved since, mirror them again
+                self.dynamic_arrays = self.get_shape_arrays(list(self.valid_shapes))
+                static_arrays = self.static_arrays
+            tested, static_resolved = self.resolve_pass(self.get_static_candidates,
+                                                        self.static_hash,
+                                                        static_arrays)
+            pairs_tested += tested
+            resolved += static_resolved
+            overlaps_resolved += resolved
+            # settled, further passes would find nothing new
+            if resolved == 0:
+                break
+        sleeping, sleeping_objects = 0, {}
+        for shape in self.valid_shapes:
+            if not shape.sleeping:
+                continue
+            sleeping += 1
+            sleeping_objects[shape.go] = True
+        # sleeping shapes' overlaps aren't rechecked, keep contacts going
+        for obj in sleeping_objects:
+            self.refresh_sleeping_contacts(obj)
+        self.dynamic_arrays = None
         # check which objects stopped colliding
         for obj in self.world.objects.values():
             obj.check_finished_contacts()
         self.ticks += 1
         self.collisions_this_frame = []
+        elapsed = (time.perf_counter() - start_time) * 1000
+        self.stats = CollisionStats(passes, pairs_tested, overlaps_resolved,
+                                    sleeping, elapsed)
+    
+    def run_benchmark(self, count=200, ticks=10):
+        """
+        Time updates with given number of wandering dynamic circles and
+        static boxes, with and without broadphase and batched narrowphase.
+        Returns report string.
+        """
+        rng = random.Random(0)
+        # keep density the same at any count
+        size = math.sqrt(count) * 2
+        objects = []
+        for class_name in ['CollisionBenchmarkCircle', 'CollisionBenchmarkBox']:
+            for i in range(count):
+                x, y = rng.uniform(-size, size), rng.uniform(-size, size)
+                obj = self.world.spawn_object_of_class(class_name, x, y)
+                if not obj:
+                    return "Couldn't spawn %s" % class_name
+                obj.collision.update_transform_from_object()
+                objects.append(obj)
+        circles = objects[:count]
+        start_locs = [(obj.x, obj.y) for obj in circles]
+        results = []
+        for use_broadphase, use_batch in [(True, True), (True, False),
+                                          (False, False)]:
+            self.use_broadphase = use_broadphase
+            self.use_batch_narrowphase = use_batch
+            for obj, (x, y) in zip(circles, start_locs):
+                obj.x, obj.y = x, y
+            elapsed = 0
+            for i in range(ticks):
+                for obj in circles:
+                    obj.x += rng.uniform(-0.25, 0.25)
+                    obj.y += rng.uniform(-0.25, 0.25)
+                    obj.collision.update()
+                start_time = time.perf_counter()
+                self.update()
+                elapsed += time.perf_counter() - start_time
+            results.append(elapsed * 1000 / ticks)
+        # restore class defaults
+        del self.use_broadphase
+        del self.use_batch_narrowphase
+        for obj in objects:
+            obj.destroy()
+        return '%s circles vs %s boxes: %.2fms/update with broadphase + batched narrowphase, %.2fms one pair at a time, %.2fms without broadphase' % (count, count, *results)
 
 
 # collision handling
@@ -522,7 +1316,9 @@ def box_overlaps_ray(left, top, right, bottom, x1, y1, x2, y2):
 def point_circle_penetration(point_x, point_y, circle_x, circle_y, radius):
     "Return normalized penetration x, y, and distance for given circles."
     dx, dy = circle_x - point_x, circle_y - point_y
-    pdist = math.sqrt(dx ** 2 + dy ** 2)
+    # multiply rather than ** 2, which can differ from array versions' in
+    # the last bit
+    pdist = math.sqrt(dx * dx + dy * dy)
     # point is center of circle, arbitrarily project out in +X
     if pdist == 0:
         return 1, 0, -radius, -radius
@@ -568,10 +1364,248 @@ def circle_box_penetration(circle_x, circle_y, box_x, box_y, circle_radius,
     py = min(box_top, max(box_bottom, circle_y))
     closest_x = circle_x - px
     closest_y = circle_y - py
-    d = math.sqrt(closest_x ** 2 + closest_y ** 2)
+    d = math.sqrt(closest_x * closest_x + closest_y * closest_y)
     pdist = circle_radius - d
     if d == 0:
         return
     1, 0, -pdist, -pdist
     # TODO: calculate other axis of intersection for area?
     return -closest_x / d, -closest_y / d, -pdist, -pdist
+
+def get_tile_box_ranges(mask):
+    """
+    Cover True tiles of given 2D bool array with few boxes, greedily: from
+    each uncovered tile in row order, extend right as far as possible, then
+    down while the whole row below is uncovered.
+    Returns list of (x, y, end_x, end_y) tile ranges.
+    """
+    available = mask.copy()
+    flat = available.ravel()
+    width = available.shape[1]
+    ranges = []
+    i = 0
+    while i < len(flat):
+        # find next uncovered tile
+        i += int(np.argmax(flat[i:]))
+        if not flat[i]:
+            break
+        y, x = divmod(i, width)
+        # argmin finds first False, if any
+        row = available[y, x:]
+        run = int(np.argmin(row))
+        end_x = x + (len(row) if row[run] else run) - 1
+        rows = available[y+1:, x:end_x+1].all(axis=1)
+        run = int(np.argmin(rows)) if len(rows) > 0 else 0
+        end_y = y + (len(rows) if len(rows) > 0 and rows[run] else run)
+        available[y:end_y+1, x:end_x+1] = False
+        ranges.append((x, y, end_x, end_y))
+    return ranges
+
+# swept tests: when a moving shape first touches another, for continuous
+# collision of fast movers
+
+def box_entry_time(x, y, dx, dy, box_x, box_y, box_hw, box_hh):
+    """
+    Return time at which point at given location moving by given vector
+    enters given box (negative if it starts inside), or None if it doesn't
+    by time 1.
+    """
+    entry_time, exit_time = -math.inf, math.inf
+    for p, d, center, half in ((x, dx, box_x, box_hw), (y, dy, box_y, box_hh)):
+        if d == 0:
+            # moving parallel to these sides, must already be between them
+            if abs(p - center) >= half:
+                return None
+            continue
+        t1, t2 = (center - half - p) / d, (center + half - p) / d
+        entry_time = max(entry_time, min(t1, t2))
+        exit_time = min(exit_time, max(t1, t2))
+    # only grazes a corner, or exits before time 0, or enters after time 1
+    if entry_time >= exit_time or exit_time <= 0 or entry_time > 1:
+        return None
+    return entry_time
+
+def box_sweep_time(x, y, dx, dy, box_x, box_y, box_hw, box_hh, epsilon=0):
+    """
+    Return time (0-1) at which point at given location moving by given vector
+    first touches given box, or None if it doesn't or starts within epsilon
+    of it. Box vs box is point vs box with both boxes' half sizes added.
+    """
+    if abs(x - box_x) <= box_hw + epsilon and abs(y - box_y) <= box_hh + epsilon:
+        return None
+    return box_entry_time(x, y, dx, dy, box_x, box_y, box_hw, box_hh)
+
+def circle_sweep_time(x, y, dx, dy, circle_x, circle_y, radius, epsilon=0):
+    """
+    Return time (0-1) at which point at given location moving by given vector
+    first touches given circle, or None if it doesn't or starts within
+    epsilon of it. Circle vs circle is point vs circle with radii added.
+    """
+    mx, my = x - circle_x, y - circle_y
+    if math.sqrt(mx * mx + my * my) <= radius + epsilon:
+        return None
+    # solve |m + t*d| = radius for t
+    a = dx * dx + dy * dy
+    b = mx * dx + my * dy
+    # not moving, or moving away
+    if a == 0 or b >= 0:
+        return None
+    discriminant = b * b - a * (mx * mx + my * my - radius * radius)
+    if discriminant <= 0:
+        return None
+    t = (-b - math.sqrt(discriminant)) / a
+    return t if t <= 1 else None
+
+def circle_box_sweep_time(circle_x, circle_y, dx, dy, circle_radius,
+                          box_x, box_y, box_hw, box_hh, epsilon=0):
+    """
+    Return time (0-1) at which circle moving by given vector first touches
+    given box, or None if it doesn't or starts within epsilon of it.
+    """
+    box_left, box_right = box_x - box_hw, box_x + box_hw
+    box_top, box_bottom = box_y + box_hh, box_y - box_hh
+    closest_x = circle_x - min(box_right, max(box_left, circle_x))
+    closest_y = circle_y - min(box_top, max(box_bottom, circle_y))
+    if math.sqrt(closest_x * closest_x + closest_y * closest_y) <= circle_radius + epsilon:
+        return None
+    # circle center vs box grown by radius, with rounded corners
+    t = box_entry_time(circle_x, circle_y, dx, dy, box_x, box_y,
+                       box_hw + circle_radius, box_hh + circle_radius)
+    if t is None:
+        return None
+    # may start inside grown box's corner, outside its rounded corner
+    t = max(0, t)
+    hit_x, hit_y = circle_x + dx * t, circle_y + dy * t
+    beyond_x = hit_x < box_left or hit_x > box_right
+    beyond_y = hit_y < box_bottom or hit_y > box_top
+    if not (beyond_x and beyond_y):
+        return t
+    # hit a corner, check against its rounding
+    corner_x = box_left if hit_x < box_left else box_right
+    corner_y = box_bottom if hit_y < box_bottom else box_top
+    return circle_sweep_time(circle_x, circle_y, dx, dy, corner_x, corner_y,
+                             circle_radius)
+
+def sweep_grid(x, y, dx, dy, halfwidth, halfheight):
+    """
+    Walk the unit grid cells a box with given center and half size might
+    touch as it moves by given vector, in order of its center reaching them
+    (a DDA). Yields (time 0-1 center enters a cell, list of (x, y) cells
+    near that cell not yielded before). Scale coordinates to use other grids.
+    """
+    cell_x, cell_y = math.floor(x), math.floor(y)
+    end_x, end_y = math.floor(x + dx), math.floor(y + dy)
+    step_x, step_y = (1 if dx > 0 else -1), (1 if dy > 0 else -1)
+    # time center crosses next cell boundary on each axis, and between them
+    if dx != 0:
+        next_x = (cell_x + (step_x > 0) - x) / dx
+        delta_x = abs(1 / dx)
+    else:
+        next_x = delta_x = math.inf
+    if dy != 0:
+        next_y = (cell_y + (step_y > 0) - y) / dy
+        delta_y = abs(1 / dy)
+    else:
+        next_y = delta_y = math.inf
+    t = 0
+    seen = set()
+    for i in range(abs(end_x - cell_x) + abs(end_y - cell_y) + 1):
+        cells = []
+        for near_y in range(math.floor(cell_y - halfheight),
+                            math.floor(cell_y + 1 + halfheight) + 1):
+            for near_x in range(math.floor(cell_x - halfwidth),
+                                math.floor(cell_x + 1 + halfwidth) + 1):
+                if not (near_x, near_y) in seen:
+                    seen.add((near_x, near_y))
+                    cells.append((near_x, near_y))
+        yield t, cells
+        if next_x < next_y:
+            cell_x += step_x
+            t = next_x
+            next_x += delta_x
+        else:
+            cell_y += step_y
+            t = next_y
+            next_y += delta_y
+
+# array versions of above penetration functions, for testing many pairs at
+# once; each must give exactly the same results as its scalar counterpart
+
+def point_circle_penetration_batch(point_x, point_y, circle_x, circle_y, radius):
+    "Array version of point_circle_penetration."
+    dx, dy = circle_x - point_x, circle_y - point_y
+    pdist = np.sqrt(dx * dx + dy * dy)
+    centered = pdist == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        px = np.where(centered, 1., dx / pdist)
+        py = np.where(centered, 0., dy / pdist)
+    return px, py, pdist - radius, pdist - radius
+
+def box_penetration_batch(ax, ay, bx, by, ahw, ahh, bhw, bhh):
+    "Array version of box_penetration."
+    left_a, right_a = ax - ahw, ax + ahw
+    top_a, bottom_a = ay + ahh, ay - ahh
+    left_b, right_b = bx - bhw, bx + bhw
+    top_b, bottom_b = by + bhh, by - bhh
+    px = np.where(ax <= bx, right_a - left_b, right_b - left_a)
+    py = np.where(ay >= by, top_b - bottom_a, top_a - bottom_b)
+    dx, dy = bx - ax, by - ay
+    widths, heights = ahw + bhw, ahh + bhh
+    x_axis = widths + px - np.abs(dx) < heights + py - np.abs(dy)
+    sign_x = np.where(dx >= 0, 1., -1.)
+    sign_y = np.where(dy >= 0, 1., -1.)
+    return (np.where(x_axis, sign_x, 0.), np.where(x_axis, 0., sign_y),
+            np.where(x_axis, -px, -py), np.where(x_axis, -py, -px))
+
+def circle_box_penetration_batch(circle_x, circle_y, box_x, box_y,
+                                 circle_radius, box_hw, box_hh):
+    "Array version of circle_box_penetration."
+    box_left, box_right = box_x - box_hw, box_x + box_hw
+    box_top, box_bottom = box_y + box_hh, box_y - box_hh
+    inside = (box_left <= circle_x) & (circle_x <= box_right) & \
+             (box_bottom <= circle_y) & (circle_y <= box_top)
+    inside_result = box_penetration_batch(circle_x, circle_y, box_x, box_y,
+                                          circle_radius, circle_radius,
+                                          box_hw, box_hh)
+    px = np.minimum(box_right, np.maximum(box_left, circle_x))
+    py = np.minimum(box_top, np.maximum(box_bottom, circle_y))
+    closest_x = circle_x - px
+    closest_y = circle_y - py
+    d = np.sqrt(closest_x * closest_x + closest_y * closest_y)
+    pdist = circle_radius - d
+    # d is only 0 for centers inside box, whose results come from above
+    with np.errstate(divide='ignore', invalid='ignore'):
+        outside_result = -closest_x / d, -closest_y / d, -pdist, -pdist
+    return tuple(np.where(inside, a, b) for a,b in zip(inside_result, outside_result))
+
+def get_overlaps_batch(a, b):
+    """
+    Array version of CollisionShape.get_overlap, for many pairs of shapes A
+    and B each given as (kind, x, y, radius, halfwidth, halfheight) arrays,
+    see CollisionLord.get_shape_arrays.
+    Returns penetration x, y, distance and area arrays.
+    """
+    a_kind, ax, ay, ar, ahw, ahh = a
+    b_kind, bx, by, br, bhw, bhh = b
+    px, py = np.zeros(len(ax)), np.zeros(len(ax))
+    pdist1, pdist2 = np.zeros(len(ax)), np.zeros(len(ax))
+    a_circle, b_circle = a_kind == CST_CIRCLE, b_kind == CST_CIRCLE
+    def set_results(mask, results):
+        for out,values in zip((px, py, pdist1, pdist2), results):
+            out[mask] = values
+    m = a_circle & b_circle
+    set_results(m, point_circle_penetration_batch(ax[m], ay[m], bx[m], by[m],
+                                                  ar[m] + br[m]))
+    m = a_circle & ~b_circle
+    set_results(m, circle_box_penetration_batch(ax[m], ay[m], bx[m], by[m],
+                                                ar[m], bhw[m], bhh[m]))
+    m = ~a_circle & ~b_circle
+    set_results(m, box_penetration_batch(ax[m], ay[m], bx[m], by[m],
+                                         ahw[m], ahh[m], bhw[m], bhh[m]))
+    m = ~a_circle & b_circle
+    x, y, d1, d2 = circle_box_penetration_batch(bx[m], by[m], ax[m], ay[m],
+                                                br[m], ahw[m], ahh[m])
+    # reverse result if A is the box
+    set_results(m, (-x, -y, d1, d2))
+    area = np.where(pdist1 < 0, np.abs(pdist1 * pdist2), 0.)
+    return px, py, pdist1, area
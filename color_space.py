@@ -0,0 +1,232 @@
+# array-based color space conversion and color difference
+# all functions take numpy arrays with color channels in the last axis,
+# eg a single color (3,), a list of colors (N, 3) or an image (H, W, 3).
+# RGB is sRGB, base-255; XYZ is 0-100; observer: 2deg, illuminant: D65.
+# run this module directly for an accuracy check and benchmark.
+
+import sys, time
+import numpy as np
+
+import lab_color
+
+# color difference formulas
+DELTA_E_CIE76 = 'cie76'
+DELTA_E_CIE94 = 'cie94'
+DELTA_E_CIEDE2000 = 'ciede2000'
+
+RGB_TO_XYZ = np.array([[0.4124, 0.3576, 0.1805],
+                       [0.2126, 0.7152, 0.0722],
+                       [0.0193, 0.1192, 0.9505]])
+XYZ_TO_RGB = np.linalg.inv(RGB_TO_XYZ)
+D65_WHITE = np.array([95.047, 100.0, 108.883])
+
+
+def srgb_to_linear(rgb):
+    "base-255 sRGB -> 0-1 linear RGB"
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    return np.where(c > 0.04045, ((c + 0.055) / 1.055)**2.4, c / 12.92)
+
+def linear_to_srgb(linear):
+    "0-1 linear RGB -> base-255 sRGB (float, unclipped)"
+    c = np.maximum(linear, 0)
+    c = np.where(c > 0.0031308, 1.055 * c**(1 / 2.4) - 0.055, c * 12.92)
+    return c * 255.0
+
+def rgb_to_xyz(rgb):
+    return (srgb_to_linear(rgb) * 100) @ RGB_TO_XYZ.T
+
+def xyz_to_rgb(xyz):
+    return linear_to_srgb((np.asarray(xyz) / 100) @ XYZ_TO_RGB.T)
+
+def xyz_to_lab(xyz):
+    c = np.asarray(xyz, dtype=np.float64) / D65_WHITE
+    c = np.where(c > 0.008856, np.cbrt(c), (7.787 * c) + (16.0 / 116))
+    x, y, z = c[..., 0], c[..., 1], c[..., 2]
+    return np.stack([(116 * y) - 16, 500 * (x - y), 200 * (y - z)], axis=-1)
+
+def lab_to_xyz(lab):
+    lab = np.asarray(lab, dtype=np.float64)
+    y = (lab[..., 0] + 16) / 116
+    x = lab[..., 1] / 500 + y
+    z = y - lab[..., 2] / 200
+    c = np.stack([x, y, z], axis=-1)
+    c = np.where(c**3 > 0.008856, c**3, (c - 16.0 / 116) / 7.787)
+    return c * D65_WHITE
+
+def rgb_to_lab(rgb):
+    return xyz_to_lab(rgb_to_xyz(rgb))
+
+def lab_to_rgb(lab):
+    "L*a*b -> base-255 sRGB, clipped to valid range but not rounded"
+    return np.clip(xyz_to_rgb(lab_to_xyz(lab)), 0, 255)
+
+def delta_e_cie76(lab1, lab2):
+    "CIE 1976 color difference: straight euclidean distance in L*a*b"
+    return np.sqrt(((np.asarray(lab1) - np.asarray(lab2))**2).sum(axis=-1))
+
+def delta_e_cie94(lab1, lab2, textiles=False):
+    "CIE 1994 color difference; not symmetric, lab1 is the reference color"
+    lab1, lab2 = np.asarray(lab1), np.asarray(lab2)
+    kl, k1, k2 = (2, 0.048, 0.014) if textiles else (1, 0.045, 0.015)
+    dl = lab1[..., 0] - lab2[..., 0]
+    c1 = np.hypot(lab1[..., 1], lab1[..., 2])
+    c2 = np.hypot(lab2[..., 1], lab2[..., 2])
+    dc = c1 - c2
+    da = lab1[..., 1] - lab2[..., 1]
+    db = lab1[..., 2] - lab2[..., 2]
+    # dH^2 can go slightly negative from float error
+    dh2 = np.maximum(da**2 + db**2 - dc**2, 0)
+    sc = 1 + k1 * c1
+    sh = 1 + k2 * c1
+    return np.sqrt((dl / kl)**2 + (dc / sc)**2 + dh2 / sh**2)
+
+def delta_e_ciede2000(lab1, lab2, kl=1, kc=1, kh=1):
+    "CIEDE2000 color difference, per Sharma, Wu and Dalal 2005"
+    lab1, lab2 = np.asarray(lab1), np.asarray(lab2)
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    c_mean = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    g = 0.5 * (1 - np.sqrt(c_mean**7 / (c_mean**7 + 25.0**7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    # hue is undefined for achromatic colors
+    chroma_zero = (c1p * c2p) == 0
+    dlp = l2 - l1
+    dcp = c2p - c1p
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, dhp)
+    dhp = np.where(dhp < -180, dhp + 360, dhp)
+    dhp = np.where(chroma_zero, 0, dhp)
+    dhp_big = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(dhp / 2))
+    lp_mean = (l1 + l2) / 2
+    cp_mean = (c1p + c2p) / 2
+    hp_sum = h1p + h2p
+    hp_mean = np.where(np.abs(h1p - h2p) > 180,
+                       np.where(hp_sum < 360, hp_sum + 360, hp_sum - 360),
+                       hp_sum) / 2
+    hp_mean = np.where(chroma_zero, hp_sum, hp_mean)
+    t = 1 - 0.17 * np.cos(np.radians(hp_mean - 30)) \
+          + 0.24 * np.cos(np.radians(2 * hp_mean)) \
+          + 0.32 * np.cos(np.radians(3 * hp_mean + 6)) \
+          - 0.20 * np.cos(np.radians(4 * hp_mean - 63))
+    d_theta = 30 * np.exp(-((hp_mean - 275) / 25)**2)
+    rc = 2 * np.sqrt(cp_mean**7 / (cp_mean**7 + 25.0**7))
+    sl = 1 + (0.015 * (lp_mean - 50)**2) / np.sqrt(20 + (lp_mean - 50)**2)
+    sc = 1 + 0.045 * cp_mean
+    sh = 1 + 0.015 * cp_mean * t
+    rt = -np.sin(np.radians(2 * d_theta)) * rc
+    dl_term = dlp / (kl * sl)
+    dc_term = dcp / (kc * sc)
+    dh_term = dhp_big / (kh * sh)
+    return np.sqrt(dl_term**2 + dc_term**2 + dh_term**2 + rt * dc_term * dh_term)
+
+DELTA_E_FUNCTIONS = {
+    DELTA_E_CIE76: delta_e_cie76,
+    DELTA_E_CIE94: delta_e_cie94,
+    DELTA_E_CIEDE2000: delta_e_ciede2000
+}
+
+def color_diff(lab1, lab2, method=DELTA_E_CIE76):
+    "elementwise color difference of (broadcastable) L*a*b arrays"
+    return DELTA_E_FUNCTIONS[method](lab1, lab2)
+
+def color_diff_matrix(lab1, lab2, method=DELTA_E_CIE76):
+    "(N, M) matrix of differences between every color in lab1 and lab2"
+    lab1 = np.asarray(lab1).reshape(-1, 3)
+    lab2 = np.asarray(lab2).reshape(-1, 3)
+    return color_diff(lab1[:, np.newaxis, :], lab2[np.newaxis, :, :], method)
+
+
+# accuracy check + benchmark
+
+# sRGB -> L*a*b
+LAB_REFERENCE = [
+    ((255, 255, 255), (100.0, 0.0, 0.0)),
+    ((0, 0, 0), (0.0, 0.0, 0.0)),
+    ((255, 0, 0), (53.24, 80.09, 67.20)),
+    ((0, 255, 0), (87.73, -86.18, 83.18)),
+    ((0, 0, 255), (32.30, 79.19, -107.86)),
+    ((128, 128, 128), (53.59, 0.0, 0.0)),
+]
+
+# pairs from Sharma, Wu and Dalal's CIEDE2000 test data
+CIEDE2000_REFERENCE = [
+    ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+    ((50.0, 3.1571, -77.2803), (50.0, 0.0, -82.7485), 2.8615),
+    ((50.0, 2.8361, -74.0200), (50.0, 0.0, -82.7485), 3.4412),
+    ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+    ((50.0, 2.49, -0.001), (50.0, -2.49, 0.0009), 7.1792),
+    ((50.0, 2.49, -0.001), (50.0, -2.49, 0.0011), 7.2195),
+    ((50.0, -0.001, 2.49), (50.0, 0.0009, -2.49), 4.8045),
+    ((50.0, -0.001, 2.49), (50.0, 0.0011, -2.49), 4.7461),
+    ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 27.1492),
+    ((50.0, 2.5, 0.0), (61.0, -5.0, 29.0), 22.8977),
+    ((50.0, 2.5, 0.0), (56.0, -27.0, -3.0), 31.9030),
+    ((50.0, 2.5, 0.0), (58.0, 24.0, 15.0), 19.4535),
+    ((50.0, 2.5, 0.0), (50.0, 3.1736, 0.5854), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+]
+
+def check_accuracy():
+    "prints max error against reference values, returns True if all pass"
+    passed = True
+    rgb = np.array([r[0] for r in LAB_REFERENCE])
+    expected = np.array([r[1] for r in LAB_REFERENCE])
+    lab_error = np.abs(rgb_to_lab(rgb) - expected).max()
+    round_trip_error = np.abs(lab_to_rgb(rgb_to_lab(rgb)) - rgb).max()
+    scalar = np.array([lab_color.rgb_to_lab(*c) for c in rgb.tolist()])
+    scalar_error = np.abs(rgb_to_lab(rgb) - scalar).max()
+    lab1 = np.array([r[0] for r in CIEDE2000_REFERENCE])
+    lab2 = np.array([r[1] for r in CIEDE2000_REFERENCE])
+    expected = np.array([r[2] for r in CIEDE2000_REFERENCE])
+    de2000_error = np.abs(delta_e_ciede2000(lab1, lab2) - expected).max()
+    # formula should be symmetric
+    de2000_error = max(de2000_error, np.abs(delta_e_ciede2000(lab2, lab1) - expected).max())
+    # reference values are rounded, as are our sRGB -> XYZ coefficients
+    for name, error, tolerance in [('sRGB -> L*a*b', lab_error, 0.05),
+                                   ('L*a*b -> sRGB round trip', round_trip_error, 0.01),
+                                   ('array vs scalar lab_color', scalar_error, 1e-9),
+                                   ('CIEDE2000', de2000_error, 0.0001)]:
+        ok = error <= tolerance
+        passed = passed and ok
+        print('  %-28s max error %.6f %s' % (name, error, 'ok' if ok else 'FAILED'))
+    return passed
+
+def benchmark(palette_size=256, pixels=100000):
+    "times array functions against scalar lab_color equivalents"
+    rng = np.random.default_rng(0)
+    colors = rng.integers(0, 256, (palette_size, 3))
+    # ImageConverter-style palette diff table
+    start = time.perf_counter()
+    labs = [lab_color.rgb_to_lab(*c) for c in colors.tolist()]
+    table = [[lab_color.lab_color_diff(*l1, *l2) for l2 in labs] for l1 in labs]
+    scalar_time = time.perf_counter() - start
+    start = time.perf_counter()
+    lab = rgb_to_lab(colors)
+    table = color_diff_matrix(lab, lab)
+    array_time = time.perf_counter() - start
+    print('  %s color CIE76 diff table: scalar %.4fs, array %.4fs (%.0fx)' % (palette_size, scalar_time, array_time, scalar_time / array_time))
+    image = rng.integers(0, 256, (pixels, 3))
+    start = time.perf_counter()
+    for c in image[:pixels // 100].tolist():
+        lab_color.rgb_to_lab(*c)
+    scalar_time = (time.perf_counter() - start) * 100
+    start = time.perf_counter()
+    rgb_to_lab(image)
+    array_time = time.perf_counter() - start
+    print('  %s pixel sRGB -> L*a*b: scalar ~%.4fs, array %.4fs (%.0fx)' % (pixels, scalar_time, array_time, scalar_time / array_time))
+    for method in DELTA_E_FUNCTIONS:
+        start = time.perf_counter()
+        color_diff_matrix(lab, lab, method)
+        print('  %s color %s diff table: %.4fs' % (palette_size, method, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    print('accuracy:')
+    passed = check_accuracy()
+    print('benchmark:')
+    benchmark()
+    if not passed:
+        sys.exit(1)
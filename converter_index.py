@@ -0,0 +1,159 @@
+import os, sys, json, importlib
+
+from art_import import ArtImporter
+from art_export import ArtExporter
+
+FORMATS_DIR = 'formats/'
+# cached in app cache dir, lets chooser dialogs list converters without
+# importing every module in formats/
+INDEX_FILENAME = 'formats_index.json'
+INDEX_VERSION = 1
+
+class ConverterInfo:
+    
+    "Stand-in for an ArtImporter/ArtExporter class until it's actually needed."
+    
+    def __init__(self, module_name, class_name, format_name, format_description):
+        self.module_name = module_name
+        self.class_name = class_name
+        self.format_name = format_name
+        self.format_description = format_description
+
+
+class ConverterIndex:
+    
+    """
+    Catalogs importers and exporters in builtin and user formats/ dirs.
+    Modules are only imported to (re)index them when their file changes,
+    or to load a converter the user has picked.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self.index_filename = self.app.cache_dir + INDEX_FILENAME
+        # filename: {'mtime': last modified time, 'converters': [dicts]}
+        self.files = None
+        # formats modules we've imported, reloaded when used again so edits
+        # to them are picked up without restarting
+        self.modules = {}
+    
+    def get_format_filenames(self):
+        filenames = []
+        for dirname in [FORMATS_DIR, self.app.documents_dir + FORMATS_DIR]:
+            if not os.path.exists(dirname):
+                continue
+            for filename in os.listdir(dirname):
+                if os.path.splitext(filename)[1].lower() == '.py':
+                    filenames.append(dirname + filename)
+        return filenames
+    
+    def read_index(self):
+        self.files = {}
+        if not os.path.exists(self.index_filename):
+            return
+        try:
+            data = json.load(open(self.index_filename))
+            if data.get('version', None) == INDEX_VERSION:
+                self.files = data['files']
+        except:
+            # corrupt index, rebuild it
+            pass
+    
+    def write_index(self):
+        data = {'version': INDEX_VERSION, 'files': self.files}
+        try:
+            json.dump(data, open(self.index_filename, 'w'), indent=1)
+        except Exception as e:
+            self.app.log("Couldn't write formats index %s: %s" % (self.index_filename, e))
+    
+    def import_module(self, module_name):
+        "Import (or reload) given formats module, logging any errors."
+        # on first load, documents dir may not be in import path
+        if not self.app.documents_dir in sys.path:
+            sys.path += [self.app.documents_dir]
+        try:
+            if module_name in self.modules:
+                m = importlib.reload(self.modules[module_name])
+            else:
+                m = importlib.import_module(module_name)
+            if module_name.startswith('formats.'):
+                self.modules[module_name] = m
+            return m
+        except Exception as e:
+            self.app.log_import_exception(e, module_name)
+    
+    def index_module(self, filename):
+        "Import given formats file and return its converters, None if it fails."
+        basename = os.path.splitext(os.path.basename(filename))[0]
+        m = self.import_module('formats.%s' % basename)
+        if not m:
+            return None
+        converters = []
+        for v in m.__dict__.values():
+            if not type(v) is type:
+                continue
+            for base_class in [ArtImporter, ArtExporter]:
+                if issubclass(v, base_class) and v is not base_class:
+                    converters.append({'module': v.__module__,
+                                       'class': v.__name__,
+                                       'base': base_class.__name__,
+                                       'format_name': v.format_name,
+                                       'format_description': v.format_description})
+        return converters
+    
+    def update(self):
+        "Re-index any formats files that changed since index was written."
+        if self.files is None:
+            self.read_index()
+        changed = False
+        filenames = self.get_format_filenames()
+        for filename in filenames:
+            mtime = os.path.getmtime(filename)
+            entry = self.files.get(filename, None)
+            if entry and entry['mtime'] == mtime:
+                continue
+            converters = self.index_module(filename)
+            # don't remember failed imports, so errors are logged until fixed
+            if converters is None:
+                if filename in self.files:
+                    self.files.pop(filename)
+                continue
+            self.files[filename] = {'mtime': mtime, 'converters': converters}
+            changed = True
+        # forget deleted files
+        for filename in list(self.files.keys()):
+            if not filename in filenames:
+                self.files.pop(filename)
+                changed = True
+        if changed:
+            self.write_index()
+    
+    def get_converters(self, base_class):
+        "Return list of ConverterInfos for given base class."
+        self.update()
+        infos, found = [], []
+        for entry in self.files.values():
+            for c in entry['converters']:
+                # don't add duplicates
+                # (can happen if eg one importer extends another)
+                key = (c['module'], c['class'])
+                if c['base'] != base_class.__name__ or key in found:
+                    continue
+                found.append(key)
+                infos.append(ConverterInfo(c['module'], c['class'],
+                                           c['format_name'],
+                                           c['format_description']))
+        return infos
+    
+    def get_converter_by_name(self, base_class, class_name):
+        "Return ConverterInfo with given class name, or None if not found."
+        for info in self.get_converters(base_class):
+            if info.class_name == class_name:
+                return info
+    
+    def load_converter_class(self, info):
+        "Import given ConverterInfo's module and return its class."
+        m = self.import_module(info.module_name)
+        if not m:
+            return None
+        return getattr(m, info.class_name, None)
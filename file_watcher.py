@@ -0,0 +1,221 @@
+import os, sys, time, struct, select, threading, queue
+import ctypes, ctypes.util
+
+# inotify event flags, from sys/inotify.h
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0x800
+IN_CLOEXEC = 0x80000
+# editors either write files in place or write a temp file and rename it
+INOTIFY_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO
+# inotify_event struct: watch descriptor, mask, cookie, name length
+INOTIFY_EVENT_HEADER = 'iIII'
+INOTIFY_EVENT_HEADER_SIZE = struct.calcsize(INOTIFY_EVENT_HEADER)
+
+class InotifyThread(threading.Thread):
+    
+    "Watches directories of watched files with Linux inotify."
+    
+    # seconds between checks for stop request while no events arrive
+    stop_check_interval = 0.5
+    
+    def __init__(self, watcher):
+        threading.Thread.__init__(self, name='FileWatcher inotify', daemon=True)
+        self.watcher = watcher
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # watch descriptor: dir name, and reverse; added to from main
+        # thread and read from ours, only touch while holding lock
+        self.dirs = {}
+        self.watch_descriptors = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+    
+    def add_dir(self, dirname):
+        with self.lock:
+            if dirname in self.watch_descriptors:
+                return
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirname),
+                                             INOTIFY_WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), "couldn't watch %s" % dirname)
+            self.dirs[wd] = dirname
+            self.watch_descriptors[dirname] = wd
+    
+    def run(self):
+        while not self.stopped:
+            ready, _, _ = select.select([self.fd], [], [], self.stop_check_interval)
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            self.read_events(data)
+        os.close(self.fd)
+    
+    def read_events(self, data):
+        i = 0
+        while i < len(data):
+            wd, mask, cookie, name_length = struct.unpack_from(INOTIFY_EVENT_HEADER, data, i)
+            i += INOTIFY_EVENT_HEADER_SIZE
+            name = data[i:i+name_length].rstrip(b'\0')
+            i += name_length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, assume everything changed
+                self.watcher.all_changed()
+                continue
+            with self.lock:
+                if mask & IN_IGNORED:
+                    # dir was deleted or unmounted
+                    dirname = self.dirs.pop(wd, None)
+                    self.watch_descriptors.pop(dirname, None)
+                    continue
+                dirname = self.dirs.get(wd, None)
+            if dirname:
+                self.watcher.changed(os.path.join(dirname, os.fsdecode(name)))
+    
+    def stop(self):
+        self.stopped = True
+
+
+class PollingThread(threading.Thread):
+    
+    "Fallback for platforms without inotify: stats watched files in turn."
+    
+    def __init__(self, watcher, interval):
+        threading.Thread.__init__(self, name='FileWatcher polling', daemon=True)
+        self.watcher = watcher
+        self.interval = interval
+        # path: last modified time; added to from main thread, only touch
+        # while holding lock
+        self.mtimes = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+    
+    def get_mtime(self, path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+    
+    def add_path(self, path):
+        mtime = self.get_mtime(path)
+        with self.lock:
+            self.mtimes[path] = mtime
+    
+    def run(self):
+        while not self.stopped:
+            time.sleep(self.interval)
+            for path in self.watcher.get_watched_paths():
+                mtime = self.get_mtime(path)
+                with self.lock:
+                    changed = path in self.mtimes and mtime != self.mtimes[path]
+                    self.mtimes[path] = mtime
+                if changed:
+                    self.watcher.changed(path)
+    
+    def stop(self):
+        self.stopped = True
+
+
+class FileWatcher:
+    
+    """
+    Tells interested parties (eg CharacterSetLord, GameWorld) when files
+    they've loaded change on disk. Changes are detected on a background
+    thread and handed to callbacks on the main thread in update(), so the
+    main loop itself never touches the filesystem.
+    """
+    
+    use_inotify = True
+    "If True, use inotify where available (Linux), else poll"
+    poll_interval = 1.0
+    "Seconds between checks of every watched file when polling"
+    log_changes = False
+    
+    def __init__(self, app):
+        self.app = app
+        # absolute path: list of (filename as given, callback)
+        self.watches = {}
+        self.lock = threading.Lock()
+        # absolute paths of changed files, pushed by background thread
+        self.changes = queue.Queue()
+        self.thread = None
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.thread = InotifyThread(self)
+            except Exception as e:
+                self.app.log('FileWatcher: inotify unavailable (%s), polling for changes' % e)
+        if not self.thread:
+            self.thread = PollingThread(self, self.poll_interval)
+        self.thread.start()
+    
+    def watch(self, filename, callback):
+        "Call given callback with given filename whenever its file changes."
+        if not filename or not os.path.exists(filename):
+            return
+        path = os.path.abspath(filename)
+        with self.lock:
+            watches = self.watches.setdefault(path, [])
+            if (filename, callback) in watches:
+                return
+            watches.append((filename, callback))
+        if isinstance(self.thread, InotifyThread):
+            try:
+                self.thread.add_dir(os.path.dirname(path))
+            except OSError as e:
+                self.app.log('FileWatcher: %s' % e)
+        else:
+            self.thread.add_path(path)
+    
+    def unwatch(self, filename=None, callback=None):
+        "Stop watching given file, and/or stop calling given callback."
+        with self.lock:
+            for path, watches in list(self.watches.items()):
+                if filename and path != os.path.abspath(filename):
+                    continue
+                watches[:] = [w for w in watches if callback and w[1] != callback]
+                if not watches:
+                    self.watches.pop(path)
+    
+    def get_watched_paths(self):
+        with self.lock:
+            return list(self.watches.keys())
+    
+    def changed(self, path):
+        "Called from background thread when a file in a watched dir changes."
+        # inotify watches whole dirs, ignore files nobody asked about
+        with self.lock:
+            watched = path in self.watches
+        if watched:
+            self.changes.put(path)
+    
+    def all_changed(self):
+        for path in self.get_watched_paths():
+            self.changes.put(path)
+    
+    def update(self):
+        "Run callbacks for files changed since last update."
+        if self.changes.empty():
+            return
+        # editors often write a file several times in one save
+        changed = []
+        while not self.changes.empty():
+            path = self.changes.get_nowait()
+            if not path in changed:
+                changed.append(path)
+        for path in changed:
+            with self.lock:
+                watches = self.watches.get(path, [])[:]
+            for filename, callback in watches:
+                if self.log_changes:
+                    self.app.log('FileWatcher: %s changed' % filename)
+                callback(filename)
+    
+    def destroy(self):
+        self.thread.stop()
@@ -8,9 +8,10 @@ from PIL import Image
 from ui_file_chooser_dialog import ImageFileChooserDialog
 from ui_dialog import UIDialog, Field
 from ui_art_dialog import ImportOptionsDialog
-from image_convert import ImageConverter
+from image_convert import ImageConverter, SEARCH_QUALITY_EXHAUSTIVE
+from image_quantize import DITHER_NONE, DITHER_FLOYD_STEINBERG, DITHER_ATKINSON, DITHER_BAYER
 from art_import import ArtImporter
-from palette import PaletteFromFile
+from palette import PaletteFromFile, MAX_COLORS
 from art import DEFAULT_CHARSET, DEFAULT_PALETTE, DEFAULT_WIDTH, DEFAULT_HEIGHT
 
 # custom chooser showing image previews, shares parent w/ "palette from image"
@@ -52,7 +53,17 @@ class ConvertImageOptionsDialog(ImportOptionsDialog):
     field7_label = '%% of source image: (%s)'
     field8_label = '  '
     field10_label = 'Smooth (bicubic) scale source image'
-    radio_groups = [(1, 2), (6, 7)]
+    field12_label = 'Dithering:'
+    field13_label = 'None'
+    field14_label = 'Floyd-Steinberg (error diffusion)'
+    field15_label = 'Atkinson (error diffusion, more contrast)'
+    field16_label = 'Ordered (Bayer)'
+    field18_label = 'Character search quality (1-%s):' % SEARCH_QUALITY_EXHAUSTIVE
+    field19_label = 'Perceptual (L*a*b) color matching, slower'
+    radio_groups = [(1, 2), (6, 7), (13, 14, 15, 16)]
+    # dither method for each of the above fields
+    dither_fields = {13: DITHER_NONE, 14: DITHER_FLOYD_STEINBERG,
+                     15: DITHER_ATKINSON, 16: DITHER_BAYER}
     field_width = UIDialog.default_short_field_width
     # to get the layout we want, we must specify 0 padding lines and
     # add some blank ones :/
@@ -69,10 +80,20 @@ class ConvertImageOptionsDialog(ImportOptionsDialog):
         Field(label=field8_label, type=float, width=field_width, oneline=True),
         Field(label='', type=None, width=0, oneline=True),
         Field(label=field10_label, type=bool, width=0, oneline=True),
+        Field(label='', type=None, width=0, oneline=True),
+        Field(label=field12_label, type=None, width=0, oneline=True),
+        Field(label=field13_label, type=bool, width=0, oneline=True),
+        Field(label=field14_label, type=bool, width=0, oneline=True),
+        Field(label=field15_label, type=bool, width=0, oneline=True),
+        Field(label=field16_label, type=bool, width=0, oneline=True),
+        Field(label='', type=None, width=0, oneline=True),
+        Field(label=field18_label, type=int, width=field_width, oneline=True),
+        Field(label=field19_label, type=bool, width=0, oneline=True),
         Field(label='', type=None, width=0, oneline=True)
     ]
-    invalid_color_error = 'Palettes must be between 2 and 256 colors.'
+    invalid_color_error = 'Palettes must be between 2 and %s colors.' % (MAX_COLORS - 1)
     invalid_scale_error = 'Scale must be greater than 0.0'
+    invalid_quality_error = 'Search quality must be between 1 and %s (slowest, exact).' % SEARCH_QUALITY_EXHAUSTIVE
     # redraw dynamic labels
     always_redraw_labels = True
     
@@ -89,6 +110,14 @@ class ConvertImageOptionsDialog(ImportOptionsDialog):
             return '50.0'
         elif field_number == 10:
             return ' '
+        elif field_number == 13:
+            return UIDialog.true_field_text
+        elif field_number in self.dither_fields:
+            return ' '
+        elif field_number == 18:
+            return str(ImageConverter.default_search_quality)
+        elif field_number == 19:
+            return ' '
         return ''
     
     def get_field_label(self, field_index):
@@ -129,19 +158,32 @@ class ConvertImageOptionsDialog(ImportOptionsDialog):
         return int(width), int(height)
     
     def is_input_valid(self):
-        # colors: int between 2 and 256
+        # colors: int between 2 and max (color 0 is reserved)
         try: int(self.field_texts[3])
         except: return False, self.invalid_color_error
         colors = int(self.field_texts[3])
-        if colors < 2  or colors > 256:
+        if colors < 2  or colors > MAX_COLORS - 1:
             return False, self.invalid_color_error
         # % scale: >0 float
         try: float(self.field_texts[8])
         except: return False, self.invalid_scale_error
         if float(self.field_texts[8]) <= 0:
             return False, self.invalid_scale_error
+        # search quality: int between 1 and exhaustive
+        try: quality = int(self.field_texts[18])
+        except: return False, self.invalid_quality_error
+        if quality < 1 or quality > SEARCH_QUALITY_EXHAUSTIVE:
+            return False, self.invalid_quality_error
         return True, None
     
+    def get_dither(self):
+        "returns dither method chosen in radio group"
+        for field_number, dither in self.dither_fields.items():
+            if field_number < len(self.field_texts) and \
+               self.field_texts[field_number].strip():
+                return dither
+        return DITHER_NONE
+    
     def confirm_pressed(self):
         valid, reason = self.is_input_valid()
         if not valid: return
@@ -157,6 +199,8 @@ class ConvertImageOptionsDialog(ImportOptionsDialog):
             colors = int(self.field_texts[3])
             new_pal = PaletteFromFile(self.ui.app, self.filename,
                                       palette_filename, colors)
+            if not new_pal.init_success:
+                return
             # palette now loaded and saved to disk
             options['palette'] = new_pal.name
         # rescale art?
@@ -167,6 +211,9 @@ class ConvertImageOptionsDialog(ImportOptionsDialog):
             # art dimensions = scale% of image dimensions, in tiles
             options['art_width'], options['art_height'] = self.get_tile_scale()
         options['bicubic_scale'] = bool(self.field_texts[10].strip())
+        options['dither'] = self.get_dither()
+        options['search_quality'] = int(self.field_texts[18])
+        options['perceptual'] = bool(self.field_texts[19].strip())
         ImportOptionsDialog.do_import(self.ui.app, self.filename, options)
 
 
@@ -186,8 +233,13 @@ Bitmap image in PNG, JPEG, or BMP format.
         width, height = options['art_width'], options['art_height']
         self.art.resize(width, height) # Importer.init will adjust UI
         bicubic_scale = options['bicubic_scale']
+        dither = options.get('dither', DITHER_NONE)
+        search_quality = options.get('search_quality', None)
+        perceptual = options.get('perceptual', False)
         # let ImageConverter do the actual heavy lifting
-        ic = ImageConverter(self.app, in_filename, self.art, bicubic_scale)
+        ic = ImageConverter(self.app, in_filename, self.art, bicubic_scale,
+                            dither=dither, search_quality=search_quality,
+                            perceptual=perceptual)
         # early failures: file no longer exists, PIL fails to load and convert image
         if not ic.init_success:
             return False
@@ -2,6 +2,7 @@
 import numpy as np
 
 from image_convert import ImageConverter
+from image_quantize import DITHER_NONE
 from ui_dialog import UIDialog, Field, SkipFieldType
 from formats.in_bitmap import BitmapImageImporter, ConvertImageChooserDialog, ConvertImageOptionsDialog
 
@@ -14,6 +15,13 @@ class TwoColorConvertImageOptionsDialog(ConvertImageOptionsDialog):
     field7_label = ConvertImageOptionsDialog.field7_label
     field8_label = ConvertImageOptionsDialog.field8_label
     field10_label = ConvertImageOptionsDialog.field10_label
+    field12_label = ConvertImageOptionsDialog.field12_label
+    field13_label = ConvertImageOptionsDialog.field13_label
+    field14_label = ConvertImageOptionsDialog.field14_label
+    field15_label = ConvertImageOptionsDialog.field15_label
+    field16_label = ConvertImageOptionsDialog.field16_label
+    field18_label = ConvertImageOptionsDialog.field18_label
+    field19_label = ConvertImageOptionsDialog.field19_label
     field_width = ConvertImageOptionsDialog.field_width
     fields = [
         Field(label='', type=SkipFieldType, width=0, oneline=True),
@@ -27,6 +35,15 @@ class TwoColorConvertImageOptionsDialog(ConvertImageOptionsDialog):
         Field(label=field8_label, type=float, width=field_width, oneline=True),
         Field(label='', type=None, width=0, oneline=True),
         Field(label=field10_label, type=bool, width=0, oneline=True),
+        Field(label='', type=None, width=0, oneline=True),
+        Field(label=field12_label, type=None, width=0, oneline=True),
+        Field(label=field13_label, type=bool, width=0, oneline=True),
+        Field(label=field14_label, type=bool, width=0, oneline=True),
+        Field(label=field15_label, type=bool, width=0, oneline=True),
+        Field(label=field16_label, type=bool, width=0, oneline=True),
+        Field(label='', type=None, width=0, oneline=True),
+        Field(label=field18_label, type=int, width=field_width, oneline=True),
+        Field(label=field19_label, type=bool, width=0, oneline=True),
         Field(label='', type=None, width=0, oneline=True)
     ]
     
@@ -78,7 +95,13 @@ fg/bg color swaps. Suitable for plaintext export.
         width, height = options['art_width'], options['art_height']
         self.art.resize(width, height) # Importer.init will adjust UI
         bicubic_scale = options['bicubic_scale']
-        ic = TwoColorImageConverter(self.app, in_filename, self.art, bicubic_scale)
+        dither = options.get('dither', DITHER_NONE)
+        search_quality = options.get('search_quality', None)
+        perceptual = options.get('perceptual', False)
+        ic = TwoColorImageConverter(self.app, in_filename, self.art,
+                                    bicubic_scale, dither=dither,
+                                    search_quality=search_quality,
+                                    perceptual=perceptual)
         # early failures: file no longer exists, PIL fails to load and convert image
         if not ic.init_success:
             return False
@@ -7,10 +7,12 @@ import os, time
 
 import image_convert
 import formats.in_bitmap as bm
+from image_quantize import DITHER_NONE
 
 class ImageSequenceConverter:
     
-    def __init__(self, app, image_filenames, art, bicubic_scale):
+    def __init__(self, app, image_filenames, art, bicubic_scale,
+                 dither=DITHER_NONE, search_quality=None, perceptual=False):
         self.init_success = False
         self.app = app
         self.start_time = time.time()
@@ -21,6 +23,11 @@ class ImageSequenceConverter:
         self.image_name = os.path.splitext(self.image_filename)[0]
         self.art = art
         self.bicubic_scale = bicubic_scale
+        self.dither = dither
+        self.search_quality = search_quality
+        self.perceptual = perceptual
+        # shared by all frames' converters, see ImageConverter.get_block_cache
+        self.block_cache = None
         # queue up first frame
         self.next_image(first=True)
         self.init_success = True
@@ -39,7 +46,10 @@ class ImageSequenceConverter:
             self.current_frame_converter = image_convert.ImageConverter(self.app,
                                                       self.image_filenames[0],
                                                       self.art,
-                                                      self.bicubic_scale, self)
+                                                      self.bicubic_scale, self,
+                                                      self.dither,
+                                                      self.search_quality,
+                                                      self.perceptual)
         except:
             self.fail()
             return
@@ -66,6 +76,10 @@ class ImageSequenceConverter:
         time_taken = time.time() - self.start_time
         (verb, error) = ('cancelled', True) if cancelled else ('finished', False)
         self.app.log('Conversion of image sequence %s %s after %.3f seconds' % (self.image_name, verb, time_taken), error)
+        if self.block_cache:
+            self.app.log('  ' + self.block_cache.get_stats_line())
+            if image_convert.ImageConverter.persist_block_cache:
+                self.block_cache.save()
         self.app.converter = None
         self.app.update_window_title()
 
@@ -91,6 +105,9 @@ image chosen.
         width, height = options['art_width'], options['art_height']
         self.art.resize(width, height) # Importer.init will adjust UI
         bicubic_scale = options['bicubic_scale']
+        dither = options.get('dither', DITHER_NONE)
+        search_quality = options.get('search_quality', None)
+        perceptual = options.get('perceptual', False)
         # get dir listing with full pathname
         in_dir = os.path.dirname(in_filename)
         in_files = ['%s/%s' % (in_dir, f) for f in os.listdir(in_dir)]
@@ -107,7 +124,8 @@ image chosen.
         self.art.set_active_frame(0)
         # create converter
         isc = ImageSequenceConverter(self.app, in_files, self.art,
-                                     bicubic_scale)
+                                     bicubic_scale, dither, search_quality,
+                                     perceptual)
         # bail on early failure
         if not isc.init_success:
             return False
@@ -10,6 +10,8 @@ class GameHUDArt(Art):
 
 
 class GameHUDRenderable(TileRenderable):
+    use_render_cache = False
+    cull_to_camera = False
     def get_projection_matrix(self):
         # much like UIRenderable, use UI's matrices to render in screen space
         return self.app.ui.view_matrix
@@ -97,11 +97,12 @@ class GameObject:
     "If False, don't do move physics updates for this object"
     fast_move_steps = 0
     """
-    If >0, subdivide high-velocity moves into fractions-of-this-object-sized
-    steps to avoid tunneling. turn this up if you notice an object tunneling.
-    # 1 = each step is object's full size
-    # 2 = each step is half object's size
-    # N = each step is 1/N object's size
+    If >0, sweep our collision along moves longer than a fraction of this
+    object's size, stopping at the first thing we'd hit, to avoid tunneling.
+    turn this up if you notice an object tunneling.
+    # 1 = sweep moves longer than object's full size
+    # 2 = sweep moves longer than half object's size
+    # N = sweep moves longer than 1/N object's size
     """
     move_accel_x = move_accel_y = 200.
     "Acceleration per update from player movement"
@@ -131,6 +132,8 @@ class GameObject:
     "Collision layer name for CST_TILE objects"
     draw_col_layer = False
     "If True, collision layer will draw normally"
+    use_render_cache = False
+    "If True, Renderable bakes layers that don't change, see LayerRenderCache"
     col_offset_x, col_offset_y = 0., 0.
     "Collision circle/box offset from origin"
     col_radius = 1.
@@ -144,6 +147,14 @@ class GameObject:
     """
     should_save = True
     "If True, write this object to state save files"
+    pool_size = 0
+    """
+    If >0, keep up to this many destroyed objects of this class, and reuse
+    them (with their renderables, art instance and collision) for new
+    spawns instead of creating new ones. See reset_pooled.
+    """
+    recycling = False
+    "Set while a pooled object is being reused, don't set manually!"
     serialized = ['name', 'x', 'y', 'z', 'art_src', 'visible', 'locked', 'y_sort',
                   'art_off_pct_x', 'art_off_pct_y', 'alpha', 'state', 'facing',
                   'animating', 'scale_x', 'scale_y']
@@ -158,7 +169,8 @@ class GameObject:
                    'scale_x': '_set_scale_x', 'scale_y': '_set_scale_y',
                    'name': '_rename', 'col_radius': '_set_col_radius',
                    'col_width': '_set_col_width',
-                   'col_height': '_set_col_height'
+                   'col_height': '_set_col_height',
+                   'update_if_outside_room': 'set_update_if_outside_room'
     }
     "If setting a given member should run some logic, specify the method here"
     selectable = True
@@ -182,7 +194,8 @@ class GameObject:
     update_if_outside_room = False
     """
     If True, object's update function will run even if it's
-    outside the world's current room
+    outside the world's current room. To change at runtime, use
+    set_update_if_outside_room so the world's object lists are rebuilt.
     """
     handle_key_events = False
     "If True, handle key input events passed in from world / input handler"
@@ -190,10 +203,23 @@ class GameObject:
     "If True, handle mouse click/wheel events passed in from world / input handler"
     consume_mouse_events = False
     "If True, prevent any other mouse click/wheel events from being processed"
+    def __new__(cls, world=None, *args, **kwargs):
+        # reuse a destroyed object from this class's pool if possible
+        if cls.pool_size > 0 and world:
+            obj = world.pools.get_object(cls)
+            if obj:
+                obj.recycling = True
+                return obj
+        return object.__new__(cls)
+    
     def __init__(self, world, obj_data=None):
         """
         Create new GameObject in world, from serialized data if provided.
         """
+        # pooled object being reused, skip the expensive parts of init
+        if self.recycling:
+            self.recycle(obj_data)
+            return
         self.x, self.y, self.z = 0., 0., 0.
         "Object's location in 3D space."
         self.scale_x, self.scale_y, self.scale_z = 1., 1., 1.
@@ -208,21 +234,7 @@ class GameObject:
         # apply serialized data before most of init happens
         # properties that need non-None defaults should be declared above
         if obj_data:
-            for v in self.serialized:
-                if not v in obj_data:
-                    if self.log_load:
-                        self.app.dev_log("Serialized property '%s' not found for %s" % (v, self.name))
-                    continue
-                # if value is in data and serialized list but undeclared, do so
-                if not hasattr(self, v):
-                    setattr(self, v, None)
-                # match type of variable as declared, eg loc might be written as
-                # an int in the JSON so preserve its floatness
-                if getattr(self, v) is not None:
-                    src_type = type(getattr(self, v))
-                    setattr(self, v, src_type(obj_data[v]))
-                else:
-                    setattr(self, v, obj_data[v])
+            self.set_serialized_data(obj_data)
         self.vel_x, self.vel_y, self.vel_z = 0, 0, 0
         "Object's velocity in units per second. Derived from acceleration."
         self.move_x, self.move_y = 0, 0
@@ -270,25 +282,17 @@ class GameObject:
             return
         self.renderable = GameObjectRenderable(self.app, self.art, self)
         self.renderable.alpha = self.alpha
-        self.origin_renderable = OriginIndicatorRenderable(self.app, self)
-        "Renderable for debug drawing of object origin."
-        self.bounds_renderable = BoundsIndicatorRenderable(self.app, self)
-        "1px LineRenderable showing object's bounding box"
+        self.origin_renderable = None
+        "Renderable for debug drawing of object origin, created on first use."
+        self.bounds_renderable = None
+        "1px LineRenderable showing object's bounding box, created on first use"
         for art in self.arts.values():
-            if not art in self.world.art_loaded:
-                self.world.art_loaded.append(art)
+            self.world.add_art_loaded(art)
         self.orig_collision_type = self.collision_type
         "Remember last collision type for enable/disable - don't set manually!"
         self.collision = Collideable(self)
         self.world.new_objects[self.name] = self
-        self.attachments = []
-        if self.attachment_classes:
-            for atch_name,atch_class_name in self.attachment_classes.items():
-                atch_class = self.world.classes[atch_class_name]
-                attachment = atch_class(self.world)
-                self.attachments.append(attachment)
-                attachment.attach_to(self)
-                setattr(self, atch_name, attachment)
+        self.create_attachments()
         self.should_destroy = False
         "If True, object will be destroyed on next world update."
         self.pre_first_update_run = False
@@ -304,6 +308,128 @@ class GameObject:
         if self.log_spawn:
             self.app.log('Spawned %s with Art %s' % (self.name, os.path.basename(self.art.filename)))
     
+    def set_serialized_data(self, obj_data):
+        "Set serialized properties found in given data dict."
+        for v in self.serialized:
+            if not v in obj_data:
+                if self.log_load:
+                    self.app.dev_log("Serialized property '%s' not found for %s" % (v, self.name))
+                continue
+            # if value is in data and serialized list but undeclared, do so
+            if not hasattr(self, v):
+                setattr(self, v, None)
+            # match type of variable as declared, eg loc might be written as
+            # an int in the JSON so preserve its floatness
+            if getattr(self, v) is not None:
+                src_type = type(getattr(self, v))
+                setattr(self, v, src_type(obj_data[v]))
+            else:
+                setattr(self, v, obj_data[v])
+    
+    def create_attachments(self):
+        "Spawn objects listed in attachment_classes and attach them to us."
+        self.attachments = []
+        if not self.attachment_classes:
+            return
+        for atch_name,atch_class_name in self.attachment_classes.items():
+            atch_class = self.world.classes[atch_class_name]
+            attachment = atch_class(self.world)
+            self.attachments.append(attachment)
+            attachment.attach_to(self)
+            setattr(self, atch_name, attachment)
+    
+    def recycle(self, obj_data=None):
+        """
+        Reset this destroyed, pooled object to the state a new spawn would
+        have, keeping its renderables and art instance.
+        Runs from __init__ in place of normal init, see pool_size.
+        """
+        self.recycling = False
+        # forget anything set on us that overrides a class default
+        for v in list(self.__dict__.keys()):
+            if hasattr(type(self), v):
+                delattr(self, v)
+        self.x, self.y, self.z = 0., 0., 0.
+        self.scale_x, self.scale_y, self.scale_z = 1., 1., 1.
+        self.rooms = {}
+        self.state = DEFAULT_STATE
+        self.facing = GOF_FRONT
+        # new name, so nothing holding on to our old one mistakes us for it
+        self.pool_uses = getattr(self, 'pool_uses', 0) + 1
+        self.name = '%s_%s' % (self.get_unique_name(), self.pool_uses)
+        if obj_data:
+            self.set_serialized_data(obj_data)
+        self.vel_x, self.vel_y, self.vel_z = 0, 0, 0
+        self.move_x, self.move_y = 0, 0
+        self.last_x, self.last_y, self.last_z = self.x, self.y, self.z
+        self.last_update_end = 0
+        self.flip_x = False
+        self.destroy_time = 0
+        if self.lifespan > 0:
+            self.set_destroy_timer(self.lifespan)
+        self.timer_functions_pre_update = {}
+        self.timer_functions_update = {}
+        self.timer_functions_post_update = {}
+        self.last_update_failed = False
+        # art_src may differ if given in data, reuse art instance if not
+        old_art = self.art
+        if self.generate_art:
+            self.art_src = '%s_art' % self.name
+        else:
+            self.arts = {}
+            self.load_arts()
+            for art in self.arts.values():
+                self.world.add_art_loaded(art)
+        if self.art is None:
+            self.art = old_art
+        new_art = self.art
+        if self.use_art_instance:
+            if isinstance(old_art, ArtInstance) and old_art.source is new_art:
+                new_art = old_art
+            elif not isinstance(new_art, ArtInstance):
+                new_art = ArtInstance(new_art)
+        self.art = old_art
+        self.set_art(new_art, False)
+        self.renderable.alpha = self.alpha
+        self.renderable.animating = False
+        self.renderable.set_frame(self.art.active_frame or 0)
+        if self.renderable.palette_remap:
+            self.renderable.palette_remap.reset()
+        self.orig_collision_type = self.collision_type
+        self.collision.restore_shapes()
+        self.world.new_objects[self.name] = self
+        self.create_attachments()
+        self.should_destroy = False
+        self.pre_first_update_run = False
+        self.last_state = None
+        self.last_warp_update = -1
+        if self.animating and self.art.frames > 0:
+            self.start_animating()
+        self.reset_pooled()
+        if self.log_spawn:
+            self.app.log('Reused %s with Art %s' % (self.name, os.path.basename(self.art.filename)))
+    
+    def reset_pooled(self):
+        """
+        Run when a pooled object is reused, after it's been reset to class
+        defaults and before the rest of its class's __init__ runs. Subclasses
+        should reset anything here that a new object wouldn't have, eg
+        changes made to an ArtInstance.
+        """
+        pass
+    
+    def get_origin_renderable(self):
+        "Return our origin debug renderable, creating it if needed."
+        if not self.origin_renderable:
+            self.origin_renderable = OriginIndicatorRenderable(self.app, self)
+        return self.origin_renderable
+    
+    def get_bounds_renderable(self):
+        "Return our bounding box debug renderable, creating it if needed."
+        if not self.bounds_renderable:
+            self.bounds_renderable = BoundsIndicatorRenderable(self.app, self)
+        return self.bounds_renderable
+    
     def get_unique_name(self):
         "Generate and return a somewhat human-readable unique name for object"
         name = str(self)
@@ -359,6 +485,29 @@ class GameObject:
         bottom = self.y - (self.renderable.height * (1 - self.art_off_pct_y))
         return left, top, right, bottom
     
+    def is_on_camera(self):
+        "Return True if any part of our art is within the camera's view."
+        left, top, right, bottom = self.get_edges()
+        off_x, off_y, off_z = self.get_render_offset()
+        left, right = left + off_x, right + off_x
+        top, bottom = top + off_y, bottom + off_y
+        # view is a frustum, check area visible at nearest and furthest layer
+        view_left = view_top = view_right = view_bottom = None
+        z = self.z + off_z
+        for layer_z in (min(self.art.layers_z), max(self.art.layers_z)):
+            bounds = self.app.camera.get_visible_bounds(z + layer_z)
+            if not bounds:
+                return True
+            if view_left is None:
+                view_left, view_top, view_right, view_bottom = bounds
+                continue
+            view_left = min(view_left, bounds[0])
+            view_top = max(view_top, bounds[1])
+            view_right = max(view_right, bounds[2])
+            view_bottom = min(view_bottom, bounds[3])
+        return left <= view_right and right >= view_left and \
+            bottom <= view_top and top >= view_bottom
+    
     def distance_to_object(self, other):
         "Return distance from center of this object to center of given object."
         return self.distance_to_point(other.x, other.y)
@@ -382,6 +531,14 @@ class GameObject:
         inv_dist = 1 / dist
         return dx * inv_dist, dy * inv_dist
     
+    def can_see(self, other, collision_filter=None):
+        """
+        Return True if no colliding object (passing given CollisionFilter)
+        lies between the centers of this object and given object.
+        """
+        return self.world.has_line_of_sight(self.x, self.y, other.x, other.y,
+                                            collision_filter, [self, other])
+    
     def get_render_offset(self):
         "Return a custom render offset. Override this in subclasses as needed."
         return 0, 0, 0
@@ -502,7 +659,9 @@ class GameObject:
     
     def get_contacting_objects(self):
         "Return list of all objects we're currently contacting."
-        return [self.world.objects[obj] for obj in self.collision.contacts]
+        # contacts with destroyed objects are only removed on next update
+        return [self.world.objects[obj] for obj in self.collision.contacts
+                if obj in self.world.objects]
     
     def get_collisions(self):
         "Return list of all overlapping shapes our shapes should collide with."
@@ -693,7 +852,8 @@ class GameObject:
             return
         self.art = new_art
         self.renderable.set_art(self.art)
-        self.bounds_renderable.set_art(self.art)
+        if self.bounds_renderable:
+            self.bounds_renderable.set_art(self.art)
         if self.collision_shape_type == CST_TILE:
             self.collision.create_shapes()
         if (start_animating or self.animating) and new_art.frames > 1:
@@ -737,18 +897,26 @@ class GameObject:
     def _set_col_radius(self, new_radius):
         self.col_radius = new_radius
         self.collision.shapes[0].radius = new_radius
+        self.world.cl.shape_moved(self.collision.shapes[0])
     
     def _set_col_width(self, new_width):
         self.col_width = new_width
         self.collision.shapes[0].halfwidth = new_width / 2
+        self.world.cl.shape_moved(self.collision.shapes[0])
     
     def _set_col_height(self, new_height):
         self.col_height = new_height
         self.collision.shapes[0].halfheight = new_height / 2
+        self.world.cl.shape_moved(self.collision.shapes[0])
     
     def _set_alpha(self, new_alpha):
         self.renderable.alpha = self.alpha = new_alpha
     
+    def set_update_if_outside_room(self, update):
+        "Set whether we update while outside the world's current room."
+        self.update_if_outside_room = update
+        self.world.object_lists_changed()
+    
     def allow_move(self, dx, dy):
         "Return True only if this object is allowed to move based on input."
         return True
@@ -916,7 +1084,11 @@ class GameObject:
         # add to slot-appropriate dict
         d = [self.timer_functions_pre_update, self.timer_functions_update,
              self.timer_functions_post_update][slot]
+        # timer with same name in same slot is replaced
+        if timer_name in d:
+            self.world.timers.timers_stopped()
         d[timer_name] = timer
+        self.world.timers.add_timer(timer)
     
     def stop_timer_function(self, timer_name):
         "Stop currently running timer function with given name."
@@ -926,9 +1098,11 @@ class GameObject:
         if not timer:
             self.app.log('Timer named %s not found on object %s' % (timer_name,
                                                                     self.name))
+            return
         d = [self.timer_functions_pre_update, self.timer_functions_update,
              self.timer_functions_post_update][timer.slot]
         d.pop(timer_name)
+        self.world.timers.timers_stopped()
     
     def update_state(self):
         "Update object state based on current context, eg movement."
@@ -984,7 +1158,8 @@ class GameObject:
     
     def fast_move(self):
         """
-        Subdivide object's move this frame into steps to avoid tunneling.
+        Sweep object's collision along its move this frame, and stop it just
+        past the first shape it hits, to avoid tunneling.
         Only called for objects with fast_move_steps >0.
         """
         final_x, final_y = self.x, self.y
@@ -1002,21 +1177,21 @@ class GameObject:
             step_x, step_y = self.col_width * dir_x, self.col_height * dir_y
             step_dist = math.sqrt(step_x ** 2 + step_y ** 2)
         step_dist /= self.fast_move_steps
-        # if object isn't moving fast enough, don't step
+        # if object isn't moving fast enough to tunnel, don't sweep
         if total_move_dist <= step_dist:
             return
-        steps = int(total_move_dist / step_dist)
-        # start stepping from beginning of this frame's move distance
+        # sweep from beginning of this frame's move
         self.x, self.y = self.last_x, self.last_y
-        for i in range(steps):
-            self.x += dir_x * step_dist
-            self.y += dir_y * step_dist
-            collisions = self.get_collisions()
-            # if overlapping just leave as-is, collision update will resolve
-            if len(collisions) > 0:
-                return
-        # ran through all steps without a hit, set back to final position
-        self.x, self.y = final_x, final_y
+        self.collision.update_transform_from_object()
+        hit_time, hit_shape = self.world.cl.sweep_object(self, dx, dy)
+        if hit_time is None:
+            # nothing in the way, set back to final position
+            self.x, self.y = final_x, final_y
+            return
+        # stop just past first contact, collision update will resolve
+        hit_time = min(1, hit_time + self.world.cl.sweep_skin * inv_dist)
+        self.x = self.last_x + dx * hit_time
+        self.y = self.last_y + dy * hit_time
     
     def get_time_since_last_update(self):
         "Return time (in milliseconds) since end of this object's last update."
@@ -1053,10 +1228,10 @@ class GameObject:
         """
         # even if debug viz are off, update once on init to set correct state
         if self.show_origin or self in self.world.selected_objects:
-            self.origin_renderable.update()
+            self.get_origin_renderable().update()
         if self.show_bounds or self in self.world.selected_objects or \
            (self is self.world.hovered_focus_object and self.selectable):
-            self.bounds_renderable.update()
+            self.get_bounds_renderable().update()
         if self.show_collision and self.is_dynamic():
             self.collision.update_renderables()
         if self.visible:
@@ -1099,10 +1274,10 @@ class GameObject:
         if not self.world.app.ui.is_game_edit_ui_visible():
             return
         if self.show_origin or self in self.world.selected_objects:
-            self.origin_renderable.render()
+            self.get_origin_renderable().render()
         if self.show_bounds or self in self.world.selected_objects or \
            (self.selectable and self is self.world.hovered_focus_object):
-            self.bounds_renderable.render()
+            self.get_bounds_renderable().render()
         if self.show_collision and self.collision_type != CT_NONE:
             self.collision.render()
     
@@ -1145,13 +1320,24 @@ class GameObject:
             if hasattr(self.spawner, 'spawned_objects') and \
                self in self.spawner.spawned_objects:
                 self.spawner.spawned_objects.remove(self)
-        self.origin_renderable.destroy()
-        self.bounds_renderable.destroy()
-        self.collision.destroy()
         for attachment in self.attachments:
             attachment.destroy()
-        self.renderable.destroy()
+        if self.pool_size > 0:
+            # keep renderables for reuse, GameWorld pools us after update
+            self.collision.remove_shapes()
+        else:
+            self.destroy_renderables()
         self.should_destroy = True
+        self.world.object_destroyed(self)
+    
+    def destroy_renderables(self):
+        "Destroy our renderables (including collision's) and their GL resources."
+        if self.origin_renderable:
+            self.origin_renderable.destroy()
+        if self.bounds_renderable:
+            self.bounds_renderable.destroy()
+        self.collision.destroy()
+        self.renderable.destroy()
 
 
 class GameObjectTimerFunction:
@@ -121,6 +121,7 @@ class GameRoom:
         "Add object (by reference) to this room."
         self.objects[obj.name] = obj
         obj.rooms[self.name] = self
+        self.world.object_lists_changed()
     
     def remove_object_by_name(self, obj_name):
         "Remove object with given name from this room."
@@ -140,6 +141,7 @@ class GameRoom:
             obj.rooms.pop(self.name)
         else:
             self.world.app.log("GameObject %s not found in GameRoom %s" % (obj.name, self.name))
+        self.world.object_lists_changed()
     
     def get_dict(self):
         "Return a dict that GameWorld.save_to_file can dump to JSON"
@@ -193,3 +195,4 @@ class GameRoom:
         for obj in self.objects.values():
             obj.rooms.pop(self.name)
         self.objects = {}
+        self.world.object_lists_changed()
@@ -44,12 +44,14 @@ class StaticTileBG(GameObject):
     collision_shape_type = CST_TILE
     collision_type = CT_GENERIC_STATIC
     physics_move = False
+    use_render_cache = True
 
 class StaticTileObject(GameObject):
     collision_shape_type = CST_TILE
     collision_type = CT_GENERIC_STATIC
     physics_move = False
     y_sort = True
+    use_render_cache = True
 
 class StaticBoxObject(GameObject):
     "Generic static world object with AABB-based (rectangle) collision"
@@ -62,6 +64,21 @@ class DynamicBoxObject(GameObject):
     collision_type = CT_GENERIC_DYNAMIC
     y_sort = True
 
+class CollisionBenchmarkCircle(GameObject):
+    "Dynamic circle spawned by CollisionLord.run_benchmark - system use only!"
+    collision_shape_type = CST_CIRCLE
+    collision_type = CT_GENERIC_DYNAMIC
+    col_radius = 0.5
+    should_save = False
+    exclude_from_object_list = True
+    exclude_from_class_list = True
+
+class CollisionBenchmarkBox(StaticBoxObject):
+    "Static box spawned by CollisionLord.run_benchmark - system use only!"
+    should_save = False
+    exclude_from_object_list = True
+    exclude_from_class_list = True
+
 class Pickup(GameObject):
     collision_shape_type = CST_CIRCLE
     collision_type = CT_GENERIC_DYNAMIC
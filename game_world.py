@@ -1,5 +1,5 @@
 
-import os, sys, math, time, importlib, json, traceback
+import os, sys, math, time, importlib, json, traceback, heapq, itertools
 from collections import namedtuple
 
 import sdl2
@@ -8,7 +8,8 @@ import game_object, game_util_objects, game_hud, game_room
 import collision, vector
 from camera import Camera
 from grid import GameGrid
-from art import ART_DIR
+from renderable_line import LineBatch
+from art import ART_DIR, ArtFromDisk
 from charset import CHARSET_DIR
 from palette import PALETTE_DIR
 
@@ -50,6 +51,148 @@ class GameCamera(Camera):
     pan_friction = 0.2
     use_bounds = False
 
+
+class TimerScheduler:
+    
+    """
+    Runs GameObjectTimerFunctions for a GameWorld: one min-heap per timer
+    slot, ordered by next execution time, so each update only touches timers
+    that are due. Stopped timers are dropped lazily when they come due.
+    """
+    
+    def __init__(self, world):
+        self.world = world
+        self.reset()
+    
+    def reset(self):
+        # per slot heaps of (next execution time, order added, timer)
+        self.heaps = [[], [], []]
+        # per slot lists of due timers whose objects are outside current room
+        self.waiting = [[], [], []]
+        self.order = itertools.count()
+        # stopped timers possibly still in heaps, see timers_stopped
+        self.stopped_count = 0
+    
+    def add_timer(self, timer):
+        "Schedule given timer at its next execution time."
+        item = (timer.next_update, next(self.order), timer)
+        heapq.heappush(self.heaps[timer.slot], item)
+    
+    def timers_stopped(self, count=1):
+        "Note given number of timers stopped, pruning heaps if mostly stopped."
+        self.stopped_count += count
+        if self.stopped_count > max(64, sum([len(h) for h in self.heaps]) // 2):
+            self.prune()
+    
+    def is_running(self, timer):
+        "Return True if given timer hasn't been stopped or replaced."
+        go = timer.go
+        timers = [go.timer_functions_pre_update, go.timer_functions_update,
+                  go.timer_functions_post_update][timer.slot]
+        return not go.should_destroy and timers.get(timer.name, None) is timer
+    
+    def prune(self):
+        "Remove stopped timers from heaps."
+        for slot,heap in enumerate(self.heaps):
+            heap = [item for item in heap if self.is_running(item[2])]
+            heapq.heapify(heap)
+            self.heaps[slot] = heap
+        self.waiting = [[timer for timer in waiting if self.is_running(timer)]
+                        for waiting in self.waiting]
+        self.stopped_count = 0
+    
+    def rooms_changed(self):
+        "Reschedule waiting timers, their objects might be updating now."
+        for waiting in self.waiting:
+            for timer in waiting:
+                self.add_timer(timer)
+        self.waiting = [[], [], []]
+    
+    def update(self, slot):
+        "Run all due timers in given slot, in order of execution time."
+        heap = self.heaps[slot]
+        now = self.world.get_elapsed_time()
+        # timers to reschedule once done: ones whose objects haven't had
+        # their first update yet, and ones that ran (overdue timers catch up
+        # one execution per update, not all at once)
+        deferred = []
+        while heap and heap[0][0] <= now:
+            timer = heapq.heappop(heap)[2]
+            if not self.is_running(timer):
+                continue
+            go = timer.go
+            if self.world.objects.get(go.name, None) is not go or \
+               (slot == game_object.TIMER_PRE_UPDATE and not go.pre_first_update_run):
+                deferred.append(timer)
+                continue
+            # objects outside current room don't update, nor do their timers
+            if not go.is_in_current_room() and not go.update_if_outside_room:
+                self.waiting[slot].append(timer)
+                continue
+            timer.update()
+            deferred.append(timer)
+        for timer in deferred:
+            if self.is_running(timer):
+                self.add_timer(timer)
+
+class ObjectPools:
+    
+    """
+    Keeps destroyed objects of classes with pool_size > 0, so spawning
+    another object of that class can reuse one - along with its renderables,
+    art instance and collision - instead of creating all of those again.
+    """
+    
+    def __init__(self, world):
+        self.world = world
+        # class: list of pooled objects
+        self.pools = {}
+        # class name: number of spawns that did / didn't reuse an object
+        self.hits, self.misses = {}, {}
+    
+    def get_object(self, obj_class):
+        "Return a pooled object of given class, or None if none are pooled."
+        class_name = obj_class.__name__
+        pool = self.pools.get(obj_class, None)
+        if not pool:
+            self.misses[class_name] = self.misses.get(class_name, 0) + 1
+            return None
+        self.hits[class_name] = self.hits.get(class_name, 0) + 1
+        return pool.pop()
+    
+    def add_object(self, obj):
+        "Pool given destroyed object if its pool has room, else finish it off."
+        pool = self.pools.setdefault(type(obj), [])
+        if len(pool) < obj.pool_size:
+            pool.append(obj)
+        else:
+            obj.destroy_renderables()
+    
+    def clear(self):
+        "Destroy all pooled objects' renderables and empty pools."
+        for pool in self.pools.values():
+            for obj in pool:
+                obj.destroy_renderables()
+        self.pools = {}
+    
+    def get_stats(self):
+        "Return dict of class name: (objects pooled, hits, misses)."
+        stats = {}
+        for class_name in set(self.hits) | set(self.misses):
+            stats[class_name] = [0, self.hits.get(class_name, 0),
+                                 self.misses.get(class_name, 0)]
+        for obj_class,pool in self.pools.items():
+            stats.setdefault(obj_class.__name__, [0, 0, 0])[0] += len(pool)
+        return {class_name: tuple(s) for class_name,s in stats.items()}
+    
+    def report(self):
+        "Print (not log) pool stats."
+        for class_name,(pooled, hits, misses) in sorted(self.get_stats().items()):
+            total = hits + misses
+            hit_pct = 100 * hits / total if total else 0
+            print('%s pool: %s pooled, %s hits, %s misses (%.1f%% reused)' % (class_name, pooled, hits, misses, hit_pct))
+
+
 class GameWorld:
     """
     Holds global state for Game Mode. Spawns, manages, and renders GameObjects.
@@ -87,8 +230,14 @@ class GameWorld:
     "If True, show all rooms not just current one."
     draw_debug_objects = True
     "If False, objects with is_debug=True won't be drawn."
+    cull_offscreen_objects = True
+    "If True, objects entirely outside the camera's view won't be drawn."
     room_camera_changes_enabled = True
     "If True, snap camera to new room's associated camera marker."
+    reload_on_script_change = True
+    "If True, reset game as soon as one of its scripts changes on disk."
+    reload_on_art_change = True
+    "If True, reload game art as soon as its file changes on disk."
     list_only_current_room_objects = False
     "If True, list UI will only show objects in current room."
     builtin_module_names = ['game_object', 'game_util_objects', 'game_hud',
@@ -117,6 +266,8 @@ class GameWorld:
         self.camera = GameCamera(self.app)
         self.grid = GameGrid(self.app)
         self.grid.visible = False
+        self.debug_lines = LineBatch(self.app)
+        "Draws all objects' origin, bounds and collision lines at once"
         self.player = None
         self.paused = False
         self._pause_time = 0
@@ -130,6 +281,22 @@ class GameWorld:
         "Dict of objects by name:object"
         self.new_objects = {}
         "Dict of just-spawned objects, added to above on update() after spawn"
+        self.objects_by_class = {}
+        "Dict of class name:{object name:object}, for every class each object is an instance of"
+        self.objects_awaiting_first_update = {}
+        "Dict of objects by name:object that haven't run pre_first_update yet"
+        self.timers = TimerScheduler(self)
+        "Runs objects' timer functions when they're due"
+        self.pools = ObjectPools(self)
+        "Destroyed objects kept for reuse, for classes with pool_size > 0"
+        self.destroyed_objects = []
+        "Objects destroyed since last update, removed from objects at its end"
+        self.room_objects = []
+        "List of objects in current room, or in no rooms"
+        self.active_objects = []
+        "List of objects to update: room_objects plus update_if_outside_room ones"
+        self.object_lists_stale = True
+        "If True, room_objects and active_objects need rebuilding"
         self.rooms = {}
         "Dict of rooms by name:room"
         self.current_room = None
@@ -404,8 +571,7 @@ class GameWorld:
         # load game
         self.set_game_dir(new_game_dir)
         self.properties = self.spawn_object_of_class('WorldPropertiesObject')
-        self.objects.update(self.new_objects)
-        self.new_objects = {}
+        self.add_new_objects()
         # HACK: set some property defaults, no idea why they don't take :[
         self.collision_enabled = self.properties.collision_enabled = True
         self.game_title = self.properties.game_title = new_game_title
@@ -416,6 +582,9 @@ class GameWorld:
         "Unload currently loaded game."
         for obj in self.objects.values():
             obj.destroy()
+        # hand pooled objects back to their pools, then empty those
+        self.remove_destroyed_objects()
+        self.pools.clear()
         self.cl.reset()
         self.camera.reset()
         self.player = None
@@ -425,33 +594,84 @@ class GameWorld:
             self.hud.destroy()
             self.hud = None
         self.objects, self.new_objects = {}, {}
+        self.objects_by_class, self.objects_awaiting_first_update = {}, {}
+        self.timers.reset()
+        self.pools = ObjectPools(self)
+        self.destroyed_objects = []
         self.rooms = {}
+        self.object_lists_changed()
         # art_loaded is cleared when game dir is set
         self.selected_objects = []
         self.app.al.stop_all_music()
     
     def get_first_object_of_type(self, class_name, allow_subclasses=True):
         "Return first object found with given class name."
-        c = self.get_class_by_name(class_name)
-        for obj in self.objects.values():
-            # use isinstance so we catch subclasses
-            if c and allow_subclasses:
-                if isinstance(obj, c):
-                    return obj
-            elif type(obj).__name__ == class_name:
+        # index includes subclasses, filter them out if not wanted
+        for obj in self.objects_by_class.get(class_name, {}).values():
+            if allow_subclasses or type(obj).__name__ == class_name:
                 return obj
     
     def get_all_objects_of_type(self, class_name, allow_subclasses=True):
         "Return list of all objects found with given class name."
-        c = self.get_class_by_name(class_name)
-        objects = []
+        objects = self.objects_by_class.get(class_name, {}).values()
+        if allow_subclasses:
+            return list(objects)
+        return [obj for obj in objects if type(obj).__name__ == class_name]
+    
+    def add_new_objects(self):
+        "Add just-spawned objects to objects dict and indexes."
+        for obj in self.new_objects.values():
+            self.objects[obj.name] = obj
+            self.index_object(obj)
+        self.new_objects = {}
+    
+    def index_object(self, obj):
+        "Add given object to class and room indexes."
+        for c in type(obj).__mro__:
+            self.objects_by_class.setdefault(c.__name__, {})[obj.name] = obj
+        if not obj.pre_first_update_run:
+            self.objects_awaiting_first_update[obj.name] = obj
+        # new objects go on the end of objects, so lists stay in its order
+        if not self.object_lists_stale:
+            if obj.is_in_current_room():
+                self.room_objects.append(obj)
+                self.active_objects.append(obj)
+            elif obj.update_if_outside_room:
+                self.active_objects.append(obj)
+    
+    def unindex_object(self, obj):
+        "Remove given object from class and room indexes."
+        for c in type(obj).__mro__:
+            objects = self.objects_by_class.get(c.__name__, {})
+            if objects.get(obj.name, None) is obj:
+                objects.pop(obj.name)
+        if self.objects_awaiting_first_update.get(obj.name, None) is obj:
+            self.objects_awaiting_first_update.pop(obj.name)
+    
+    def object_lists_changed(self):
+        """
+        Flag room_objects and active_objects for rebuild; run when current
+        room, any object's rooms or update_if_outside_room change.
+        """
+        self.object_lists_stale = True
+        self.timers.rooms_changed()
+    
+    def update_object_lists(self):
+        "Rebuild room_objects and active_objects, if needed."
+        if not self.object_lists_stale:
+            return
+        self.room_objects, self.active_objects = [], []
         for obj in self.objects.values():
-            if c and allow_subclasses:
-                if isinstance(obj, c):
-                    objects.append(obj)
-            elif type(obj).__name__ == class_name:
-                objects.append(obj)
-        return objects
+            if obj.is_in_current_room():
+                self.room_objects.append(obj)
+                self.active_objects.append(obj)
+            elif obj.update_if_outside_room:
+                self.active_objects.append(obj)
+        self.object_lists_stale = False
+    
+    def object_destroyed(self, obj):
+        "Queue given object for removal at end of next update."
+        self.destroyed_objects.append(obj)
     
     def set_for_all_objects(self, name, value):
         "Set given variable name to given value for all objects."
@@ -484,7 +704,7 @@ class GameWorld:
             self.load_game_state(DEFAULT_STATE_FILENAME)
             return
         # loading a new game, wipe art list
-        self.art_loaded = []
+        self.clear_art_loaded()
         # check in user documents dir first
         game_dir = TOP_GAME_DIR + dir_name
         doc_game_dir = self.app.documents_dir + game_dir
@@ -572,6 +792,54 @@ class GameWorld:
                 self.modules[module_name] = m
             except Exception as e:
                 self.app.log_import_exception(e, module_name)
+        # watch this game's scripts, forget any previous game's
+        self.app.fw.unwatch(callback=self.script_changed)
+        for module_name,m in self.modules.items():
+            if not module_name in self.builtin_module_names:
+                self.app.fw.watch(m.__file__, self.script_changed)
+    
+    def script_changed(self, filename):
+        "Reset game when one of its scripts changes."
+        if not self.reload_on_script_change or not self.game_dir:
+            return
+        self.app.log('%s changed, reloading game' % filename)
+        self.reset_game()
+    
+    def add_art_loaded(self, art):
+        "Track given art as used by this game, and reload it when it changes."
+        if art in self.art_loaded:
+            return
+        self.art_loaded.append(art)
+        self.app.fw.watch(art.filename, self.art_changed)
+    
+    def clear_art_loaded(self):
+        self.art_loaded = []
+        self.app.fw.unwatch(callback=self.art_changed)
+    
+    def art_changed(self, filename):
+        if not self.reload_on_art_change:
+            return
+        for art in self.art_loaded:
+            if art.filename != filename or not isinstance(art, ArtFromDisk):
+                continue
+            try:
+                mtime = os.path.getmtime(filename)
+            except OSError:
+                continue
+            # nothing to do if we just saved this file ourselves
+            if mtime == art.saved_mtime:
+                continue
+            # don't clobber edits made in Art Mode
+            if art.unsaved_changes:
+                self.app.log('%s changed on disk, but has unsaved changes - not reloading' % filename)
+                continue
+            if not art.reload_from_disk():
+                continue
+            # shapes (eg tile collision) are built from art contents
+            for obj in self.objects.values():
+                if obj.art is art:
+                    obj.collision.create_shapes()
+            self.app.log('Reloaded %s' % filename)
     
     def toggle_pause(self):
         "Toggles game pause state."
@@ -622,6 +890,24 @@ class GameWorld:
                     self.try_object_method(obj, obj.handle_key_up, args)
                 # TODO: handle_ functions for other types of input
     
+    def get_collision_filter(self, include_object_names=[],
+                             include_class_names=[],
+                             exclude_object_names=[],
+                             exclude_class_names=[],
+                             include_collision_types=[],
+                             exclude_collision_types=[]):
+        """
+        Return a CollisionFilter for collision queries, eg get_colliders_in_box.
+        Build once and reuse for queries made every update.
+        Includes are processed before excludes.
+        """
+        return collision.CollisionFilter(self, include_object_names,
+                                         include_class_names,
+                                         exclude_object_names,
+                                         exclude_class_names,
+                                         include_collision_types,
+                                         exclude_collision_types)
+    
     def get_colliders_at_point(self, point_x, point_y,
                                include_object_names=[],
                                include_class_names=[],
@@ -629,71 +915,52 @@ class GameWorld:
                                exclude_class_names=[]):
         """
         Return lists of colliding objects and shapes at given point that pass
-        given filters.
+        given filters, nearest first.
         Includes are processed before excludes.
         """
-        whitelist_objects = len(include_object_names) > 0
-        whitelist_classes = len(include_class_names) > 0
-        blacklist_objects = len(exclude_object_names) > 0
-        blacklist_classes = len(exclude_class_names) > 0
-        # build list of objects to check
-        # always ignore non-colliders
-        colliders = []
-        for obj in self.objects.values():
-            if obj.should_collide():
-                colliders.append(obj)
-        check_objects = []
-        if whitelist_objects or whitelist_classes:
-            # list of class names -> list of classes
-            include_classes = [self.get_class_by_name(class_name) for class_name in include_class_names]
-            # only given objects of given classes
-            if whitelist_objects and whitelist_classes:
-                for obj_name in include_object_names:
-                    obj = self.objects[obj_name]
-                    for c in include_classes:
-                        if isinstance(obj, c) and not obj in check_objects:
-                            check_objects.append(obj)
-            # only given objects of any class
-            elif whitelist_objects and not whitelist_classes:
-                check_objects += [self.objects[obj_name] for obj_name in include_object_names]
-            # all colliders of given classes
-            elif whitelist_classes:
-                for obj in colliders:
-                    for c in include_classes:
-                        if isinstance(obj, c) and not obj in check_objects:
-                            check_objects.append(obj)
-        else:
-            check_objects = colliders[:]
-        check_objects_unfiltered = check_objects[:]
-        if blacklist_objects or blacklist_classes:
-            exclude_classes = [self.get_class_by_name(class_name) for class_name in exclude_class_names]
-            for obj in check_objects_unfiltered:
-                if obj.name in exclude_object_names:
-                    check_objects.remove(obj)
-                    continue
-                for c in exclude_classes:
-                    if isinstance(obj, c):
-                        check_objects.remove(obj)
-        # check all objects that passed the filter(s) and build hit list
-        hit_objects = []
-        hit_shapes = []
-        for obj in check_objects:
-            # check bounds
-            if not obj.is_point_inside(point_x, point_y):
-                continue
-            # point overlaps with tile collision?
-            if obj.collision_shape_type == collision.CST_TILE:
-                tile_x, tile_y = obj.get_tile_at_point(point_x, point_y)
-                if (tile_x, tile_y) in obj.collision.tile_shapes:
-                    hit_objects.append(obj)
-                    hit_shapes.append(obj.collision.tile_shapes[(tile_x, tile_y)])
-            else:
-                # point overlaps with primitive shape(s)?
-                for shape in obj.collision.shapes:
-                    if shape.is_point_inside(point_y, point_y):
-                        hit_objects.append(obj)
-                        hit_shapes.append(shape)
-        return hit_objects, hit_shapes
+        collision_filter = self.get_collision_filter(include_object_names,
+                                                     include_class_names,
+                                                     exclude_object_names,
+                                                     exclude_class_names)
+        shapes = self.cl.get_shapes_at_point(point_x, point_y, collision_filter)
+        return [shape.go for shape in shapes], shapes
+    
+    def get_colliders_in_box(self, left, top, right, bottom,
+                             collision_filter=None):
+        """
+        Return lists of colliding objects and shapes overlapping given box
+        that pass given CollisionFilter, nearest its center first.
+        """
+        shapes = self.cl.get_shapes_in_box(left, top, right, bottom,
+                                           collision_filter)
+        return [shape.go for shape in shapes], shapes
+    
+    def get_colliders_in_circle(self, x, y, radius, collision_filter=None):
+        """
+        Return lists of colliding objects and shapes overlapping given circle
+        that pass given CollisionFilter, nearest its center first.
+        """
+        shapes = self.cl.get_shapes_in_circle(x, y, radius, collision_filter)
+        return [shape.go for shape in shapes], shapes
+    
+    def raycast(self, x1, y1, x2, y2, collision_filter=None,
+                ignore_objects=[], first_hit_only=False):
+        """
+        Return list of RaycastHits (x, y, dist, shape, obj) for colliding
+        shapes passing given CollisionFilter on the line from x1,y1 to x2,y2,
+        nearest first, ignoring given objects.
+        """
+        return self.cl.raycast(x1, y1, x2, y2, collision_filter,
+                               ignore_objects, first_hit_only)
+    
+    def has_line_of_sight(self, x1, y1, x2, y2, collision_filter=None,
+                          ignore_objects=[]):
+        """
+        Return True if no colliding shapes passing given CollisionFilter,
+        except given objects', lie on the line from x1,y1 to x2,y2.
+        """
+        return self.cl.has_line_of_sight(x1, y1, x2, y2, collision_filter,
+                                         ignore_objects)
     
     def frame_begin(self):
         "Run at start of game loop iteration, before input/update/render."
@@ -725,20 +992,21 @@ class GameWorld:
     def pre_update(self):
         "Run GO and Room pre_updates before GameWorld.update"
         # add newly spawned objects to table
-        self.objects.update(self.new_objects)
-        self.new_objects = {}
-        # run pre_first_update / pre_update on all appropriate objects
-        for obj in self.objects.values():
-            if not obj.pre_first_update_run:
-                self.try_object_method(obj, obj.pre_first_update)
-                obj.pre_first_update_run = True
-            # only run pre_update if not paused
-            elif not self.paused and (obj.is_in_current_room() or obj.update_if_outside_room):
-                # update timers
-                # (copy timers list in case a timer removes itself from object)
-                for timer in list(obj.timer_functions_pre_update.values())[:]:
-                    timer.update()
+        self.add_new_objects()
+        self.update_object_lists()
+        # only run pre_update if not paused
+        if not self.paused:
+            self.timers.update(game_object.TIMER_PRE_UPDATE)
+            for obj in self.active_objects:
+                # objects get pre_first_update instead on their first update
+                if not obj.pre_first_update_run:
+                    continue
                 obj.pre_update()
+        # new objects were added last, so this is still in objects order
+        for obj in list(self.objects_awaiting_first_update.values()):
+            self.try_object_method(obj, obj.pre_first_update)
+            obj.pre_first_update_run = True
+        self.objects_awaiting_first_update = {}
         for room in self.rooms.values():
             if not room.pre_first_update_run:
                 room.pre_first_update()
@@ -750,15 +1018,13 @@ class GameWorld:
             self.properties.update_from_world()
         if not self.paused:
             # update objects based on movement, then resolve collisions
-            for obj in self.objects.values():
-                if obj.is_in_current_room() or obj.update_if_outside_room:
-                    # update timers
-                    for timer in list(obj.timer_functions_update.values())[:]:
-                        timer.update()
-                    self.try_object_method(obj, obj.update)
-                    # subclass update may not call GameObject.update,
-                    # set last update time here once we're sure it's done
-                    obj.last_update_end = self.get_elapsed_time()
+            self.update_object_lists()
+            self.timers.update(game_object.TIMER_UPDATE)
+            for obj in self.active_objects:
+                self.try_object_method(obj, obj.update)
+                # subclass update may not call GameObject.update,
+                # set last update time here once we're sure it's done
+                obj.last_update_end = self.get_elapsed_time()
             if self.collision_enabled:
                 self.cl.update()
             for room in self.rooms.values():
@@ -769,14 +1035,8 @@ class GameWorld:
             if s:
                 self.app.ui.debug_text.post_lines(s)
         # remove objects marked for destruction
-        to_destroy = []
-        for obj in self.objects.values():
-            if obj.should_destroy:
-                to_destroy.append(obj.name)
-        for obj_name in to_destroy:
-            self.objects.pop(obj_name)
-        if len(to_destroy) > 0:
-            self.app.ui.edit_list_panel.items_changed()
+        if len(self.destroyed_objects) > 0:
+            self.remove_destroyed_objects()
         if self.hud:
             self.hud.update()
         if self.paused:
@@ -784,31 +1044,62 @@ class GameWorld:
         else:
             self.updates += 1
     
+    def remove_destroyed_objects(self):
+        "Remove objects destroyed since last update from objects and indexes."
+        removed = []
+        stopped_timers = 0
+        # objects spawned and destroyed this update haven't been added yet
+        not_added = []
+        for obj in self.destroyed_objects:
+            if self.objects.get(obj.name, None) is obj:
+                self.objects.pop(obj.name)
+                self.unindex_object(obj)
+                removed.append(obj)
+                if obj.pool_size > 0:
+                    self.pools.add_object(obj)
+                stopped_timers += len(obj.timer_functions_pre_update) + \
+                                  len(obj.timer_functions_update) + \
+                                  len(obj.timer_functions_post_update)
+            elif self.new_objects.get(obj.name, None) is obj:
+                not_added.append(obj)
+        self.destroyed_objects = not_added
+        if len(removed) == 0:
+            return
+        if stopped_timers > 0:
+            self.timers.timers_stopped(stopped_timers)
+        if not self.object_lists_stale:
+            self.room_objects = [obj for obj in self.room_objects if not obj.should_destroy]
+            self.active_objects = [obj for obj in self.active_objects if not obj.should_destroy]
+        self.app.ui.edit_list_panel.items_changed()
+    
     def post_update(self):
         "Run after GameWorld.update."
         if self.paused:
             return
-        for obj in self.objects.values():
-            if obj.is_in_current_room() or obj.update_if_outside_room:
-                # update timers
-                for timer in list(obj.timer_functions_post_update.values())[:]:
-                    timer.update()
-                obj.post_update()
+        self.update_object_lists()
+        self.timers.update(game_object.TIMER_POST_UPDATE)
+        for obj in self.active_objects:
+            obj.post_update()
     
     def render(self):
         "Sort and draw all objects in Game Mode world."
         visible_objects = []
-        for obj in self.objects.values():
+        # filter out objects outside current room here
+        # (if no current room or object is in no rooms, render it always)
+        if self.show_all_rooms or self.current_room is None:
+            render_objects = self.objects.values()
+        else:
+            self.update_object_lists()
+            render_objects = self.room_objects
+        for obj in render_objects:
             if obj.should_destroy:
                 continue
             obj.update_renderables()
-            # filter out objects outside current room here
-            # (if no current room or object is in no rooms, render it always)
-            in_room = self.current_room is None or obj.is_in_current_room()
             hide_debug = obj.is_debug and not self.draw_debug_objects
             # respect object's "should render at all" flag
-            if obj.visible and not hide_debug and \
-               (self.show_all_rooms or in_room):
+            if obj.visible and not hide_debug:
+                if self.cull_offscreen_objects and not obj.is_on_camera():
+                    continue
                 visible_objects.append(obj)
         #
         # process non "Y sort" objects first
@@ -865,8 +1156,11 @@ class GameWorld:
         #
         for item in collision_items:
             item.obj.render(item.layer)
-        for obj in self.objects.values():
-            obj.render_debug()
+        # debug lines are only drawn in edit mode
+        if self.app.ui.is_game_edit_ui_visible():
+            for obj in self.objects.values():
+                obj.render_debug()
+            self.debug_lines.render()
         if self.hud and self.draw_hud:
             self.hud.render()
     
@@ -975,19 +1269,22 @@ class GameWorld:
     
     def rename_object(self, obj, new_name):
         "Give specified object a new name. Doesn't accept already-in-use names."
-        self.objects.update(self.new_objects)
-        for other_obj in self.objects.values():
-            if not other_obj is self and other_obj.name == new_name:
-                self.app.ui.message_line.post_line("Can't rename %s to %s, name already in use" % (obj.name, new_name))
-                return
+        self.add_new_objects()
+        if new_name in self.objects and not self.objects[new_name] is obj:
+            self.app.ui.message_line.post_line("Can't rename %s to %s, name already in use" % (obj.name, new_name))
+            return
         self.objects.pop(obj.name)
+        self.unindex_object(obj)
         old_name = obj.name
         obj.name = new_name
         self.objects[obj.name] = obj
+        self.index_object(obj)
+        # renamed object moved to end of objects
+        self.object_lists_changed()
         for room in self.rooms.values():
-            if obj in room.objects.values():
+            if room.objects.get(old_name, None) is obj:
                 room.objects.pop(old_name)
-                room.objects[obj.name] = self
+                room.objects[obj.name] = obj
     
     def spawn_object_of_class(self, class_name, x=None, y=None):
         "Spawn a new object of given class name at given location."
@@ -1031,6 +1328,7 @@ class GameWorld:
         room = self.rooms.pop(room_name)
         if room is self.current_room:
             self.current_room = None
+            self.object_lists_changed()
         room.destroy()
     
     def change_room(self, new_room_name):
@@ -1040,6 +1338,7 @@ class GameWorld:
             return
         old_room = self.current_room
         self.current_room = self.rooms[new_room_name]
+        self.object_lists_changed()
         # tell old and new rooms they've been exited and entered, respectively
         if old_room:
             old_room.exited(self.current_room)
@@ -1093,7 +1392,7 @@ class GameWorld:
         # spawn a WorldGlobalStateObject
         self.globals = self.spawn_object_of_class(self.globals_object_class_name, 0, 0)
         # just for first update, merge new objects list into objects list
-        self.objects.update(self.new_objects)
+        self.add_new_objects()
         # create rooms
         for room_data in d.get('rooms', []):
             # get room class
@@ -1149,6 +1448,7 @@ class GameWorld:
                              obj_rends, obj_dbg_rends,
                              obj_cols, obj_col_rends, attachments))
         self.cl.report()
+        self.pools.report()
         print('%s charsets loaded, %s palettes' % (len(self.app.charsets),
                                                    len(self.app.palettes)))
         print('%s arts loaded for edit' % len(self.app.art_loaded_for_edit))
@@ -1170,4 +1470,5 @@ class GameWorld:
     
     def destroy(self):
         self.unload_game()
-        self.art_loaded = []
+        self.clear_art_loaded()
+        self.debug_lines.destroy()
@@ -24,11 +24,10 @@ class MazeNPC(GameObject):
     
     def pre_first_update(self):
         self.z = 0.1
-        # TODO: investigate why this random color set doesn't seem to work
+        # NPCs share their Art, so recolor our renderable rather than tiles
         random.seed(self.name)
-        random_color = random.randint(3, len(self.art.palette.colors))
-        for art in self.arts.values():
-            art.set_all_non_transparent_colors(random_color)
+        random_color = random.randint(3, len(self.art.palette.colors) - 1)
+        self.renderable.get_palette_remap().set_all_colors(random_color)
 
 class MazeBaker(MazeNPC):
     bark = 'Sorry, all outta bread today!'
@@ -180,6 +180,7 @@ class ShmupPlayerProjectile(Projectile):
     animating = True
     art_src = 'player_proj'
     use_art_instance = True
+    pool_size = 32
     noncolliding_classes = Projectile.noncolliding_classes + ['Boom', 'Player']
     def started_colliding(self, other):
         if isinstance(other, ShmupEnemy) and not other.invincible:
@@ -193,6 +194,7 @@ class ShmupEnemyProjectile(Projectile):
     animating = True
     art_src = 'enemy_proj'
     use_art_instance = True
+    pool_size = 32
     noncolliding_classes = Projectile.noncolliding_classes + ['Boom', 'ShmupEnemy']
     def started_colliding(self, other):
         if isinstance(other, ShmupPlayer) and other.state != 'dead':
@@ -203,6 +205,7 @@ class Boom(GameObject):
     art_src = 'boom'
     animating = True
     use_art_instance = True
+    pool_size = 32
     should_save = False
     z = 0.5
     scale_x, scale_y = 3, 3
@@ -1,11 +1,34 @@
 
-import math, os.path, time
+import math, os.path, time, hashlib
 import numpy as np
 
 from PIL import Image, ImageChops, ImageStat
 
 from renderable_sprite import SpriteRenderable
-from lab_color import rgb_to_lab, lab_color_diff
+from color_space import rgb_to_lab, color_diff_matrix, DELTA_E_CIE76
+from image_quantize import DITHER_NONE
+
+# persisted block caches, in app cache dir
+CONVERT_CACHE_DIR = 'conversions/'
+
+# glyph search quality at which every char + color combo is compared exactly
+SEARCH_QUALITY_EXHAUSTIVE = 100
+# blocks and glyphs are compared coarsely as signatures of this many cells
+# per side before the exact comparison
+SIGNATURE_CELLS = 4
+
+def get_cell_matrix(size, cells):
+    """
+    returns (cells, size) matrix that averages a row/column of given size
+    into given # of cells, weighting pixels that straddle two cells
+    """
+    m = np.zeros((cells, size))
+    cell_size = size / cells
+    for i in range(cells):
+        start, end = i * cell_size, (i + 1) * cell_size
+        for p in range(int(start), min(size, math.ceil(end))):
+            m[i, p] = min(end, p + 1) - max(start, p)
+    return m / cell_size
 
 """
 notes / future research
@@ -21,17 +44,92 @@ notes / future research
 "8088 corruption explained" talk:
 https://www.youtube.com/watch?v=L6CkYou6hYU
 - downsample each block bilinearly, divide each into 4x4 cells, then compare them with similarly bilinearly-downsampled char blocks
+-- done: see get_shortlisted_tile_for_block, signatures shortlist candidates for exact comparison
 """
 
+class BlockCache:
+    
+    """
+    Remembers best (char, fg, bg) for each palettized source block seen,
+    for a given charset, palette and comparison mode.
+    Images often repeat blocks (flat fills, tiles, UI chrome) so this skips
+    the full charset search for most of them.
+    """
+    
+    def __init__(self, app, key):
+        self.app = app
+        self.key = key
+        # block hash: (char, fg, bg)
+        self.results = {}
+        self.hits, self.misses = 0, 0
+        # number of results that came from disk
+        self.loaded = 0
+    
+    def get_block_hash(self, block):
+        return hashlib.sha1(block.tobytes()).digest()
+    
+    def get(self, block_hash):
+        result = self.results.get(block_hash, None)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+    
+    def set(self, block_hash, result):
+        self.results[block_hash] = result
+    
+    def get_filename(self):
+        return '%s%s%s.npz' % (self.app.cache_dir, CONVERT_CACHE_DIR, self.key)
+    
+    def load(self):
+        filename = self.get_filename()
+        if not os.path.exists(filename):
+            return
+        try:
+            data = np.load(filename)
+            for block_hash, result in zip(data['hashes'].tolist(),
+                                          data['results'].tolist()):
+                self.results[block_hash] = tuple(result)
+            self.loaded = len(self.results)
+        except Exception as e:
+            self.app.log("Couldn't load conversion cache %s: %s" % (filename, e))
+    
+    def save(self):
+        # nothing new to write?
+        if len(self.results) == self.loaded:
+            return
+        filename = self.get_filename()
+        hashes = np.array(list(self.results.keys()), dtype='S20')
+        results = np.array(list(self.results.values()), dtype=np.int32)
+        try:
+            np.savez(filename, hashes=hashes, results=results)
+        except Exception as e:
+            self.app.log("Couldn't save conversion cache %s: %s" % (filename, e))
+    
+    def get_stats_line(self):
+        total = max(1, self.hits + self.misses)
+        return 'block cache: %s hits / %s blocks (%.1f%%), %s unique blocks' % (self.hits, self.hits + self.misses, self.hits / total * 100, len(self.results))
+
+
 class ImageConverter:
     
     tiles_per_tick = 1
     lab_color_comparison = True
+    # color_space DELTA_E_* formula used if lab_color_comparison is True
+    lab_color_diff_method = DELTA_E_CIE76
     # delay in seconds before beginning to convert tiles.
     # lets eg UI catch up to BitmapImageImporter changes to Art.
     start_delay = 1.0
+    use_block_cache = True
+    # save block cache to disk between runs
+    persist_block_cache = False
+    # 1-100, see get_shortlist_size. lower values are faster but
+    # approximate; default is an exact search.
+    default_search_quality = SEARCH_QUALITY_EXHAUSTIVE
     
-    def __init__(self, app, image_filename, art, bicubic_scale=False, sequence_converter=None):
+    def __init__(self, app, image_filename, art, bicubic_scale=False, sequence_converter=None,
+                 dither=DITHER_NONE, search_quality=None, perceptual=False):
         self.init_success = False
         image_filename = app.find_filename_path(image_filename)
         if not image_filename or not os.path.exists(image_filename):
@@ -61,13 +159,11 @@ class ImageConverter:
         h = math.floor((h * ratio) / self.char_h) * self.char_h
         scale_method = Image.BICUBIC if bicubic_scale else Image.NEAREST
         self.src_img = self.src_img.resize((w, h), resample=scale_method)
-        # convert source image to art's palette
-        self.src_img = self.art.palette.get_palettized_image(self.src_img)
+        # convert source image to an array of art's palette indices,
+        # for fast comparisons
+        quantizer = self.art.palette.get_quantizer(dither, perceptual=perceptual)
+        self.src_array = quantizer.quantize(self.src_img)
         self.color_diffs = self.get_generated_color_diffs(self.art.palette.colors)
-        # convert palettized source image to an array for fast comparisons
-        self.src_array = np.fromstring(self.src_img.tobytes(), dtype=np.uint8)
-        src_w, src_h = self.src_img.size
-        self.src_array = np.reshape(self.src_array, (src_h, src_w))
         # convert charmap to 1-bit color for fast value swaps during
         # block comparison
         self.char_img = self.art.charset.image_data.copy().convert('RGB')
@@ -80,11 +176,7 @@ class ImageConverter:
         self.char_array = np.fromstring(self.char_img.tobytes(), dtype=np.uint8)
         self.char_array = np.reshape(self.char_array, (self.art.charset.image_height, self.art.charset.image_width))
         # create, size and position image preview
-        preview_img = self.src_img.copy()
-        # remove transparency if source image is a GIF to avoid a PIL crash :[
-        # TODO: https://github.com/python-pillow/Pillow/issues/1377
-        if 'transparency' in preview_img.info:
-            preview_img.info.pop('transparency')
+        preview_img = quantizer.get_rgb_image(self.src_array)
         self.preview_sprite = SpriteRenderable(self.app, None, preview_img)
         # preview image scale takes into account character aspect
         self.preview_sprite.scale_x = w / (self.char_w / self.art.quad_width)
@@ -106,31 +198,55 @@ class ImageConverter:
                 # characters might end mid-row, bail if so
                 if len(self.char_blocks) > self.art.charset.last_index:
                     break
+        self.search_quality = search_quality or self.default_search_quality
+        self.shortlist_size = self.get_shortlist_size()
+        if self.shortlist_size:
+            self.init_signatures()
+        self.block_cache = None
+        if self.use_block_cache:
+            self.block_cache = self.get_block_cache()
         self.init_success = True
     
+    def get_block_cache_key(self):
+        "hash of everything besides source block that affects results"
+        h = hashlib.sha1()
+        h.update(self.char_array.tobytes())
+        h.update(bytes(str((self.char_w, self.char_h, len(self.char_blocks))), 'utf-8'))
+        h.update(bytes(str(self.art.palette.colors), 'utf-8'))
+        # subclasses may compare blocks differently
+        mode = (type(self).__name__, self.lab_color_comparison,
+                self.lab_color_diff_method, self.shortlist_size)
+        h.update(bytes(str(mode), 'utf-8'))
+        return h.hexdigest()
+    
+    def get_block_cache(self):
+        "returns block cache, shared by all frames of an image sequence"
+        key = self.get_block_cache_key()
+        if self.sequence_converter:
+            cache = self.sequence_converter.block_cache
+            if cache and cache.key == key:
+                return cache
+        cache = BlockCache(self.app, key)
+        if self.persist_block_cache:
+            cache.load()
+        if self.sequence_converter:
+            self.sequence_converter.block_cache = cache
+        return cache
+    
     def get_generated_color_diffs(self, colors):
-        # build table of color diffs
-        unique_colors = len(colors)
-        color_diffs = np.zeros((unique_colors, unique_colors), dtype=np.float32)
+        "returns table of diffs between every pair of given colors"
+        colors = np.array(colors, dtype=np.float64)
         # option: L*a*b color space conversion for greater accuracy
-        get_color_diff = self.get_lab_color_diff if self.lab_color_comparison else self.get_rgb_color_diff
-        #get_color_diff = self.get_nonlinear_rgb_color_diff
-        for i,color in enumerate(colors):
-            for j,other_color in enumerate(colors):
-                color_diffs[i][j] = get_color_diff(color, other_color)
-        return color_diffs
-    
-    def get_rgb_color_diff(self, color1, color2):
-        r = abs(color1[0] - color2[0])
-        g = abs(color1[1] - color2[1])
-        b = abs(color1[2] - color2[2])
-        a = abs(color1[3] - color2[3])
-        return abs(r + g + b + a)
-    
-    def get_lab_color_diff(self, color1, color2):
-        l1, a1, b1 = rgb_to_lab(*color1[:3])
-        l2, a2, b2 = rgb_to_lab(*color2[:3])
-        return lab_color_diff(l1, a1, b1, l2, a2, b2)
+        if self.lab_color_comparison:
+            lab = rgb_to_lab(colors[:, :3])
+            color_diffs = color_diff_matrix(lab, lab, self.lab_color_diff_method)
+        else:
+            color_diffs = self.get_rgb_color_diffs(colors)
+        return color_diffs.astype(np.float32)
+    
+    def get_rgb_color_diffs(self, colors):
+        "sum of absolute RGBA channel differences between every color pair"
+        return np.abs(colors[:, np.newaxis, :] - colors[np.newaxis, :, :]).sum(axis=-1)
     
     def get_nonlinear_rgb_color_diff(self, color1, color2):
         # from http://www.compuphase.com/cmetric.htm
@@ -147,7 +263,7 @@ class ImageConverter:
             x_start, y_start = self.x * self.char_w, self.y * self.char_h
             x_end, y_end = x_start + self.char_w, y_start + self.char_h
             block = self.src_array[y_start:y_end, x_start:x_end]
-            char, fg, bg = self.get_best_tile_for_block(block)
+            char, fg, bg = self.get_cached_tile_for_block(block)
             # get_best_etc sometimes returns 0 for darkest blocks,
             # but transparency isn't properly supported yet
             fg = self.art.palette.darkest_index if fg == 0 else fg
@@ -189,6 +305,90 @@ class ImageConverter:
                 combos.append((color1, color2))
         return colors, combos
     
+    def get_shortlist_size(self):
+        """
+        returns # of char/color candidates that get an exact comparison
+        after coarse signature comparison: doubles every 10 quality points,
+        0 = exhaustive search
+        """
+        if self.search_quality >= SEARCH_QUALITY_EXHAUSTIVE:
+            return 0
+        return max(1, round(2 ** (self.search_quality / 10)))
+    
+    def init_signatures(self):
+        "precompute coarse per-cell ink coverage for every char"
+        self.cell_matrix_y = get_cell_matrix(self.char_h, SIGNATURE_CELLS)
+        self.cell_matrix_x = get_cell_matrix(self.char_w, SIGNATURE_CELLS)
+        # (chars, h, w) masks, True where char's foreground color shows
+        self.char_masks = np.array([self.char_array[y0:y1, x0:x1] == 1
+                                    for (x0, y0, x1, y1) in self.char_blocks])
+        coverage = np.einsum('ih,nhw,jw->nij', self.cell_matrix_y,
+                             self.char_masks, self.cell_matrix_x)
+        self.char_coverage = coverage.reshape(len(self.char_masks), -1)
+        self.char_coverage_sq = (self.char_coverage**2).sum(axis=1)
+        colors = np.array(self.art.palette.colors, dtype=np.float64)[:, :3]
+        self.palette_lab = rgb_to_lab(colors)
+    
+    def get_block_signature(self, src_block):
+        "returns (cells, 3) average L*a*b color of each cell of given block"
+        lab = self.palette_lab[src_block]
+        sig = np.einsum('ih,hwc,jw->ijc', self.cell_matrix_y, lab,
+                        self.cell_matrix_x)
+        return sig.reshape(-1, 3)
+    
+    def get_cached_tile_for_block(self, src_block):
+        "returns best tile for block, from block cache if possible"
+        if not self.block_cache:
+            return self.get_tile_for_block(src_block)
+        block_hash = self.block_cache.get_block_hash(src_block)
+        result = self.block_cache.get(block_hash)
+        if result is None:
+            result = self.get_tile_for_block(src_block)
+            self.block_cache.set(block_hash, result)
+        return result
+    
+    def get_tile_for_block(self, src_block):
+        if self.shortlist_size:
+            return self.get_shortlisted_tile_for_block(src_block)
+        return self.get_best_tile_for_block(src_block)
+    
+    def get_shortlisted_tile_for_block(self, src_block):
+        """
+        returns a (char, fg, bg) tuple for a close match of given block:
+        ranks every char/color combo by signature, then compares only the
+        top candidates exactly
+        """
+        colors, combos = self.get_color_combos_for_block(src_block)
+        if len(combos) == 0:
+            bg = 0 if len(colors) == 0 else colors[0]
+            return (0, 0, bg)
+        combos = np.array(combos)
+        bgs, fgs = combos[:, 0], combos[:, 1]
+        # predicted cell color = coverage * fg + (1 - coverage) * bg, so
+        # squared error vs block cell = |coverage * d + e|^2, expanded:
+        # coverage^2 * |d|^2 + 2 * coverage * (d . e) + |e|^2
+        sig = self.get_block_signature(src_block)
+        d = self.palette_lab[fgs] - self.palette_lab[bgs]
+        e = self.palette_lab[bgs][:, np.newaxis, :] - sig
+        de = np.einsum('kc,knc->kn', d, e)
+        costs = self.char_coverage_sq * (d**2).sum(axis=1)[:, np.newaxis]
+        costs += 2 * (de @ self.char_coverage.T)
+        costs += (e**2).sum(axis=(1, 2))[:, np.newaxis]
+        # (combos, chars) -> best flat indices, in original search order
+        costs = costs.ravel()
+        k = min(self.shortlist_size, len(costs))
+        shortlist = np.sort(np.argpartition(costs, k - 1)[:k])
+        combo_indices, chars = np.divmod(shortlist, len(self.char_masks))
+        # exact diffs of shortlisted candidates, all at once
+        block_diffs = self.color_diffs[src_block]
+        fg_diffs = block_diffs[:, :, fgs[combo_indices]]
+        bg_diffs = block_diffs[:, :, bgs[combo_indices]]
+        masks = np.moveaxis(self.char_masks[chars], 0, -1)
+        diffs = np.where(masks, fg_diffs, bg_diffs).sum(axis=(0, 1))
+        best = np.argmin(diffs)
+        combo = combo_indices[best]
+        return (chars[best], fgs[combo], bgs[combo])
+    
     def get_best_tile_for_block(self, src_block):
         "returns a (char, fg, bg) tuple for the best match of given block"
         colors, combos = self.get_color_combos_for_block(src_block)
@@ -205,10 +405,9 @@ class ImageConverter:
         for bg,fg in combos:
             # reset char index before each run through charset
             char_index = 0
-            char_array = self.char_array.copy()
             # replace 1-bit color of char image with fg and bg colors
-            char_array[char_array == 0] = bg
-            char_array[char_array == 1] = fg
+            # (in one step, as bg may itself be 1)
+            char_array = np.where(self.char_array == 1, fg, bg)
             for (x0, y0, x1, y1) in self.char_blocks:
                 char_block = char_array[y0:y1, x0:x1]
                 # using array of difference values w/ fancy numpy indexing,
@@ -241,12 +440,20 @@ class ImageConverter:
             s += '\n'
         print(s)
     
+    def finish_block_cache(self):
+        if not self.block_cache:
+            return
+        self.app.log('  ' + self.block_cache.get_stats_line())
+        if self.persist_block_cache:
+            self.block_cache.save()
+    
     def finish(self, cancelled=False):
         self.finished = True
         if not self.sequence_converter:
             time_taken = time.time() - self.start_time
             verb = 'cancelled' if cancelled else 'finished'
             self.app.log('Conversion of image %s %s after %.3f seconds' % (self.image_filename, verb, time_taken))
+            self.finish_block_cache()
             self.app.converter = None
         self.preview_sprite = None
         self.app.update_window_title()
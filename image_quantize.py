@@ -0,0 +1,183 @@
+import numpy as np
+from PIL import Image
+
+from color_space import rgb_to_lab, srgb_to_linear, RGB_TO_XYZ, D65_WHITE
+
+DITHER_NONE = 'none'
+DITHER_FLOYD_STEINBERG = 'floyd-steinberg'
+DITHER_ATKINSON = 'atkinson'
+DITHER_BAYER = 'bayer'
+DITHER_METHODS = [DITHER_NONE, DITHER_FLOYD_STEINBERG, DITHER_ATKINSON,
+                  DITHER_BAYER]
+
+# PIL's equivalents of dither methods it supports
+PIL_DITHER = {DITHER_NONE: Image.NONE, DITHER_FLOYD_STEINBERG: Image.FLOYDSTEINBERG}
+
+# error diffusion kernels: (x offset, y offset, share of error)
+DIFFUSION_KERNELS = {
+    DITHER_FLOYD_STEINBERG: [(1, 0, 7/16), (-1, 1, 3/16), (0, 1, 5/16),
+                             (1, 1, 1/16)],
+    # only diffuses 3/4 of error, keeps more contrast
+    DITHER_ATKINSON: [(1, 0, 1/8), (2, 0, 1/8), (-1, 1, 1/8), (0, 1, 1/8),
+                      (1, 1, 1/8), (0, 2, 1/8)]
+}
+
+# lookup and matrix versions of color_space's sRGB -> L*a*b steps, see rgb_to_lab8
+SRGB_TO_LINEAR = srgb_to_linear(np.arange(256)).astype(np.float32)
+LINEAR_TO_XYZ = (RGB_TO_XYZ.T * 100 / D65_WHITE).astype(np.float32)
+XYZ_TO_LAB = np.array([[0, 500, 0], [116, -500, 200], [0, 0, -200]], dtype=np.float32)
+
+def rgb_to_lab8(rgb):
+    "faster float32 rgb_to_lab for integer base-255 colors"
+    rgb = np.asarray(rgb)
+    xyz = SRGB_TO_LINEAR[rgb] @ LINEAR_TO_XYZ
+    linear = xyz <= 0.008856
+    xyz = np.cbrt(xyz, out=xyz)
+    # only very dark channels use the linear segment
+    if linear.any():
+        xyz[linear] = (xyz[linear]**3 * 7.787) + (16.0 / 116)
+    lab = xyz @ XYZ_TO_LAB
+    lab[..., 0] -= 16
+    return lab
+
+def get_bayer_matrix(size):
+    "returns size x size (power of 2) ordered dither thresholds in 0-1 range"
+    m = np.zeros((1, 1))
+    while len(m) < size:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return (m + 0.5) / m.size
+
+
+class ImageQuantizer:
+    
+    """
+    Maps images to a list of colors by closest L*a*b distance, optionally
+    dithered. Undithered and ordered dither results for each RGB value are
+    kept in a table, so repeat colors (and repeat images) cost one lookup.
+    Unless perceptual is set, methods PIL supports on lists of up to 256
+    colors use PIL's much faster RGB distance quantize instead.
+    """
+    
+    bayer_size = 4
+    "Ordered dither matrix size, must be a power of 2"
+    bayer_strength = 48
+    "Range of ordered dither offsets, in base-255 RGB units"
+    max_distance_elements = 2**22
+    "Max size of (pixels x colors) distance arrays, bounds memory use"
+    
+    def __init__(self, colors, dither=DITHER_NONE, perceptual=False):
+        "colors: list of base-255 RGB or RGBA colors; alpha is ignored"
+        self.rgb = np.array([c[:3] for c in colors], dtype=np.uint8)
+        self.lab = rgb_to_lab(self.rgb).astype(np.float32)
+        # |color|^2 term of squared distance, see get_nearest
+        self.lab_sq = (self.lab**2).sum(axis=1)
+        # [L, a, b, 1] @ distance_matrix gives that distance for every color
+        self.distance_matrix = np.vstack([-2 * self.lab.T, self.lab_sq])
+        self.dither = dither
+        self.use_pil = not perceptual and dither in PIL_DITHER and len(self.rgb) <= 256
+        "If True, quantize with PIL rather than in L*a*b"
+        self.rgb_table = None
+        "Closest color index for every 24-bit RGB value, -1 if not found yet"
+    
+    def get_nearest(self, lab):
+        "returns index of closest color for each of given (N, 3) L*a*b colors"
+        indices = np.empty(len(lab), dtype=np.int32)
+        chunk_size = max(1, self.max_distance_elements // len(self.lab))
+        lab_1 = np.ones((min(chunk_size, len(lab)), 4), dtype=np.float32)
+        for i in range(0, len(lab), chunk_size):
+            chunk = lab[i:i+chunk_size]
+            # |a - b|^2 = |a|^2 - 2ab + |b|^2, and |a|^2 doesn't affect argmin
+            lab_1[:len(chunk), :3] = chunk
+            d = lab_1[:len(chunk)] @ self.distance_matrix
+            indices[i:i+chunk_size] = np.argmin(d, axis=1)
+        return indices
+    
+    def get_nearest_rgb(self, rgb):
+        "returns indices of closest colors for given (N, 3) base-255 RGB colors"
+        if self.rgb_table is None:
+            self.rgb_table = np.full(2**24, -1, dtype=np.int16)
+        rgb = rgb.astype(np.int32)
+        keys = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+        indices = self.rgb_table[keys]
+        missing = keys[indices < 0]
+        if len(missing):
+            # images usually have far fewer unique colors than pixels;
+            # find them with a flag array rather than a sort
+            seen = np.zeros(2**24, dtype=bool)
+            seen[missing] = True
+            new_keys = np.flatnonzero(seen)
+            new_rgb = np.stack([new_keys >> 16, (new_keys >> 8) & 255,
+                                new_keys & 255], axis=-1)
+            self.rgb_table[new_keys] = self.get_nearest(rgb_to_lab8(new_rgb))
+            indices = self.rgb_table[keys]
+        return indices.astype(np.int32)
+    
+    def quantize(self, src):
+        "returns (height, width) array of color indices for given image/array"
+        if isinstance(src, Image.Image):
+            src = src.convert('RGB')
+        if self.use_pil:
+            return self.quantize_pil(src)
+        rgb = np.asarray(src)[:, :, :3]
+        if self.dither in DIFFUSION_KERNELS:
+            return self.quantize_error_diffusion(rgb, DIFFUSION_KERNELS[self.dither])
+        h, w = rgb.shape[:2]
+        if self.dither == DITHER_BAYER:
+            size = self.bayer_size
+            offsets = (get_bayer_matrix(size) - 0.5) * self.bayer_strength
+            offsets = np.tile(offsets, (h // size + 1, w // size + 1))
+            rgb = rgb + np.round(offsets[:h, :w, np.newaxis])
+            rgb = np.clip(rgb, 0, 255)
+        return self.get_nearest_rgb(rgb.reshape(-1, 3)).reshape(h, w)
+    
+    def quantize_pil(self, src):
+        if not isinstance(src, Image.Image):
+            src = Image.fromarray(np.asarray(src)[:, :, :3].astype(np.uint8), 'RGB')
+        # PIL palettes are exactly 256 colors; pad with a repeat of color 0
+        # so any padding index PIL picks can be mapped back to it
+        colors = list(self.rgb) + [self.rgb[0]] * (256 - len(self.rgb))
+        pal_img = Image.new('P', (1, 1))
+        pal_img.putpalette(np.array(colors, dtype=np.uint8).flatten().tolist())
+        out_img = src.quantize(palette=pal_img, dither=PIL_DITHER[self.dither])
+        indices = np.asarray(out_img).astype(np.int32)
+        indices[indices >= len(self.rgb)] = 0
+        return indices
+    
+    def quantize_error_diffusion(self, rgb, kernel):
+        h, w = rgb.shape[:2]
+        # pad work area so kernel offsets never need bounds checks
+        pad = max([abs(k[0]) for k in kernel])
+        max_dy = max([k[1] for k in kernel])
+        row_width = w + 2 * pad
+        # one flat array per channel: gathers and scatters along a line
+        # of pixels are much faster than on (N, 3) rows
+        work = np.zeros((3, h + max_dy, row_width), dtype=np.float32)
+        work[:, :h, pad:pad+w] = rgb_to_lab8(rgb).transpose(2, 0, 1)
+        work = work.reshape(3, -1)
+        indices = np.empty(h * w, dtype=np.int32)
+        lab_columns = np.ascontiguousarray(self.lab.T)
+        lab_sq = self.lab_sq[:, np.newaxis]
+        kernel = [(dy * row_width + dx, np.float32(share)) for dx, dy, share in kernel]
+        all_rows = np.arange(h)
+        # every kernel offset (dx, dy) has dx + 2 * dy > 0, so pixels
+        # along a line of constant x + 2y get no error from each other:
+        # sweep these lines in order, each one processed all at once.
+        # pixel (x, y) on line t is at x = t - 2y.
+        for t in range(w + 2 * (h - 1)):
+            ys = all_rows[max(0, (t - w + 2) // 2):min(h - 1, t // 2) + 1]
+            work_index = ys * (row_width - 2) + (t + pad)
+            values = work[:, work_index]
+            nearest = np.argmin(lab_sq - 2 * (self.lab @ values), axis=0)
+            indices[ys * (w - 2) + t] = nearest
+            error = values - lab_columns[:, nearest]
+            # pixels on a line never share a target for the same offset
+            for offset, share in kernel:
+                work[:, work_index + offset] += error * share
+        return indices.reshape(h, w)
+    
+    def get_rgb_array(self, indices):
+        "returns (height, width, 3) RGB array for given color indices"
+        return self.rgb[indices]
+    
+    def get_rgb_image(self, indices):
+        return Image.fromarray(self.get_rgb_array(indices), 'RGB')
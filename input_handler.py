@@ -4,6 +4,7 @@ import sdl2
 from sys import exit
 
 from ui import SCALE_INCREMENT
+from ui_menu_bar import ArtMenuBar, GameMenuBar
 from renderable import LAYER_VIS_FULL, LAYER_VIS_DIM, LAYER_VIS_NONE
 from ui_art_dialog import NewArtDialog, SaveAsDialog, QuitUnsavedChangesDialog, CloseUnsavedChangesDialog, RevertChangesDialog, ResizeArtDialog, AddFrameDialog, DuplicateFrameDialog, FrameDelayDialog, FrameDelayAllDialog, FrameIndexDialog, AddLayerDialog, DuplicateLayerDialog, SetLayerNameDialog, SetLayerZDialog, PaletteFromFileDialog, ImportFileDialog, ExportFileDialog, SetCameraZoomDialog, ExportOptionsDialog
 from ui_game_dialog import NewGameDirDialog, LoadGameStateDialog, SaveGameStateDialog, AddRoomDialog, SetRoomCamDialog, SetRoomEdgeWarpsDialog, SetRoomBoundsObjDialog, RenameRoomDialog
@@ -142,13 +143,14 @@ class InputLord:
     
     def get_menu_items_for_command_function(self, function):
         # search both menus for items; command checks
-        buttons = self.ui.art_menu_bar.menu_buttons + self.ui.game_menu_bar.menu_buttons
+        # (use menu bar classes, art menu bar may not exist yet)
+        button_classes = ArtMenuBar.button_classes + GameMenuBar.button_classes
         items = []
-        for button in buttons:
+        for button_class in button_classes:
             # skip eg nftscii button
-            if not hasattr(button, 'menu_data'):
+            if not button_class.menu_data:
                 continue
-            for item in button.menu_data.items:
+            for item in button_class.menu_data.items:
                 if function.__name__ == 'BIND_%s' % item.command:
                     items.append(item)
         return items
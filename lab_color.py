@@ -1,5 +1,7 @@
 # L*a*b color space conversion
 # from EDSCII
+# scalar reference versions; see color_space for array versions used by
+# palette and image conversion code.
 
 import math
 
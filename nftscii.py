@@ -19,8 +19,16 @@ if platform.system() == 'Windows' or platform.system() == 'Darwin':
 if platform.system() == 'Darwin' and hasattr(sys, 'frozen'):
     os.chdir(os.path.abspath(os.path.dirname(sys.executable)))
 
+# --profile-startup: time everything imported from here on
+startup_profiler = None
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    from startup_profile import StartupProfiler, PROFILE_STARTUP_ARG
+    sys.argv.remove(PROFILE_STARTUP_ARG)
+    startup_profiler = StartupProfiler()
+    startup_profiler.start_import_tracking()
+
 # app imports
-import ctypes, time, hashlib, importlib, traceback
+import ctypes, time, hashlib, importlib, importlib.util, traceback
 import webbrowser
 import sdl2
 import sdl2.ext
@@ -32,21 +40,23 @@ from sdl2 import video, sdlmixer
 from OpenGL import GL
 from PIL import Image
 # cache whether pdoc is available for help menu item
-pdoc_available = False
+# (find it rather than import it, it's slow to import and rarely used)
 try:
-    import pdoc
-    pdoc_available = True
-except: pass
+    pdoc_available = importlib.util.find_spec('pdoc') is not None
+except:
+    pdoc_available = False
 
 # submodules - set here so cfg file can modify them all easily
 from audio import AudioLord
-from shader import ShaderLord
+from shader import ShaderLord, SHADER_CACHE_DIR
+from file_watcher import FileWatcher
 from camera import Camera
-from charset import CharacterSet, CharacterSetLord, CHARSET_DIR
+from charset import CharacterSet, CharacterSetLord, CHARSET_DIR, CHARSET_CACHE_DIR
 from palette import Palette, PaletteLord, PALETTE_DIR
 from art import Art, ArtFromDisk, DEFAULT_CHARSET, DEFAULT_PALETTE, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_ART_FILENAME
 from art_import import ArtImporter
 from art_export import ArtExporter
+from converter_index import ConverterIndex, FORMATS_DIR
 from renderable import TileRenderable, OnionTileRenderable
 from renderable_line import DebugLineRenderable
 from renderable_sprite import UIBGTextureRenderable
@@ -64,7 +74,7 @@ from ui_element import UIRenderable, FPSCounterUI, DebugTextUI
 from ui_menu_pulldown import PulldownMenu
 from ui_dialog import UIDialog
 from ui_chooser_dialog import ScrollArrowButton, ChooserDialog
-from image_convert import ImageConverter
+from image_convert import ImageConverter, CONVERT_CACHE_DIR
 from game_world import GameWorld, TOP_GAME_DIR
 from game_object import GameObject
 from shader import Shader
@@ -78,7 +88,6 @@ LOG_FILENAME = 'console.log'
 SESSION_FILENAME = 'nftscii.session'
 LOGO_FILENAME = 'ui/logo.png'
 SCREENSHOT_DIR = 'screenshots/'
-FORMATS_DIR = 'formats/'
 AUTOPLAY_GAME_FILENAME = 'autoplay_this_game'
 
 WEBSITE_URL = 'https://github.com/squintdev/nftscii'
@@ -137,8 +146,11 @@ class Application:
     forbidden_filename_chars = ['/', '\\', '*', ':']
     
     def __init__(self, config_dir, documents_dir, cache_dir, logger,
-                 art_filename, game_dir_to_load, state_to_load, autoplay_game):
+                 art_filename, game_dir_to_load, state_to_load, autoplay_game,
+                 startup_profiler=None):
         self.init_success = False
+        # set if --profile-startup was given
+        self.startup_profiler = startup_profiler
         self.config_dir = config_dir
         # keep nftscii.cfg lines in case we want to add some
         self.config_lines = open(self.config_dir + CONFIG_FILENAME).readlines()
@@ -206,6 +218,7 @@ class Application:
             self.context_es = True
         else:
             self.context_es = False
+        self.profile_startup_phase('window and GL context')
         self.log('Detecting hardware...')
         cpu = platform.processor() or platform.machine()
         self.log('  CPU: %s' % (cpu if cpu != '' else "[couldn't detect CPU]"))
@@ -290,9 +303,13 @@ class Application:
         # draw black screen while doing other init
         GL.glClearColor(0.0, 0.0, 0.0, 1.0)
         GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        self.profile_startup_phase('hardware detection')
         # initialize audio
         self.al = AudioLord(self)
         self.set_icon()
+        self.profile_startup_phase('audio')
+        # tells lords etc when files they loaded change, for hot reload
+        self.fw = FileWatcher(self)
         # SHADERLORD rules shader init/destroy, hot reload
         self.sl = ShaderLord(self)
         # separate cameras for edit vs game mode
@@ -307,8 +324,8 @@ class Application:
         # set when an exporter is chosen, remains so last_export can run
         self.exporter = None
         self.last_export_options = {}
-        # dict of available importer/exporter modules
-        self.converter_modules = {}
+        # catalog of available importers/exporters, modules loaded on use
+        self.converter_index = ConverterIndex(self)
         # last art script run (remember for "run last")
         self.last_art_script = None
         self.game_mode = False
@@ -319,6 +336,11 @@ class Application:
         # autoplay = distribution mode, no editing
         if autoplay_game and not game_dir_to_load and self.gw.game_dir:
             self.can_edit = False
+        # if launching straight into a game, build Art Mode-only UI on demand
+        self.art_mode_ui_deferred = bool(game_dir_to_load or autoplay_game) and \
+                                    bool(self.gw.game_dir) and \
+                                    not self.always_launch_art_mode
+        self.profile_startup_phase('game world')
         # debug line renderable
         self.debug_line_renderable = DebugLineRenderable(self, None)
         # onion skin renderables
@@ -334,6 +356,7 @@ class Application:
         self.pl = PaletteLord(self)
         # set/create an active art
         self.load_art_for_edit(art_filename)
+        self.profile_startup_phase('charsets, palettes, art')
         self.fb = Framebuffer(self)
         # setting cursor None now makes for easier check in status bar drawing
         self.cursor, self.grid = None, None
@@ -343,15 +366,11 @@ class Application:
         self.il = None
         # initialize UI with first art loaded active
         self.ui = UI(self, self.art_loaded_for_edit[0])
+        self.profile_startup_phase('UI')
         # textured background renderable
         self.bg_texture = UIBGTextureRenderable(self)
-        # init onion skin
-        for i in range(self.onion_show_frames):
-            renderable = OnionTileRenderable(self, self.ui.active_art)
-            self.onion_renderables_prev.append(renderable)
-        for i in range(self.onion_show_frames):
-            renderable = OnionTileRenderable(self, self.ui.active_art)
-            self.onion_renderables_next.append(renderable)
+        if not self.art_mode_ui_deferred:
+            self.init_onion_renderables()
         # set camera bounds based on art size
         self.camera.set_for_art(self.ui.active_art)
         self.update_window_title()
@@ -365,8 +384,10 @@ class Application:
         self.ui.update()
         self.cursor.pre_first_update()
         self.pdoc_available = pdoc_available
+        self.profile_startup_phase('cursor, grid, input')
         self.init_success = True
         self.log('Init done.')
+        self.sl.log_startup_stats()
         if self.can_edit:
             self.restore_session()
         # if art file was given in arguments, set it active
@@ -388,6 +409,34 @@ class Application:
             self.gw.draw_debug_objects = False
         elif self.gw.game_dir and self.always_launch_art_mode:
             self.exit_game_mode()
+        self.profile_startup_phase('session and game state')
+        if self.startup_profiler:
+            self.startup_profiler.stop_import_tracking()
+            for line in self.startup_profiler.get_report_lines():
+                self.log(line)
+    
+    def profile_startup_phase(self, phase_name):
+        "Mark end of given init phase, if profiling startup."
+        if self.startup_profiler:
+            self.startup_profiler.phase(phase_name)
+    
+    def init_onion_renderables(self):
+        for i in range(self.onion_show_frames):
+            renderable = OnionTileRenderable(self, self.ui.active_art)
+            self.onion_renderables_prev.append(renderable)
+        for i in range(self.onion_show_frames):
+            renderable = OnionTileRenderable(self, self.ui.active_art)
+            self.onion_renderables_next.append(renderable)
+    
+    def init_art_mode_ui(self):
+        "Create Art Mode-only UI skipped when launching straight into a game."
+        if not self.art_mode_ui_deferred:
+            return
+        self.art_mode_ui_deferred = False
+        self.init_onion_renderables()
+        if self.ui.active_art:
+            self.ui.reset_onion_frames()
+        self.ui.init_art_menu_bar()
     
     def get_desktop_resolution(self):
         winpos = sdl2.SDL_WINDOWPOS_UNDEFINED
@@ -608,33 +657,10 @@ class Application:
     def get_converter_classes(self, base_class):
         "return a list of converter classes for importer/exporter selection"
         classes = []
-        # on first load, documents dir may not be in import path
-        if not self.documents_dir in sys.path:
-            sys.path += [self.documents_dir]
-        # read from application (builtins) and user documents dirs
-        files = os.listdir(FORMATS_DIR)
-        files += os.listdir(self.documents_dir + FORMATS_DIR)
-        for filename in files:
-            basename, ext = os.path.splitext(filename)
-            if not ext.lower() == '.py':
-                continue
-            try:
-                if basename in self.converter_modules:
-                    m = importlib.reload(self.converter_modules[basename])
-                else:
-                    m = importlib.import_module('formats.%s' % basename)
-                    self.converter_modules[basename] = m
-            except Exception as e:
-                self.log_import_exception(e, basename)
-            for k,v in m.__dict__.items():
-                if not type(v) is type:
-                    continue
-                # don't add duplicates
-                # (can happen if eg one importer extends another)
-                if v in classes:
-                    continue
-                if issubclass(v, base_class) and v is not base_class:
-                    classes.append(v)
+        for info in self.converter_index.get_converters(base_class):
+            c = self.converter_index.load_converter_class(info)
+            if c and not c in classes:
+                classes.append(c)
         return classes
     
     def get_importers(self):
@@ -645,6 +671,33 @@ class Application:
         "Returns list of all ArtExporter subclasses found in formats/ dir."
         return self.get_converter_classes(ArtExporter)
     
+    def get_importer_infos(self):
+        """
+        Returns list of ConverterInfos for all importers, which only imports
+        formats/ modules that changed since they were last indexed.
+        """
+        return self.converter_index.get_converters(ArtImporter)
+    
+    def get_exporter_infos(self):
+        "Returns list of ConverterInfos for all exporters, see get_importer_infos."
+        return self.converter_index.get_converters(ArtExporter)
+    
+    def load_converter_class(self, info):
+        "Returns importer/exporter class for given ConverterInfo."
+        return self.converter_index.load_converter_class(info)
+    
+    def get_converter_class_by_name(self, base_class, class_name):
+        info = self.converter_index.get_converter_by_name(base_class, class_name)
+        return self.converter_index.load_converter_class(info) if info else None
+    
+    def get_importer_by_name(self, class_name):
+        "Returns ArtImporter subclass with given name, or None."
+        return self.get_converter_class_by_name(ArtImporter, class_name)
+    
+    def get_exporter_by_name(self, class_name):
+        "Returns ArtExporter subclass with given name, or None."
+        return self.get_converter_class_by_name(ArtExporter, class_name)
+    
     def load_charset(self, charset_to_load, log=False):
         "creates and returns a character set with the given name"
         # already loaded?
@@ -656,6 +709,7 @@ class Application:
         new_charset = CharacterSet(self, charset_to_load, log)
         if new_charset.init_success:
             self.charsets.append(new_charset)
+            self.csl.watch(new_charset)
             return new_charset
         elif self.ui and self.ui.active_art:
             # if init failed (eg bad filename) return something safe
@@ -670,6 +724,7 @@ class Application:
         new_palette = Palette(self, palette_to_load, log)
         if new_palette.init_success:
             self.palettes.append(new_palette)
+            self.pl.watch(new_palette)
             return new_palette
         elif self.ui and self.ui.active_art:
             # if init failed (eg bad filename) return something safe
@@ -758,6 +813,7 @@ class Application:
         self.ui.menu_bar = self.ui.game_menu_bar
     
     def exit_game_mode(self):
+        self.init_art_mode_ui()
         self.game_mode = False
         self.camera = self.art_camera
         self.grid = self.art_grid
@@ -780,9 +836,7 @@ class Application:
             self.render()
             self.last_frame_end = self.get_elapsed_time()
             self.frames += 1
-            self.sl.check_hot_reload()
-            self.csl.check_hot_reload()
-            self.pl.check_hot_reload()
+            self.fw.update()
             # determine FPS
             # alpha: lower = smoother
             alpha = 0.05
@@ -973,6 +1027,7 @@ class Application:
             for palette in self.palettes:
                 palette.texture.destroy()
             self.sl.destroy()
+            self.fw.destroy()
         if self.al:
             self.al.destroy()
         sdl2.SDL_GL_DeleteContext(self.context)
@@ -1050,6 +1105,12 @@ def get_paths():
         os.mkdir(cache_dir)
     if not os.path.exists(cache_dir + THUMBNAIL_CACHE_DIR):
         os.mkdir(cache_dir + THUMBNAIL_CACHE_DIR)
+    if not os.path.exists(cache_dir + SHADER_CACHE_DIR):
+        os.mkdir(cache_dir + SHADER_CACHE_DIR)
+    if not os.path.exists(cache_dir + CHARSET_CACHE_DIR):
+        os.mkdir(cache_dir + CHARSET_CACHE_DIR)
+    if not os.path.exists(cache_dir + CONVERT_CACHE_DIR):
+        os.mkdir(cache_dir + CONVERT_CACHE_DIR)
     DOCUMENTS_SUBDIR = '/Documents'
     if platform.system() == 'Windows':
         documents_dir = get_win_documents_path()
@@ -1169,7 +1230,7 @@ if __name__ == "__main__":
             art_to_load = sys.argv[1]
     app = Application(config_dir, documents_dir, cache_dir, logger,
                       art_to_load or DEFAULT_ART_FILENAME, game_dir_to_load,
-                      state_to_load, autoplay_game)
+                      state_to_load, autoplay_game, startup_profiler)
     error = app.main_loop()
     app.quit()
     logger.close()
@@ -1,36 +1,38 @@
 import os.path, math, time
 from random import randint
+import numpy as np
 from PIL import Image
 
 from texture import Texture
-from lab_color import rgb_to_lab, lab_color_diff
+from color_space import rgb_to_lab
+from image_quantize import ImageQuantizer, DITHER_NONE
+from palette_generate import get_image_filenames, sample_images, generate_palette, save_palette_image, METHOD_KMEANS
 
 PALETTE_DIR = 'palettes/'
 PALETTE_EXTENSIONS = ['png', 'gif', 'bmp']
 MAX_COLORS = 1024
+# colors in a generated palette unless specified, same as PIL's adaptive
+# palette conversion that generation used to use
+DEFAULT_GENERATED_COLORS = 256
 
 class PaletteLord:
     
-    # time in ms between checks for hot reload
-    hot_reload_check_interval = 2 * 1000
-    
     def __init__(self, app):
         self.app = app
-        self.last_check = 0
     
-    def check_hot_reload(self):
-        if self.app.get_elapsed_time() - self.last_check < self.hot_reload_check_interval:
-            return
-        self.last_check = self.app.get_elapsed_time()
-        changed = None
+    def watch(self, palette):
+        "Hot reload given palette when its image file changes."
+        self.app.fw.watch(palette.filename, self.file_changed)
+    
+    def file_changed(self, filename):
         for palette in self.app.palettes:
-            if palette.has_updated():
-                changed = palette.filename
-                try:
-                    palette.load_image()
-                    self.app.log('PaletteLord: success reloading %s' % palette.filename)
-                except:
-                    self.app.log('PaletteLord: failed reloading %s' % palette.filename, True)
+            if palette.filename != filename:
+                continue
+            try:
+                palette.load_image()
+                self.app.log('PaletteLord: success reloading %s' % palette.filename)
+            except:
+                self.app.log('PaletteLord: failed reloading %s' % palette.filename, True)
 
 
 class Palette:
@@ -43,7 +45,6 @@ class Palette:
         if self.filename is None:
             self.app.log("Couldn't find palette image %s" % src_filename)
             return
-        self.last_image_change = os.path.getmtime(self.filename)
         self.name = os.path.basename(self.filename)
         self.name = os.path.splitext(self.name)[0]
         self.load_image()
@@ -62,45 +63,37 @@ class Palette:
         width, height = src_img.size
         # store texture for chooser preview etc
         self.src_texture = Texture(src_img.tobytes(), width, height)
-        # scan image L->R T->B for unique colors, store em as tuples
+        # find image's unique colors in L->R T->B order, store em as tuples
+        pixels = np.array(src_img, dtype=np.uint8).reshape(-1, 4)
+        unique, first_seen = np.unique(pixels, axis=0, return_index=True)
+        unique = unique[np.argsort(first_seen)]
         # color 0 is always fully transparent
+        unique = unique[np.any(unique != 0, axis=1)]
         self.colors = [(0, 0, 0, 0)]
+        self.colors += [tuple(c) for c in unique[:MAX_COLORS - 1].tolist()]
         # determine lightest and darkest colors in palette for defaults
         lightest = 0
         darkest = 255 * 3 + 1
         self.lightest_index, self.darkest_index = 0, 0
-        for y in range(height):
-            for x in range(width):
-                # bail if we've now read max colors
-                if len(self.colors) >= MAX_COLORS:
-                    break
-                color = src_img.getpixel((x, y))
-                if not color in self.colors:
-                    self.colors.append(color)
-                    # is this lightest/darkest unique color so far? save index
-                    luminosity = color[0]*0.21 + color[1]*0.72 + color[2]*0.07
-                    if luminosity < darkest:
-                        darkest = luminosity
-                        self.darkest_index = len(self.colors) - 1
-                    elif luminosity > lightest:
-                        lightest = luminosity
-                        self.lightest_index = len(self.colors) - 1
-        # create new 1D image with unique colors
-        img = Image.new('RGBA', (MAX_COLORS, 1), (0, 0, 0, 0))
-        x = 0
-        for color in self.colors:
-            img.putpixel((x, 0), color)
-            x += 1
-        # debug: save out generated palette texture
-        #img.save('palette.png')
-        self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
+        for i,color in enumerate(self.colors[1:]):
+            # is this lightest/darkest unique color so far? save index
+            luminosity = color[0]*0.21 + color[1]*0.72 + color[2]*0.07
+            if luminosity < darkest:
+                darkest = luminosity
+                self.darkest_index = i + 1
+            elif luminosity > lightest:
+                lightest = luminosity
+                self.lightest_index = i + 1
+        self.create_texture()
     
-    def has_updated(self):
-        "return True if source image file has changed since last check"
-        changed = os.path.getmtime(self.filename) > self.last_image_change
-        if changed:
-            self.last_image_change = time.time()
-        return changed
+    def create_texture(self):
+        "creates 1D texture of our colors, and resets color lookups"
+        data = np.zeros((1, MAX_COLORS, 4), dtype=np.uint8)
+        data[0, :len(self.colors)] = self.colors
+        self.texture = Texture(data.tobytes(), MAX_COLORS, 1)
+        # colors may have changed (eg hot reload), rebuild lookups on demand
+        self.lab_colors = rgb_to_lab(np.array(self.colors)[:, :3])
+        self.closest_color_cache = {}
     
     def generate_image(self):
         width = min(16, len(self.colors) - 1)
@@ -145,29 +138,37 @@ class Palette:
             r, g, b = rand_byte(), rand_byte(), rand_byte()
         return r, g, b, a
     
+    def get_quantizer(self, dither=DITHER_NONE, transparent_color=(0, 0, 0),
+                      max_colors=MAX_COLORS, perceptual=False):
+        """
+        returns an ImageQuantizer for (up to max_colors of) this palette,
+        color 0 replaced with given transparent color if it isn't None.
+        if perceptual is True, always match colors in L*a*b (slower).
+        """
+        colors = [color[:3] for color in self.colors[:max_colors]]
+        if transparent_color is not None:
+            colors[0] = tuple(transparent_color)
+        return ImageQuantizer(colors, dither, perceptual)
+    
+    def quantize_image(self, src_img, dither=DITHER_NONE, perceptual=False):
+        "returns (height, width) array of this palette's indices for image"
+        return self.get_quantizer(dither, perceptual=perceptual).quantize(src_img)
+    
     def get_palettized_image(self, src_img, transparent_color=(0, 0, 0),
-                             force_no_transparency=False):
+                             force_no_transparency=False, dither=DITHER_NONE):
         "returns a copy of source image quantized to this palette"
-        pal_img = Image.new('P', (1, 1))
-        # source must be in RGB (no alpha) format
-        out_img = src_img.convert('RGB')
-        # Image.putpalette needs a flat tuple :/
-        colors = []
-        for i,color in enumerate(self.colors):
-            # ignore alpha for palettized image output
-            for channel in color[:-1]:
-                colors.append(channel)
         # user-defined color 0 in case we want to do 8-bit transparency
-        if not force_no_transparency:
-            colors[0:3] = transparent_color
-        # PIL will fill out <256 color palettes with bogus values :/
-        while len(colors) < MAX_COLORS * 3:
-            for i in range(3):
-                colors.append(0)
-        # palette for PIL must be exactly 256 colors
-        colors = colors[:256*3]
-        pal_img.putpalette(tuple(colors))
-        return out_img.quantize(palette=pal_img)
+        if force_no_transparency:
+            transparent_color = None
+        # PIL palettized images are limited to 256 colors
+        quantizer = self.get_quantizer(dither, transparent_color, 256)
+        indices = quantizer.quantize(src_img)
+        out_img = Image.fromarray(indices.astype(np.uint8), 'P')
+        # Image.putpalette needs a flat list, exactly 256 colors
+        colors = quantizer.rgb.flatten().tolist()
+        colors += [0] * (256 * 3 - len(colors))
+        out_img.putpalette(colors)
+        return out_img
     
     def are_colors_similar(self, color_index_a, palette_b, color_index_b,
                            tolerance=50):
@@ -182,19 +183,30 @@ class Palette:
         b_diff = abs(color_a[2] - color_b[2])
         return (r_diff + g_diff + b_diff) <= tolerance
     
+    def get_closest_color_indices(self, rgb):
+        """
+        returns array of indices of closest colors in this palette (by L*a*b
+        distance) to given array of base-255 RGB colors, shape (..., 3).
+        """
+        rgb = np.asarray(rgb)
+        lab = rgb_to_lab(rgb.reshape(-1, 3))
+        indices = np.empty(len(lab), dtype=np.int32)
+        # limit size of (colors x palette) distance array
+        chunk_size = max(1, 2**22 // len(self.lab_colors))
+        for i in range(0, len(lab), chunk_size):
+            chunk = lab[i:i+chunk_size]
+            # squared distance, same order as CIE 1976 delta
+            d = ((chunk[:, np.newaxis, :] - self.lab_colors[np.newaxis, :, :])**2).sum(axis=-1)
+            indices[i:i+chunk_size] = np.argmin(d, axis=1)
+        return indices.reshape(rgb.shape[:-1])
+    
     def get_closest_color_index(self, r, g, b):
-        "returns index of closest color in this palette to given color (kinda slow?)"
-        closest_diff = 99999999999
-        closest_diff_index = -1
-        for i,color in enumerate(self.colors):
-            l1, a1, b1 = rgb_to_lab(r, g, b)
-            l2, a2, b2 = rgb_to_lab(*color[:3])
-            diff = lab_color_diff(l1, a1, b1, l2, a2, b2)
-            if diff < closest_diff:
-                closest_diff = diff
-                closest_diff_index = i
-        #print('%s is closest to input color %s' % (self.colors[closest_diff_index], (r, g, b)))
-        return closest_diff_index
+        "returns index of closest color in this palette to given color"
+        color = (int(r), int(g), int(b))
+        if not color in self.closest_color_cache:
+            index = self.get_closest_color_indices(color)
+            self.closest_color_cache[color] = int(index)
+        return self.closest_color_cache[color]
     
     def get_random_color_index(self):
         # exclude transparent first index
@@ -229,40 +241,45 @@ class PaletteFromList(Palette):
             elif luminosity > lightest:
                 lightest = luminosity
                 self.lightest_index = len(self.colors) - 1
-        # create texture
-        img = Image.new('RGBA', (MAX_COLORS, 1), (0, 0, 0, 0))
-        x = 0
-        for color in self.colors:
-            img.putpixel((x, 0), color)
-            x += 1
-        self.texture = Texture(img.tobytes(), MAX_COLORS, 1)
+        self.create_texture()
         if log and not self.app.game_mode:
             self.app.log("generated new palette '%s'" % (self.name))
             self.app.log('  unique colors: %s' % int(len(self.colors)-1))
             self.app.log('  darkest color index: %s' % self.darkest_index)
             self.app.log('  lightest color index: %s' % self.lightest_index)
-    
-    def has_updated(self):
-        "No bitmap source for this type of palette, so no hot-reload"
-        return False
 
 
 class PaletteFromFile(Palette):
     
-    def __init__(self, app, src_filename, palette_filename, colors=MAX_COLORS):
+    """
+    palette generated from the colors of a source image, or of every image
+    in a source folder / list of images
+    """
+    
+    def __init__(self, app, src_filename, palette_filename,
+                 colors=DEFAULT_GENERATED_COLORS, method=METHOD_KMEANS,
+                 locked_colors=None):
         self.init_success = False
-        src_filename = app.find_filename_path(src_filename)
+        if isinstance(src_filename, str) and not os.path.isdir(src_filename):
+            src_filename = app.find_filename_path(src_filename)
         if not src_filename:
             app.log("Couldn't find palette source image %s" % src_filename)
             return
-        # dither source image, re-save it, use that as the source for a palette
-        src_img = Image.open(src_filename)
-        # method:
-        src_img = src_img.convert('P', None, Image.FLOYDSTEINBERG, Image.ADAPTIVE, colors)
-        src_img = src_img.convert('RGBA')
-        # write converted source image with new filename
+        src_filenames = get_image_filenames(src_filename)
+        try:
+            samples = sample_images(src_filenames)
+        except Exception as e:
+            app.log("Couldn't read palette source images: %s" % e)
+            return
+        # color 0 is reserved for transparency
+        colors = min(colors, MAX_COLORS - 1)
+        palette_colors = generate_palette(samples, colors, method,
+                                          locked_colors or [])
+        if len(palette_colors) == 0:
+            app.log("Couldn't find any colors in palette source images")
+            return
         # snip path & extension if it has em
-        palette_filename = os.path.basename(palette_filename)
+        palette_filename = os.path.basename(os.path.normpath(palette_filename))
         palette_filename = os.path.splitext(palette_filename)[0]
         # get most appropriate path for palette image
         palette_path = app.get_dirnames(PALETTE_DIR, False)[0]
@@ -274,7 +291,6 @@ class PaletteFromFile(Palette):
             palette_filename += str(i)
         # (re-)add path and PNG extension
         palette_filename = palette_path + palette_filename + '.png'
-        src_img.save(palette_filename)
-        # create the actual palette and export it as an image
+        save_palette_image(palette_colors, palette_filename)
+        # create the actual palette from the image we just wrote
         Palette.__init__(self, app, palette_filename, True)
-        self.export_as_image()
@@ -0,0 +1,156 @@
+# palette generation from one or many source images:
+# samples pixels across all images, then picks colors in L*a*b space by
+# median cut, optionally refined with mini-batch k-means.
+
+import os
+import numpy as np
+from PIL import Image
+
+from color_space import rgb_to_lab, lab_to_rgb
+
+METHOD_MEDIAN_CUT = 'median-cut'
+METHOD_KMEANS = 'k-means'
+PALETTE_METHODS = [METHOD_MEDIAN_CUT, METHOD_KMEANS]
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.bmp', '.gif']
+
+# total pixels sampled across all source images
+DEFAULT_SAMPLE_COUNT = 200000
+# pixels less opaque than this are ignored
+MIN_SAMPLE_ALPHA = 128
+KMEANS_ITERATIONS = 100
+KMEANS_BATCH_SIZE = 4096
+
+def get_image_filenames(src):
+    "returns list of image files for given filename, folder or list of either"
+    if isinstance(src, str):
+        src = [src]
+    filenames = []
+    for filename in src:
+        if not os.path.isdir(filename):
+            filenames.append(filename)
+            continue
+        for f in sorted(os.listdir(filename)):
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS:
+                filenames.append(os.path.join(filename, f))
+    return filenames
+
+def sample_images(filenames, sample_count=DEFAULT_SAMPLE_COUNT, seed=0):
+    "returns (N, 3) base-255 RGB array of pixels sampled from given images"
+    rng = np.random.default_rng(seed)
+    per_image = max(1, sample_count // max(1, len(filenames)))
+    samples = []
+    for filename in filenames:
+        pixels = np.asarray(Image.open(filename).convert('RGBA')).reshape(-1, 4)
+        pixels = pixels[pixels[:, 3] >= MIN_SAMPLE_ALPHA, :3]
+        if len(pixels) > per_image:
+            pixels = pixels[rng.choice(len(pixels), per_image, replace=False)]
+        samples.append(pixels)
+    if len(samples) == 0:
+        return np.zeros((0, 3), dtype=np.uint8)
+    return np.concatenate(samples)
+
+def median_cut(lab, weights, count):
+    """
+    returns up to count (N, 3) L*a*b colors by repeatedly splitting the box
+    of given unique colors with the highest total squared error at its
+    weighted median
+    """
+    def get_mean(box):
+        return np.average(lab[box], axis=0, weights=weights[box])
+    def get_error(box):
+        return (((lab[box] - get_mean(box))**2).sum(axis=1) * weights[box]).sum()
+    # boxes are arrays of indices into lab
+    boxes = [np.arange(len(lab))]
+    errors = [get_error(boxes[0])]
+    while len(boxes) < count:
+        i = int(np.argmax(errors))
+        # nothing left worth splitting
+        if errors[i] <= 0:
+            break
+        box = boxes.pop(i)
+        errors.pop(i)
+        values = lab[box]
+        axis = np.argmax(values.max(axis=0) - values.min(axis=0))
+        box = box[np.argsort(values[:, axis], kind='stable')]
+        cumulative = np.cumsum(weights[box])
+        half = np.searchsorted(cumulative, cumulative[-1] / 2)
+        half = min(max(half, 1), len(box) - 1)
+        for new_box in [box[:half], box[half:]]:
+            boxes.append(new_box)
+            errors.append(get_error(new_box))
+    return np.array([get_mean(box) for box in boxes])
+
+def get_nearest(points, centers):
+    "returns index of nearest center for each point"
+    # |a - b|^2 = |a|^2 - 2ab + |b|^2, and |a|^2 doesn't affect argmin
+    d = (centers**2).sum(axis=1) - 2 * (points @ centers.T)
+    return np.argmin(d, axis=1)
+
+def kmeans(lab, centers, locked=0, iterations=KMEANS_ITERATIONS,
+           batch_size=KMEANS_BATCH_SIZE, seed=0):
+    """
+    refines given initial centers for given L*a*b colors with mini-batch
+    k-means; first [locked] centers never move.
+    """
+    rng = np.random.default_rng(seed)
+    centers = centers.astype(np.float64)
+    counts = np.zeros(len(centers))
+    for i in range(iterations):
+        batch = lab[rng.integers(0, len(lab), batch_size)]
+        nearest = get_nearest(batch, centers)
+        batch_counts = np.bincount(nearest, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, nearest, batch)
+        counts += batch_counts
+        # move each center toward the mean of every point it's been given,
+        # with a learning rate of 1 / total points
+        hit = batch_counts > 0
+        hit[:locked] = False
+        centers[hit] += (sums[hit] - batch_counts[hit, np.newaxis] * centers[hit]) / counts[hit, np.newaxis]
+    return centers
+
+def generate_palette(rgb, count, method=METHOD_KMEANS, locked_colors=None):
+    """
+    returns list of up to count base-255 RGB tuples for given (N, 3) RGB
+    samples; locked colors are always included, at the start of the list.
+    """
+    locked_colors = locked_colors or []
+    locked = np.array([c[:3] for c in locked_colors], dtype=np.float64).reshape(-1, 3)
+    free_count = max(0, count - len(locked))
+    # images often have far fewer unique colors than pixels
+    keys = rgb.astype(np.int32)
+    keys = (keys[:, 0] << 16) | (keys[:, 1] << 8) | keys[:, 2]
+    keys, weights = np.unique(keys, return_counts=True)
+    unique = np.stack([keys >> 16, (keys >> 8) & 255, keys & 255], axis=-1)
+    unique_lab = rgb_to_lab(unique.astype(np.float64))
+    if len(unique) == 0 or free_count == 0:
+        free = np.zeros((0, 3))
+    elif len(unique) <= free_count:
+        free = unique_lab
+    else:
+        free = median_cut(unique_lab, weights, free_count)
+        if method == METHOD_KMEANS:
+            lab = rgb_to_lab(rgb.astype(np.float64))
+            centers = np.concatenate([rgb_to_lab(locked), free])
+            free = kmeans(lab, centers, len(locked))[len(locked):]
+    # darkest to lightest
+    free = free[np.argsort(free[:, 0])]
+    free = np.clip(np.round(lab_to_rgb(free)), 0, 255)
+    colors = []
+    for color in np.concatenate([locked, free]).astype(int).tolist():
+        # centers can round to the same RGB color
+        if not tuple(color) in colors:
+            colors.append(tuple(color))
+    return colors[:count]
+
+def save_palette_image(colors, filename, width=16, block_size=8):
+    "writes given colors as a grid of swatches that Palette can load"
+    rows = int(np.ceil(len(colors) / width))
+    data = np.zeros((rows * width, 4), dtype=np.uint8)
+    data[:len(colors), :3] = [c[:3] for c in colors]
+    data[:len(colors), 3] = 255
+    data = data.reshape(rows, width, 4)
+    # scale up
+    data = data.repeat(block_size, axis=0).repeat(block_size, axis=1)
+    Image.fromarray(data, 'RGBA').save(filename)
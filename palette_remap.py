@@ -0,0 +1,159 @@
+import numpy as np
+
+from texture import Texture
+from palette import MAX_COLORS
+
+class ColorCycle:
+    
+    "Range of palette indices whose colors rotate over time."
+    
+    def __init__(self, start_index, end_index, rate):
+        self.start_index, self.end_index = start_index, end_index
+        self.rate = rate
+        "Steps per second; negative rotates the other way"
+        self.offset = 0
+    
+    def get_offset(self, elapsed_seconds):
+        length = self.end_index - self.start_index + 1
+        return int(elapsed_seconds * self.rate) % length
+
+
+class PaletteRemap:
+    
+    """
+    Per-renderable indirection between an Art's color indices and the colors
+    drawn: index remapping, palette swaps, tints/fades/flashes and color
+    cycling all change one small palette texture, never the tile data.
+    Color 0 always stays transparent.
+    """
+    
+    def __init__(self, renderable):
+        self.renderable = renderable
+        self.app = renderable.app
+        self.remap = np.arange(MAX_COLORS)
+        "Palette index drawn for each color index in Art"
+        self.swap_palette = None
+        "If set, draw this palette's colors instead of Art's"
+        self.tint_color = np.zeros(3)
+        self.tint_amount = 0.
+        # (start amount, end amount, start time, duration) of tint fade
+        self.tint_fade = None
+        self.cycles = []
+        self.texture = None
+        self.colors = None
+        "(MAX_COLORS, 4) base-255 RGBA array of colors drawn"
+        self.version = 0
+        "Incremented every time our colors change"
+        self.changed = True
+        # last seen base palette colors, for hot reloads/palette changes
+        self.last_palette_colors = None
+    
+    def get_time(self):
+        "Seconds elapsed; stops while game is paused."
+        if self.app.game_mode:
+            return self.app.gw.get_elapsed_time() / 1000
+        return self.app.get_elapsed_time() / 1000
+    
+    def set_remap(self, src_index, dest_index):
+        "Draw color src_index with color dest_index."
+        if src_index == 0:
+            return
+        self.remap[src_index] = dest_index
+        self.changed = True
+    
+    def set_remap_table(self, table):
+        "Apply a dict of {src index: dest index} remaps, eg a fade ramp."
+        for src_index, dest_index in table.items():
+            self.set_remap(src_index, dest_index)
+    
+    def set_all_colors(self, dest_index):
+        "Draw every non-transparent color as given color."
+        self.remap[1:] = dest_index
+        self.changed = True
+    
+    def set_swap_palette(self, palette):
+        "Draw given palette's colors instead of our Art's; None to restore."
+        self.swap_palette = palette
+        self.changed = True
+    
+    def set_tint(self, color, amount):
+        "Blend all colors toward given base-255 RGB color by given 0-1 amount."
+        self.tint_color = np.array(color[:3], dtype=np.float64)
+        self.tint_amount = amount
+        self.tint_fade = None
+        self.changed = True
+    
+    def fade_tint(self, color, amount, duration):
+        "Animate tint to given color and amount over given seconds."
+        self.tint_color = np.array(color[:3], dtype=np.float64)
+        self.tint_fade = (self.tint_amount, amount, self.get_time(), duration)
+    
+    def flash(self, color=(255, 255, 255), duration=0.25):
+        "Fully tint with given color, then fade back to none."
+        self.set_tint(color, 1)
+        self.fade_tint(color, 0, duration)
+    
+    def add_cycle(self, start_index, end_index, rate):
+        "Rotate colors in given (inclusive) index range at given steps/second."
+        self.cycles.append(ColorCycle(start_index, end_index, rate))
+        self.changed = True
+    
+    def clear_cycles(self):
+        self.cycles = []
+        self.changed = True
+    
+    def reset(self):
+        "Remove all remaps, swaps, tints and cycles."
+        self.remap = np.arange(MAX_COLORS)
+        self.swap_palette = None
+        self.tint_amount, self.tint_fade = 0., None
+        self.cycles = []
+        self.changed = True
+    
+    def is_animating(self):
+        return bool(self.cycles) or self.tint_fade is not None
+    
+    def update(self):
+        "Advance animations, upload new colors if anything changed."
+        now = self.get_time()
+        for cycle in self.cycles:
+            offset = cycle.get_offset(now)
+            if offset != cycle.offset:
+                cycle.offset = offset
+                self.changed = True
+        if self.tint_fade:
+            start_amount, end_amount, start_time, duration = self.tint_fade
+            t = 1 if duration <= 0 else min(1, (now - start_time) / duration)
+            self.tint_amount = start_amount + (end_amount - start_amount) * t
+            if t >= 1:
+                self.tint_fade = None
+            self.changed = True
+        palette = self.swap_palette or self.renderable.art.palette
+        if palette.colors is not self.last_palette_colors:
+            self.last_palette_colors = palette.colors
+            self.changed = True
+        if self.changed:
+            self.update_colors(palette)
+    
+    def update_colors(self, palette):
+        base = np.zeros((MAX_COLORS, 4))
+        base[:len(palette.colors)] = palette.colors
+        remap = self.remap.copy()
+        for cycle in self.cycles:
+            indices = np.arange(cycle.start_index, cycle.end_index + 1)
+            remap[indices] = self.remap[np.roll(indices, -cycle.offset)]
+        colors = base[remap.clip(0, MAX_COLORS - 1)]
+        if self.tint_amount:
+            colors[:, :3] += (self.tint_color - colors[:, :3]) * self.tint_amount
+        colors[0] = 0
+        self.colors = colors.round().astype(np.uint8)
+        if not self.texture:
+            self.texture = Texture(self.colors.tobytes(), MAX_COLORS, 1)
+        else:
+            self.texture.update_data(self.colors.tobytes())
+        self.version += 1
+        self.changed = False
+    
+    def destroy(self):
+        if self.texture:
+            self.texture.destroy()
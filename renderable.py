@@ -1,8 +1,10 @@
 import os, math, ctypes
 import numpy as np
 from OpenGL import GL
-from art import VERT_LENGTH
+from art import VERT_LENGTH, ELEM_STRIDE
 from palette import MAX_COLORS
+from renderable_cache import LayerRenderCache, LayerLODRenderer
+from palette_remap import PaletteRemap
 
 # inactive layer alphas
 LAYER_VIS_FULL = 1
@@ -31,6 +33,16 @@ class TileRenderable:
     default_move_rate = 1
     use_art_offset = True
     "Use game object's art_off_pct values."
+    use_render_cache = True
+    "Bake unchanging layers to textures, see LayerRenderCache."
+    chunk_size = 32
+    "Width and height in tiles of the chunks large Arts are split into."
+    min_chunked_tiles = 64 * 64
+    "Arts with at least this many tiles per layer are drawn in chunks."
+    cull_to_camera = True
+    "Skip drawing chunks outside the camera's view; False for screen space."
+    use_lod = True
+    "Draw low detail version when zoomed far out, see LayerLODRenderer."
     
     def __init__(self, app, art, game_object=None):
         "Create Renderable with given Art, optionally bound to given GameObject"
@@ -90,6 +102,14 @@ class TileRenderable:
         # finish
         if self.app.use_vao:
             GL.glBindVertexArray(0)
+        # GameObjects opt in to render caching individually
+        self.render_cache = None
+        if self.use_render_cache and (not self.go or self.go.use_render_cache):
+            self.render_cache = LayerRenderCache(self)
+        # created the first time we're zoomed out far enough to need it
+        self.lod = None
+        self.palette_remap = None
+        "PaletteRemap for recoloring us without touching tile data, if any"
         if self.log_create_destroy:
             self.app.log('created: %s' % self)
     
@@ -101,11 +121,12 @@ class TileRenderable:
         return '%s %s %s' % (self.art.get_simple_name(), self.__class__.__name__, i)
     
     def create_buffers(self):
+        self.build_chunks()
         # vertex positions and elements
         # determine vertex count needed for render
         self.vert_count = int(len(self.art.elem_array))
         self.vert_buffer, self.elem_buffer = GL.glGenBuffers(2)
-        self.update_buffer(self.vert_buffer, self.art.vert_array,
+        self.update_buffer(self.vert_buffer, self.get_chunked_array(self.art.vert_array),
                            GL.GL_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_FLOAT, 'vertPosition', VERT_LENGTH)
         self.update_buffer(self.elem_buffer, self.art.elem_array,
                            GL.GL_ELEMENT_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_UNSIGNED_INT, None, None)
@@ -113,26 +134,100 @@ class TileRenderable:
         # use GL_DYNAMIC_DRAW given they change every time a char/color changes
         self.char_buffer, self.uv_buffer = GL.glGenBuffers(2)
         # character indices (which become vertex UVs)
-        self.update_buffer(self.char_buffer, self.art.chars[self.frame],
+        self.update_buffer(self.char_buffer, self.get_chunked_array(self.art.chars[self.frame]),
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'charIndex', 1)
         # UV "mods" - modify UV derived from character index
-        self.update_buffer(self.uv_buffer, self.art.uv_mods[self.frame],
+        self.update_buffer(self.uv_buffer, self.get_chunked_array(self.art.uv_mods[self.frame]),
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'uvMod', 2)
         self.fg_buffer, self.bg_buffer = GL.glGenBuffers(2)
         # foreground/background color indices (which become rgba colors)
-        self.update_buffer(self.fg_buffer, self.art.fg_colors[self.frame],
+        self.update_buffer(self.fg_buffer, self.get_chunked_array(self.art.fg_colors[self.frame]),
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'fgColorIndex', 1)
-        self.update_buffer(self.bg_buffer, self.art.bg_colors[self.frame],
+        self.update_buffer(self.bg_buffer, self.get_chunked_array(self.art.bg_colors[self.frame]),
                            GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW, GL.GL_FLOAT, 'bgColorIndex', 1)
     
+    def build_chunks(self):
+        """
+        Split large Arts into chunk_size square chunks of tiles. Tile data is
+        uploaded grouped by chunk rather than by row, so each chunk occupies
+        one contiguous range of our buffers that can be drawn or updated on
+        its own.
+        """
+        w, h = self.art.width, self.art.height
+        self.chunked = w * h >= self.min_chunked_tiles
+        if not self.chunked:
+            self.chunk_cols = self.chunk_rows = 1
+            self.chunk_starts = np.array([0, w * h])
+            self.tile_order = None
+            return
+        cs = self.chunk_size
+        self.chunk_cols = math.ceil(w / cs)
+        self.chunk_rows = math.ceil(h / cs)
+        order = []
+        starts = [0]
+        tile_indices = np.arange(w * h).reshape(h, w)
+        for cy in range(self.chunk_rows):
+            for cx in range(self.chunk_cols):
+                chunk = tile_indices[cy*cs:(cy+1)*cs, cx*cs:(cx+1)*cs].ravel()
+                order.append(chunk)
+                starts.append(starts[-1] + len(chunk))
+        # chunk_starts[i] = first tile of chunk i, within each layer
+        self.chunk_starts = np.array(starts)
+        self.tile_order = np.concatenate(order)
+    
+    def get_chunked_array(self, array):
+        "Return given per-tile array of all layers, in chunk order."
+        if not self.chunked:
+            return array
+        layers = array.shape[0]
+        tiles = array.reshape(layers, self.art.width * self.art.height, -1)
+        return np.ascontiguousarray(tiles[:, self.tile_order])
+    
+    def get_chunks_in_bounds(self, left, top, right, bottom):
+        "Return (x0, y0, x1, y1) range of chunks overlapping given tile bounds."
+        cs = self.chunk_size
+        x0 = max(0, int(left // cs))
+        y0 = max(0, int(top // cs))
+        x1 = min(self.chunk_cols, int(math.ceil(right / cs)))
+        y1 = min(self.chunk_rows, int(math.ceil(bottom / cs)))
+        return x0, y0, x1, y1
+    
+    def get_visible_chunks(self, z):
+        "Return (x0, y0, x1, y1) range of chunks on camera at given Z."
+        all_chunks = (0, 0, self.chunk_cols, self.chunk_rows)
+        if not self.chunked or not self.cull_to_camera or self.exporting:
+            return all_chunks
+        bounds = self.camera.get_visible_bounds(z)
+        if not bounds:
+            return all_chunks
+        left, top, right, bottom = bounds
+        x, y, _ = self.get_loc()
+        scale_x, scale_y, _ = self.get_scale()
+        tile_w = scale_x * self.art.quad_width
+        tile_h = scale_y * self.art.quad_height
+        if tile_w == 0 or tile_h == 0:
+            return all_chunks
+        # world space -> tile space; negative (flipped) scale swaps edges
+        tile_left, tile_right = sorted(((left - x) / tile_w, (right - x) / tile_w))
+        tile_top, tile_bottom = sorted(((y - top) / tile_h, (y - bottom) / tile_h))
+        return self.get_chunks_in_bounds(tile_left, tile_top, tile_right, tile_bottom)
+    
     def update_geo_buffers(self):
-        self.update_buffer(self.vert_buffer, self.art.vert_array, GL.GL_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_FLOAT, None, None)
+        # chunk layout depends on Art size, rebuild it and re-upload tile data
+        self.build_chunks()
+        self.update_buffer(self.vert_buffer, self.get_chunked_array(self.art.vert_array), GL.GL_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_FLOAT, None, None)
         self.update_buffer(self.elem_buffer, self.art.elem_array, GL.GL_ELEMENT_ARRAY_BUFFER, GL.GL_STATIC_DRAW, GL.GL_UNSIGNED_INT, None, None)
         # total vertex count probably changed
         self.vert_count = int(len(self.art.elem_array))
+        self.update_tile_buffers(True, True, True, True)
     
-    def update_tile_buffers(self, update_chars, update_uvs, update_fg, update_bg):
-        "Update GL data arrays for tile characters, fg/bg colors, transforms."
+    def update_tile_buffers(self, update_chars, update_uvs, update_fg, update_bg,
+                            changed_bounds=None):
+        """
+        Update GL data arrays for tile characters, fg/bg colors, transforms.
+        If changed_bounds (left, top, right, bottom) tile rect is given and
+        we're drawn in chunks, only re-upload chunks within it.
+        """
         updates = {}
         if update_chars:
             updates[self.char_buffer] = self.art.chars
@@ -143,9 +238,34 @@ class TileRenderable:
         if update_bg:
             updates[self.bg_buffer] = self.art.bg_colors
         for update in updates:
-            self.update_buffer(update, updates[update][self.frame],
+            if self.chunked and changed_bounds:
+                self.update_buffer_chunks(update, updates[update][self.frame],
+                                          changed_bounds)
+                continue
+            self.update_buffer(update, self.get_chunked_array(updates[update][self.frame]),
                                GL.GL_ARRAY_BUFFER, GL.GL_DYNAMIC_DRAW,
                                GL.GL_FLOAT, None, None)
+        if self.render_cache:
+            self.render_cache.art_changed()
+        if self.lod:
+            self.lod.art_changed(changed_bounds)
+    
+    def update_buffer_chunks(self, buffer_index, array, changed_bounds):
+        "Re-upload only chunks of given tile array within given tile bounds."
+        x0, y0, x1, y1 = self.get_chunks_in_bounds(*changed_bounds)
+        cs = self.chunk_size
+        layer_tiles = self.art.width * self.art.height
+        # bytes per tile
+        tile_size = array[0][0][0].nbytes
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer_index)
+        for layer in range(self.art.layers):
+            for cy in range(y0, y1):
+                for cx in range(x0, x1):
+                    chunk = cy * self.chunk_cols + cx
+                    data = np.ascontiguousarray(array[layer, cy*cs:(cy+1)*cs, cx*cs:(cx+1)*cs])
+                    offset = (layer * layer_tiles + self.chunk_starts[chunk]) * tile_size
+                    GL.glBufferSubData(GL.GL_ARRAY_BUFFER, int(offset), data.nbytes, data)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
     
     def update_buffer(self, buffer_index, array, target, buffer_type, data_type,
                       attrib_name, attrib_size):
@@ -200,10 +320,28 @@ class TileRenderable:
         self.art.renderables.append(self)
         # make sure frame is valid
         self.frame %= self.art.frames
+        # also updates tile buffers
         self.update_geo_buffers()
-        self.update_tile_buffers(True, True, True, True)
         #print('%s now uses Art %s' % (self, self.art.filename))
     
+    def get_palette_remap(self):
+        "Return our PaletteRemap, creating it if needed."
+        if not self.palette_remap:
+            self.palette_remap = PaletteRemap(self)
+        return self.palette_remap
+    
+    def get_palette_texture(self):
+        "Return GL texture our tile colors are looked up in."
+        if self.palette_remap and self.palette_remap.texture:
+            return self.palette_remap.texture.gltex
+        return self.art.palette.texture.gltex
+    
+    def get_palette_colors(self):
+        "Return list/array of base-255 RGBA colors we draw, by color index."
+        if self.palette_remap and self.palette_remap.colors is not None:
+            return self.palette_remap.colors
+        return self.art.palette.colors
+    
     def reset_size(self):
         self.width = self.art.width * self.art.quad_width * abs(self.scale_x)
         self.height = self.art.height * self.art.quad_height * self.scale_y
@@ -280,6 +418,8 @@ class TileRenderable:
             self.update_transform_from_object(self.go)
         if self.ui_moving:
             self.update_loc()
+        if self.palette_remap:
+            self.palette_remap.update()
         if not self.animating:
             return
         if self.app.game_mode and self.app.gw.paused:
@@ -302,6 +442,12 @@ class TileRenderable:
         if self.app.use_vao:
             GL.glDeleteVertexArrays(1, [self.vao])
         GL.glDeleteBuffers(6, [self.vert_buffer, self.elem_buffer, self.char_buffer, self.uv_buffer, self.fg_buffer, self.bg_buffer])
+        if self.render_cache:
+            self.render_cache.destroy()
+        if self.lod:
+            self.lod.destroy()
+        if self.palette_remap:
+            self.palette_remap.destroy()
         if self.art and self in self.art.renderables:
             self.art.renderables.remove(self)
         if self.log_create_destroy:
@@ -345,6 +491,38 @@ class TileRenderable:
         self.art.app.inactive_layer_visibility = ilv
         self.exporting = False
     
+    def render_layer_for_cache(self, layer):
+        "Render given layer in Art space for our LayerRenderCache to bake."
+        self.exporting = True
+        self.render_tiles([layer], None, 1.0, baking=True)
+        self.exporting = False
+    
+    def get_layer_alpha(self, layer):
+        # for active art, dim all but active layer based on UI setting
+        if not self.app.game_mode and self.art is self.app.ui.active_art and layer != self.art.active_layer:
+            return self.alpha * self.app.inactive_layer_visibility
+        return self.alpha
+    
+    def get_layer_z(self, layer, z_override=None):
+        # use position offset instead of baked-in Z for layers - this
+        # way a layer's Z can change w/o rebuilding its vert array
+        x, y, z = self.get_loc()
+        # for export, render all layers at same Z
+        if not self.exporting:
+            z += self.art.layers_z[layer]
+            z = z_override if z_override else z
+        return z
+    
+    def is_low_detail(self, z):
+        "Return True if our tiles at given Z are too small on screen to draw."
+        if not self.use_lod or not self.cull_to_camera or self.exporting:
+            return False
+        scale_x, scale_y, _ = self.get_scale()
+        tile_size = min(abs(self.art.quad_width * scale_x),
+                        abs(self.art.quad_height * scale_y))
+        tile_pixels = tile_size * self.camera.get_pixels_per_unit(z)
+        return tile_pixels < LayerLODRenderer.max_tile_pixels
+    
     def render(self, layers=None, z_override=None, brightness=1.0):
         """
         Render given list of layers at given Z depth.
@@ -354,6 +532,55 @@ class TileRenderable:
         """
         if not self.visible:
             return
+        # draw all specified layers if no list given
+        if layers is None:
+            # sort layers in Z depth
+            layers = list(range(self.art.layers))
+            layers.sort(key=lambda i: self.art.layers_z[i], reverse=False)
+        # handle a single int param
+        elif type(layers) is int:
+            layers = [layers]
+        if brightness == 1 and self.is_low_detail(self.get_loc()[2]):
+            if not self.lod:
+                self.lod = LayerLODRenderer(self)
+            # Arts too big for the low detail textures keep drawing tiles
+            if self.lod.can_draw():
+                self.render_low_detail(layers, z_override)
+                return
+        # baked layers can't be brightened or grained, and animated colors
+        # would need rebaking every frame
+        if not self.render_cache or self.exporting or brightness != 1 or \
+           self.grain_strength or \
+           (self.palette_remap and self.palette_remap.is_animating()):
+            self.render_tiles(layers, z_override, brightness)
+            return
+        self.render_cache.update()
+        # draw runs of unbaked layers directly, in between baked ones
+        unbaked = []
+        for i in layers:
+            if not self.app.show_hidden_layers and not self.art.layers_visibility[i]:
+                continue
+            if not self.render_cache.is_layer_baked(i):
+                unbaked.append(i)
+                continue
+            if unbaked:
+                self.render_tiles(unbaked, z_override, brightness)
+                unbaked = []
+            self.render_cache.render_layer(i, self.get_layer_alpha(i),
+                                           self.get_layer_z(i, z_override))
+        if unbaked:
+            self.render_tiles(unbaked, z_override, brightness)
+    
+    def render_low_detail(self, layers, z_override):
+        self.lod.update()
+        for i in layers:
+            if not self.app.show_hidden_layers and not self.art.layers_visibility[i]:
+                continue
+            self.lod.render_layer(i, self.get_layer_alpha(i),
+                                  self.get_layer_z(i, z_override))
+    
+    def render_tiles(self, layers, z_override, brightness, baking=False):
+        "Render given list of layers from our tile buffers."
         GL.glUseProgram(self.shader.program)
         # bind textures - character set, palette, UI grain
         GL.glActiveTexture(GL.GL_TEXTURE0)
@@ -361,7 +588,7 @@ class TileRenderable:
         GL.glBindTexture(GL.GL_TEXTURE_2D, self.art.charset.texture.gltex)
         GL.glActiveTexture(GL.GL_TEXTURE1)
         GL.glUniform1i(self.palette_tex_uniform, 1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.art.palette.texture.gltex)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.get_palette_texture())
         GL.glActiveTexture(GL.GL_TEXTURE2)
         GL.glUniform1i(self.grain_tex_uniform, 2)
         GL.glBindTexture(GL.GL_TEXTURE_2D, self.app.ui.grain_texture.gltex)
@@ -412,38 +639,32 @@ class TileRenderable:
             GL.glEnableVertexAttribArray(attrib('bgColorIndex'))
         # finally, bind element buffer
         GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self.elem_buffer)
-        GL.glEnable(GL.GL_BLEND)
-        GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
-        # draw all specified layers if no list given
-        if layers is None:
-            # sort layers in Z depth
-            layers = list(range(self.art.layers))
-            layers.sort(key=lambda i: self.art.layers_z[i], reverse=False)
-        # handle a single int param
-        elif type(layers) is int:
-            layers = [layers]
+        # bakes store unblended tile colors, alpha is applied when drawn
+        if not baking:
+            GL.glEnable(GL.GL_BLEND)
+            GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
         layer_size = int(len(self.art.elem_array) / self.art.layers)
         for i in layers:
             # skip game mode-hidden layers
             if not self.app.show_hidden_layers and not self.art.layers_visibility[i]:
                 continue
             layer_start = i * layer_size
-            layer_end = layer_start + layer_size
-            # for active art, dim all but active layer based on UI setting
-            if not self.app.game_mode and self.art is self.app.ui.active_art and i != self.art.active_layer:
-                GL.glUniform1f(self.alpha_uniform, self.alpha * self.app.inactive_layer_visibility)
-            else:
-                GL.glUniform1f(self.alpha_uniform, self.alpha)
-            # use position offset instead of baked-in Z for layers - this
-            # way a layer's Z can change w/o rebuilding its vert array
-            x, y, z = self.get_loc()
-            # for export, render all layers at same Z
-            if not self.exporting:
-                z += self.art.layers_z[i]
-                z = z_override if z_override else z
+            alpha = 1 if baking else self.get_layer_alpha(i)
+            GL.glUniform1f(self.alpha_uniform, alpha)
+            x, y, _ = self.get_loc()
+            z = self.get_layer_z(i, z_override)
             GL.glUniform3f(self.position_uniform, x, y, z)
-            GL.glDrawElements(GL.GL_TRIANGLES, layer_size, GL.GL_UNSIGNED_INT,
-                ctypes.c_void_p(layer_start * ctypes.sizeof(ctypes.c_uint)))
+            # draw each row of visible chunks, which are contiguous in buffer
+            cx0, cy0, cx1, cy1 = self.get_visible_chunks(z)
+            if cx1 <= cx0:
+                continue
+            for cy in range(cy0, cy1):
+                first = self.chunk_starts[cy * self.chunk_cols + cx0]
+                last = self.chunk_starts[cy * self.chunk_cols + cx1]
+                elem_start = layer_start + first * ELEM_STRIDE
+                GL.glDrawElements(GL.GL_TRIANGLES, int((last - first) * ELEM_STRIDE),
+                                  GL.GL_UNSIGNED_INT,
+                                  ctypes.c_void_p(int(elem_start) * ctypes.sizeof(ctypes.c_uint)))
         GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
         GL.glDisable(GL.GL_BLEND)
         if self.app.use_vao:
@@ -474,6 +695,9 @@ class GameObjectRenderable(TileRenderable):
         Returns world space location as (x, y, z) tuple, offset by our
         GameObject's location.
         """
+        # exports and render cache bakes draw us at the export origin
+        if self.exporting:
+            return TileRenderable.get_loc(self)
         x, y, z = self.x, self.y, self.z
         if self.go:
             off_x, off_y, off_z = self.go.get_render_offset()
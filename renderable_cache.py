@@ -0,0 +1,443 @@
+import ctypes
+from collections import OrderedDict
+
+import numpy as np
+from OpenGL import GL
+
+
+class CachedLayer:
+    
+    "Baked texture and change tracking state for one layer of a LayerRenderCache."
+    
+    def __init__(self, tile_data):
+        self.tile_data = tile_data
+        "Snapshot of layer's tile data, compared to detect changes"
+        self.stable_renders = 0
+        "Number of consecutive renders this layer's tile data hasn't changed"
+        self.texture = None
+        "GL texture layer is baked into, None if not (yet) baked"
+        self.texture_bytes = 0
+        self.evicted = False
+        "Set when bake was evicted to stay within budget; rebakes wait longer"
+
+
+class LayerTextureRenderer:
+    
+    """
+    Base class for drawing stand-in textures for a TileRenderable's layers,
+    each as a single quad covering the Renderable's Art.
+    """
+    
+    vert_array = np.array([[0, 0], [1, 0], [0, 1], [1, 1]], dtype=np.float32)
+    vert_shader_source = 'renderable_cache_v.glsl'
+    frag_shader_source = 'sprite_f.glsl'
+    quad_vao = None
+    quad_vert_buffer = None
+    quad_users = 0
+    "Number of live instances using the shared quad"
+    
+    def __init__(self, renderable):
+        self.renderable = renderable
+        self.app = renderable.app
+        self.layers = {}
+        self.key = None
+        "Settings our layer textures were generated with, see get_key"
+        self.shader = self.app.sl.new_shader(self.vert_shader_source, self.frag_shader_source)
+        self.proj_matrix_uniform = self.shader.get_uniform_location('projection')
+        self.view_matrix_uniform = self.shader.get_uniform_location('view')
+        self.position_uniform = self.shader.get_uniform_location('objectPosition')
+        self.scale_uniform = self.shader.get_uniform_location('objectScale')
+        self.art_size_uniform = self.shader.get_uniform_location('artSize')
+        self.tex_uniform = self.shader.get_uniform_location('texture0')
+        self.tex_scale_uniform = self.shader.get_uniform_location('texScale')
+        self.alpha_uniform = self.shader.get_uniform_location('alpha')
+        self.pos_attrib = self.shader.get_attrib_location('vertPosition')
+        # every instance draws the same unit quad with the same shader
+        if LayerTextureRenderer.quad_users == 0:
+            self.create_quad()
+        LayerTextureRenderer.quad_users += 1
+    
+    def create_quad(self):
+        "Create unit quad VAO and vertex buffer shared by all instances."
+        cls = LayerTextureRenderer
+        if self.app.use_vao:
+            cls.quad_vao = GL.glGenVertexArrays(1)
+            GL.glBindVertexArray(cls.quad_vao)
+        cls.quad_vert_buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, cls.quad_vert_buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vert_array.nbytes,
+                        self.vert_array, GL.GL_STATIC_DRAW)
+        GL.glEnableVertexAttribArray(self.pos_attrib)
+        GL.glVertexAttribPointer(self.pos_attrib, 2, GL.GL_FLOAT, GL.GL_FALSE,
+                                 0, ctypes.c_void_p(0))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        if self.app.use_vao:
+            GL.glBindVertexArray(0)
+    
+    def get_key(self):
+        """
+        Return tuple of everything besides tile data that affects how a layer
+        texture looks. Character set and palette hot reloads create new
+        textures, so their GL handles change when they do.
+        """
+        r, art = self.renderable, self.renderable.art
+        remap_version = r.palette_remap.version if r.palette_remap else None
+        return (art, r.frame, art.width, art.height, art.layers,
+                art.charset.texture.gltex, r.get_palette_texture(),
+                remap_version, art.charset.char_width,
+                art.charset.char_height, r.bg_alpha)
+    
+    def new_texture(self, width, height, data=None, filter=GL.GL_NEAREST):
+        "Create and return a GL RGBA texture of given size."
+        texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, filter)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, filter)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA, width, height, 0,
+                        GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, data)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        return texture
+    
+    def render_texture(self, texture, alpha, z):
+        "Draw given layer texture over our Renderable's Art with given alpha at given Z."
+        r, art = self.renderable, self.renderable.art
+        GL.glUseProgram(self.shader.program)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glUniform1i(self.tex_uniform, 0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+        GL.glUniform2f(self.tex_scale_uniform, 1, 1)
+        GL.glUniformMatrix4fv(self.proj_matrix_uniform, 1, GL.GL_FALSE,
+                              r.get_projection_matrix())
+        GL.glUniformMatrix4fv(self.view_matrix_uniform, 1, GL.GL_FALSE,
+                              r.get_view_matrix())
+        x, y, _ = r.get_loc()
+        GL.glUniform3f(self.position_uniform, x, y, z)
+        GL.glUniform3f(self.scale_uniform, *r.get_scale())
+        GL.glUniform2f(self.art_size_uniform, art.width * art.quad_width,
+                       art.height * art.quad_height)
+        GL.glUniform1f(self.alpha_uniform, alpha)
+        if self.app.use_vao:
+            GL.glBindVertexArray(self.quad_vao)
+        else:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.quad_vert_buffer)
+            GL.glVertexAttribPointer(self.pos_attrib, 2, GL.GL_FLOAT,
+                                     GL.GL_FALSE, 0, ctypes.c_void_p(0))
+            GL.glEnableVertexAttribArray(self.pos_attrib)
+        GL.glEnable(GL.GL_BLEND)
+        # textures hold straight (non-premultiplied) alpha, blend them as tiles
+        GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+        GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, 4)
+        GL.glDisable(GL.GL_BLEND)
+        if self.app.use_vao:
+            GL.glBindVertexArray(0)
+        GL.glUseProgram(0)
+    
+    def clear(self):
+        "Discard all layer textures. Subclasses override."
+        pass
+    
+    def destroy(self):
+        self.clear()
+        cls = LayerTextureRenderer
+        cls.quad_users -= 1
+        if cls.quad_users > 0:
+            return
+        if self.app.use_vao:
+            GL.glDeleteVertexArrays(1, [cls.quad_vao])
+        GL.glDeleteBuffers(1, [cls.quad_vert_buffer])
+        cls.quad_vao, cls.quad_vert_buffer = None, None
+
+
+class LayerRenderCache(LayerTextureRenderer):
+    
+    """
+    Render-to-texture cache for a TileRenderable. Layers whose tiles haven't
+    changed for a few renders are baked into a texture, and from then on drawn
+    as a single textured quad rather than a full grid of tiles. Layers are
+    baked in Art space, so the owning Renderable can move or scale freely;
+    tile edits, frame changes, resizes and character set or palette (re)loads
+    invalidate the bake. Bakes from all caches share one memory budget, and
+    the least recently drawn are evicted to make room for new ones.
+    """
+    
+    stable_renders_before_bake = 2
+    "Number of renders a layer must go unchanged before it's baked"
+    stable_renders_before_rebake = 60
+    "Number of renders an evicted layer must go unchanged before it's rebaked"
+    max_texture_size = 4096
+    "Largest baked texture dimension; bigger Arts always render directly"
+    bake_memory_budget = 256 * 1024 * 1024
+    "Total bytes of baked textures across all caches; least recently drawn go first"
+    baked_layers = OrderedDict()
+    "All baked CachedLayers : their LayerRenderCache, least recently drawn first"
+    baked_bytes = 0
+    log_bakes = False
+    
+    def __init__(self, renderable):
+        LayerTextureRenderer.__init__(self, renderable)
+        self.layers = {}
+        "Dict of layer index : CachedLayer"
+        self.check_changes = False
+        "Set when our Renderable's tile data has changed since last render"
+        self.framebuffer = None
+    
+    def get_tile_data(self, layer):
+        "Return copies of all tile data for given layer on current frame."
+        art, frame = self.renderable.art, self.renderable.frame
+        return (art.chars[frame][layer].copy(),
+                art.fg_colors[frame][layer].copy(),
+                art.bg_colors[frame][layer].copy(),
+                art.uv_mods[frame][layer].copy())
+    
+    def tile_data_changed(self, layer, cached):
+        art, frame = self.renderable.art, self.renderable.frame
+        chars, fg, bg, uvs = cached.tile_data
+        return not (np.array_equal(chars, art.chars[frame][layer]) and
+                    np.array_equal(fg, art.fg_colors[frame][layer]) and
+                    np.array_equal(bg, art.bg_colors[frame][layer]) and
+                    np.array_equal(uvs, art.uv_mods[frame][layer]))
+    
+    def art_changed(self):
+        "Called by our Renderable whenever its GL tile or geo data is updated."
+        self.check_changes = True
+    
+    def update(self):
+        "Invalidate any layers that have changed since last render."
+        key = self.get_key()
+        if key != self.key:
+            self.clear()
+            self.key = key
+            self.check_changes = False
+            return
+        if not self.check_changes:
+            return
+        self.check_changes = False
+        for layer, cached in self.layers.items():
+            if self.tile_data_changed(layer, cached):
+                self.release_layer(cached)
+                cached.tile_data = self.get_tile_data(layer)
+                cached.stable_renders = 0
+                cached.evicted = False
+    
+    def get_texture_size(self):
+        art = self.renderable.art
+        return (art.width * art.charset.char_width,
+                art.height * art.charset.char_height)
+    
+    def can_bake(self):
+        w, h = self.get_texture_size()
+        max_size = min(self.max_texture_size, self.app.max_texture_size)
+        return 0 < w <= max_size and 0 < h <= max_size and \
+            w * h * 4 <= self.bake_memory_budget
+    
+    def is_layer_baked(self, layer):
+        """
+        Return True if given layer has a valid bake, baking it first if it's
+        been stable long enough.
+        """
+        cached = self.layers.get(layer, None)
+        if not cached:
+            self.layers[layer] = CachedLayer(self.get_tile_data(layer))
+            return False
+        if cached.texture:
+            return True
+        cached.stable_renders += 1
+        if cached.evicted:
+            renders_needed = self.stable_renders_before_rebake
+        else:
+            renders_needed = self.stable_renders_before_bake
+        if cached.stable_renders < renders_needed or not self.can_bake():
+            return False
+        self.bake_layer(layer, cached)
+        return True
+    
+    def make_room(self, needed_bytes):
+        "Evict least recently drawn bakes until given bytes fit within budget."
+        cls = LayerRenderCache
+        while cls.baked_layers and \
+              cls.baked_bytes + needed_bytes > self.bake_memory_budget:
+            cached, cache = cls.baked_layers.popitem(last=False)
+            cache.release_layer(cached)
+            cached.stable_renders = 0
+            cached.evicted = True
+            if self.log_bakes:
+                self.app.log('%s evicted a baked layer' % cache.renderable)
+    
+    def bake_layer(self, layer, cached):
+        w, h = self.get_texture_size()
+        self.make_room(w * h * 4)
+        # match character set's nearest neighbor filtering
+        cached.texture = self.new_texture(w, h)
+        cached.texture_bytes = w * h * 4
+        LayerRenderCache.baked_bytes += cached.texture_bytes
+        LayerRenderCache.baked_layers[cached] = self
+        if not self.framebuffer:
+            self.framebuffer = GL.glGenFramebuffers(1)
+        # we may be mid-render into the main framebuffer, restore it after
+        prev_framebuffer = GL.glGetIntegerv(GL.GL_FRAMEBUFFER_BINDING)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.framebuffer)
+        GL.glFramebufferTexture2D(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0,
+                                  GL.GL_TEXTURE_2D, cached.texture, 0)
+        GL.glViewport(0, 0, w, h)
+        GL.glClearColor(0, 0, 0, 0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        self.renderable.render_layer_for_cache(layer)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, int(prev_framebuffer))
+        GL.glViewport(0, 0, self.app.window_width, self.app.window_height)
+        if self.log_bakes:
+            self.app.log('%s baked layer %s (%s x %s)' % (self.renderable, layer, w, h))
+    
+    def render_layer(self, layer, alpha, z):
+        "Draw given baked layer with given alpha at given Z."
+        cached = self.layers[layer]
+        LayerRenderCache.baked_layers.move_to_end(cached)
+        self.render_texture(cached.texture, alpha, z)
+    
+    def release_layer(self, cached):
+        if cached.texture:
+            GL.glDeleteTextures([cached.texture])
+            cached.texture = None
+            LayerRenderCache.baked_bytes -= cached.texture_bytes
+            cached.texture_bytes = 0
+            LayerRenderCache.baked_layers.pop(cached, None)
+    
+    def clear(self):
+        "Discard all baked layers and change tracking."
+        for cached in self.layers.values():
+            self.release_layer(cached)
+        self.layers = {}
+    
+    def destroy(self):
+        if self.framebuffer:
+            GL.glDeleteFramebuffers(1, [self.framebuffer])
+        LayerTextureRenderer.destroy(self)
+
+
+class LayerLODRenderer(LayerTextureRenderer):
+    
+    """
+    Low detail stand-in for a TileRenderable seen from far away. Each layer is
+    drawn as a texture with one pixel per tile, colored by blending the tile's
+    FG and BG colors by how much of its character is solid. Tile edits update
+    only the changed area of each texture.
+    """
+    
+    max_tile_pixels = 2
+    "Use low detail when tiles are less than this many pixels on screen"
+    max_texture_size = 4096
+    "Largest layer texture dimension; bigger Arts always render directly"
+    
+    def __init__(self, renderable):
+        LayerTextureRenderer.__init__(self, renderable)
+        self.layers = {}
+        "Dict of layer index : GL texture"
+        self.palette_colors = None
+        "Palette colors as an array of 0-1 RGBA floats"
+        self.full_rebuild = False
+        self.changed_bounds = None
+        "(left, top, right, bottom) tiles changed since textures were built"
+    
+    def art_changed(self, changed_bounds=None):
+        """
+        Called by our Renderable whenever its tile data is updated, with the
+        bounds of changed tiles if known.
+        """
+        if changed_bounds is None:
+            self.full_rebuild = True
+        elif self.changed_bounds:
+            b = self.changed_bounds
+            self.changed_bounds = (min(b[0], changed_bounds[0]),
+                                   min(b[1], changed_bounds[1]),
+                                   max(b[2], changed_bounds[2]),
+                                   max(b[3], changed_bounds[3]))
+        else:
+            self.changed_bounds = tuple(changed_bounds)
+    
+    def update(self):
+        "Bring layer textures up to date with any changes since last render."
+        key = self.get_key()
+        if key != self.key:
+            self.clear()
+            self.key = key
+            self.palette_colors = np.array(self.renderable.get_palette_colors(),
+                                           dtype=np.float32) / 255
+        elif self.full_rebuild:
+            for layer in self.layers:
+                self.build_layer(layer)
+        elif self.changed_bounds:
+            for layer in self.layers:
+                self.build_layer(layer, self.changed_bounds)
+        self.full_rebuild = False
+        self.changed_bounds = None
+    
+    def get_tile_colors(self, layer, left, top, right, bottom):
+        "Return RGBA bytes array of averaged colors for given tiles of given layer."
+        r, art = self.renderable, self.renderable.art
+        frame = r.frame
+        coverage, ink = art.charset.get_char_ink()
+        colors = self.palette_colors
+        chars = art.chars[frame][layer, top:bottom, left:right, 0].astype(int)
+        chars = chars.clip(0, len(coverage) - 1)
+        fg_index = art.fg_colors[frame][layer, top:bottom, left:right, 0].astype(int)
+        fg_index = fg_index.clip(0, len(colors) - 1)
+        bg_index = art.bg_colors[frame][layer, top:bottom, left:right, 0].astype(int)
+        bg_index = bg_index.clip(0, len(colors) - 1)
+        solid = coverage[chars][..., np.newaxis]
+        fg, bg = colors[fg_index], colors[bg_index]
+        # mirror renderable_f.glsl: transparent FG cuts character out of BG
+        cutout = (fg_index == 0)[..., np.newaxis]
+        bg_alpha = np.where(cutout, r.bg_alpha, bg[..., 3:] * r.bg_alpha)
+        # average in premultiplied alpha, then convert back to straight alpha
+        bg_weight = bg_alpha * (1 - solid)
+        rgb = bg[..., :3] * bg_weight
+        rgb += np.where(cutout, 0, fg[..., :3] * ink[chars])
+        alpha = bg_weight + np.where(cutout, 0, solid)
+        # fully transparent tiles
+        alpha[(fg_index == 0) & (bg_index == 0)] = 0
+        rgb /= np.maximum(alpha, 0.0001)
+        tile_colors = np.concatenate((rgb, alpha), axis=-1)
+        # GL textures start at bottom row
+        tile_colors = np.flipud(tile_colors)
+        return np.ascontiguousarray((tile_colors.clip(0, 1) * 255).astype(np.uint8))
+    
+    def can_draw(self):
+        "Return True if our Art is small enough to fit in one texture per layer."
+        art = self.renderable.art
+        max_size = min(self.max_texture_size, self.app.max_texture_size)
+        return 0 < art.width <= max_size and 0 < art.height <= max_size
+    
+    def build_layer(self, layer, bounds=None):
+        "(Re)generate texture for given layer, only within given tile bounds if set."
+        art = self.renderable.art
+        w, h = art.width, art.height
+        texture = self.layers.get(layer, None)
+        if not texture or not bounds:
+            if texture:
+                GL.glDeleteTextures([texture])
+            # smooth filtering reduces shimmer when panning zoomed out
+            self.layers[layer] = self.new_texture(w, h, self.get_tile_colors(layer, 0, 0, w, h),
+                                                  GL.GL_LINEAR)
+            return
+        left, top = max(0, bounds[0]), max(0, bounds[1])
+        right, bottom = min(w, bounds[2]), min(h, bounds[3])
+        if right <= left or bottom <= top:
+            return
+        data = self.get_tile_colors(layer, left, top, right, bottom)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+        GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, left, h - bottom,
+                           right - left, bottom - top,
+                           GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, data)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+    
+    def render_layer(self, layer, alpha, z):
+        "Draw given layer's low detail texture with given alpha at given Z."
+        if not layer in self.layers:
+            self.build_layer(layer)
+        self.render_texture(self.layers[layer], alpha, z)
+    
+    def clear(self):
+        for texture in self.layers.values():
+            GL.glDeleteTextures([texture])
+        self.layers = {}
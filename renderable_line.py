@@ -238,6 +238,162 @@ class WorldLineRenderable(LineRenderable):
         return self.app.camera.view_matrix
 
 
+class BatchedLineRenderable(WorldLineRenderable):
+    
+    """
+    WorldLineRenderable with no GL resources of its own: render() hands our
+    lines to our game object's world's LineBatch, which draws them with all
+    the others at once. Cheap enough to create for every object.
+    """
+    
+    def __init__(self, app, quad_size_ref=None, game_object=None):
+        self.app = app
+        self.go = game_object
+        self.unique_name = '%s_%s' % (int(time.time()), self.__class__.__name__)
+        self.quad_size_ref = quad_size_ref
+        self.x, self.y, self.z = 0, 0, 0
+        self.scale_x, self.scale_y = 1, 1
+        self.scale_z = 0 if self.vert_items == 2 else 1
+        self.build_geo()
+        self.width, self.height = self.get_size()
+        self.reset_loc()
+    
+    def rebind_buffers(self):
+        # LineBatch reads our arrays directly every render
+        pass
+    
+    def destroy(self):
+        pass
+    
+    def render(self):
+        if not self.visible:
+            return
+        self.go.world.debug_lines.add_lines(self)
+
+
+class LineBatch:
+    
+    """
+    Collects lines from BatchedLineRenderables over a frame, in world space,
+    and draws them all from one buffer: one draw call per line width.
+    """
+    
+    vert_shader_source = 'lines_3d_v.glsl'
+    frag_shader_source = 'lines_f.glsl'
+    
+    def __init__(self, app):
+        self.app = app
+        # line width: lists of (N, 3) vert arrays and (N, 4) color arrays
+        self.verts, self.colors = {}, {}
+        # GL resources are created on first render
+        self.shader = None
+    
+    def create_buffers(self):
+        self.shader = self.app.sl.new_shader(self.vert_shader_source, self.frag_shader_source)
+        self.proj_matrix_uniform = self.shader.get_uniform_location('projection')
+        self.view_matrix_uniform = self.shader.get_uniform_location('view')
+        self.position_uniform = self.shader.get_uniform_location('objectPosition')
+        self.scale_uniform = self.shader.get_uniform_location('objectScale')
+        self.quad_size_uniform = self.shader.get_uniform_location('quadSize')
+        self.color_uniform = self.shader.get_uniform_location('objectColor')
+        self.pos_attrib = self.shader.get_attrib_location('vertPosition')
+        self.color_attrib = self.shader.get_attrib_location('vertColor')
+        self.vert_buffer, self.color_buffer = GL.glGenBuffers(2)
+        if self.app.use_vao:
+            self.vao = GL.glGenVertexArrays(1)
+            GL.glBindVertexArray(self.vao)
+            self.bind_attribs()
+            GL.glBindVertexArray(0)
+    
+    def bind_attribs(self):
+        offset = ctypes.c_void_p(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vert_buffer)
+        GL.glVertexAttribPointer(self.pos_attrib, 3, GL.GL_FLOAT, GL.GL_FALSE,
+                                 0, offset)
+        GL.glEnableVertexAttribArray(self.pos_attrib)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.color_buffer)
+        GL.glVertexAttribPointer(self.color_attrib, 4, GL.GL_FLOAT, GL.GL_FALSE,
+                                 0, offset)
+        GL.glEnableVertexAttribArray(self.color_attrib)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+    
+    def add_lines(self, r):
+        "Add given renderable's lines, transformed as line shaders would."
+        elems = r.elem_array.reshape(-1)
+        if len(elems) == 0:
+            return
+        verts = r.vert_array.reshape(-1, r.vert_items)[elems]
+        quad_w, quad_h = r.get_quad_size()
+        x, y, z = r.get_loc()
+        world_verts = np.empty((len(elems), 3), dtype=np.float32)
+        world_verts[:, 0] = verts[:, 0] * quad_w * r.scale_x + x
+        world_verts[:, 1] = verts[:, 1] * quad_h * r.scale_y + y
+        # 2D line shader uses object Z as vert Z
+        vert_z = verts[:, 2] if r.vert_items == 3 else z
+        world_verts[:, 2] = vert_z * r.scale_z + z
+        colors = r.color_array.reshape(-1, 4)[elems] * np.array(r.get_color(), dtype=np.float32)
+        width = r.get_line_width()
+        self.verts.setdefault(width, []).append(world_verts)
+        self.colors.setdefault(width, []).append(colors)
+    
+    def render(self):
+        "Draw all lines added since last render, then forget them."
+        if len(self.verts) == 0:
+            return
+        if not self.shader:
+            self.create_buffers()
+        # (line width, first vert, vert count) of each draw
+        draws = []
+        all_verts, all_colors = [], []
+        vert_count = 0
+        for width,verts in self.verts.items():
+            count = sum([len(v) for v in verts])
+            draws.append((width, vert_count, count))
+            vert_count += count
+            all_verts += verts
+            all_colors += self.colors[width]
+        self.verts, self.colors = {}, {}
+        vert_array = np.concatenate(all_verts)
+        color_array = np.concatenate(all_colors).astype(np.float32)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.vert_buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, vert_array.nbytes, vert_array,
+                        GL.GL_STREAM_DRAW)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.color_buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, color_array.nbytes, color_array,
+                        GL.GL_STREAM_DRAW)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glUseProgram(self.shader.program)
+        GL.glUniformMatrix4fv(self.proj_matrix_uniform, 1, GL.GL_FALSE, self.app.camera.projection_matrix)
+        GL.glUniformMatrix4fv(self.view_matrix_uniform, 1, GL.GL_FALSE, self.app.camera.view_matrix)
+        # verts are already in world space
+        GL.glUniform3f(self.position_uniform, 0, 0, 0)
+        GL.glUniform3f(self.scale_uniform, 1, 1, 1)
+        GL.glUniform2f(self.quad_size_uniform, 1, 1)
+        GL.glUniform4f(self.color_uniform, 1, 1, 1, 1)
+        if self.app.use_vao:
+            GL.glBindVertexArray(self.vao)
+        else:
+            self.bind_attribs()
+        GL.glEnable(GL.GL_BLEND)
+        GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+        for width, first, count in draws:
+            if platform.system() != 'Darwin':
+                GL.glLineWidth(width)
+            GL.glDrawArrays(GL.GL_LINES, first, count)
+        GL.glDisable(GL.GL_BLEND)
+        if self.app.use_vao:
+            GL.glBindVertexArray(0)
+        GL.glUseProgram(0)
+    
+    def destroy(self):
+        if not self.shader:
+            return
+        if self.app.use_vao:
+            GL.glDeleteVertexArrays(1, [self.vao])
+        GL.glDeleteBuffers(2, [self.vert_buffer, self.color_buffer])
+        self.shader = None
+
+
 class DebugLineRenderable(WorldLineRenderable):
     
     """
@@ -315,7 +471,7 @@ class DebugLineRenderable(WorldLineRenderable):
         WorldLineRenderable.render(self)
 
 
-class OriginIndicatorRenderable(WorldLineRenderable):
+class OriginIndicatorRenderable(BatchedLineRenderable):
     
     "classic 3-axis thingy showing location/rotation/scale"
     
@@ -331,7 +487,7 @@ class OriginIndicatorRenderable(WorldLineRenderable):
     use_art_offset = False
     
     def __init__(self, app, game_object):
-        LineRenderable.__init__(self, app, None, game_object)
+        BatchedLineRenderable.__init__(self, app, None, game_object)
     
     def get_quad_size(self):
         return 1, 1
@@ -355,14 +511,14 @@ class OriginIndicatorRenderable(WorldLineRenderable):
         self.color_array = np.array([self.red, self.red, self.green, self.green,
                                      self.blue, self.blue], dtype=np.float32)
 
-class BoundsIndicatorRenderable(WorldLineRenderable):
+class BoundsIndicatorRenderable(BatchedLineRenderable):
     color = (1, 1, 1, 0.5)
     line_width_active = 2
     line_width_inactive = 1
     
     def __init__(self, app, game_object):
         self.art = game_object.renderable.art
-        LineRenderable.__init__(self, app, None, game_object)
+        BatchedLineRenderable.__init__(self, app, None, game_object)
     
     def set_art(self, new_art):
         self.art = new_art
@@ -394,7 +550,7 @@ class BoundsIndicatorRenderable(WorldLineRenderable):
         self.vert_array, self.elem_array, self.color_array = get_box_arrays(None, self.color)
 
 
-class CollisionRenderable(WorldLineRenderable):
+class CollisionRenderable(BatchedLineRenderable):
     
     # green = dynamic, blue = static
     dynamic_color = (0, 1, 0, 1)
@@ -403,7 +559,7 @@ class CollisionRenderable(WorldLineRenderable):
     def __init__(self, shape):
         self.color = self.dynamic_color if shape.go.is_dynamic() else self.static_color
         self.shape = shape
-        WorldLineRenderable.__init__(self, shape.go.app, None, shape.go)
+        BatchedLineRenderable.__init__(self, shape.go.app, None, shape.go)
     
     def update(self):
         self.update_transform_from_object(self.shape)
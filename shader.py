@@ -1,38 +1,183 @@
-import os.path, time, platform
+import os.path, time, platform, hashlib, struct
+import numpy as np
 from OpenGL import GL
 from OpenGL.GL import shaders
 
 SHADER_PATH = 'shaders/'
+# subdir of cache dir where compiled program binaries are stored
+SHADER_CACHE_DIR = 'shaders/'
+SHADER_CACHE_EXTENSION = 'bin'
+# binary cache file header: binary format enum, seconds it took to compile
+SHADER_CACHE_HEADER = '<Id'
 
 class ShaderLord:
     
-    # time in ms between checks for hot reload
-    hot_reload_check_interval = 2 * 1000
+    use_binary_cache = True
+    "If True, store linked programs in cache dir and load them on startup"
+    log_binary_cache = False
     
     def __init__(self, app):
         "AWAKENS THE SHADERLORD"
         self.app = app
         self.shaders = []
+        self.cache_dir = self.app.cache_dir + SHADER_CACHE_DIR
+        self.binary_cache_supported = self.use_binary_cache and self.get_binary_cache_supported()
+        # program binaries are only valid for the driver that created them
+        self.driver_string = ''
+        for name in [GL.GL_VENDOR, GL.GL_RENDERER, GL.GL_VERSION,
+                     GL.GL_SHADING_LANGUAGE_VERSION]:
+            try: self.driver_string += GL.glGetString(name).decode('utf-8') + '|'
+            except: pass
+        # timing stats for startup log
+        self.compiled_count, self.compile_time = 0, 0
+        self.loaded_count, self.load_time = 0, 0
+        # compile time of programs we loaded, as recorded when they were cached
+        self.loaded_compile_time = 0
+    
+    def get_binary_cache_supported(self):
+        "Return True if GL_ARB_get_program_binary (or GL 4.1+) is available."
+        try:
+            if not (GL.glGetProgramBinary and GL.glProgramBinary and GL.glProgramParameteri):
+                return False
+            return int(GL.glGetIntegerv(GL.GL_NUM_PROGRAM_BINARY_FORMATS)) > 0
+        except:
+            return False
+    
+    def get_cache_filename(self, vert_source_file, frag_source_file,
+                           vert_source, frag_source):
+        """
+        Return cache filename for given shader files and their sources:
+        driver hash, both source filenames and a hash of the sources, so
+        entries that stop being current can be told apart and pruned.
+        """
+        driver_hash = hashlib.sha1(bytes(self.driver_string, 'utf-8')).hexdigest()[:12]
+        h = hashlib.sha1()
+        # shader sources include GLSL version string
+        for data in [vert_source, frag_source, bytes(self.driver_string, 'utf-8')]:
+            h.update(data)
+            h.update(b'\0')
+        return '%s%s.%s.%s.%s.%s' % (self.cache_dir, driver_hash,
+                                     os.path.splitext(vert_source_file)[0],
+                                     os.path.splitext(frag_source_file)[0],
+                                     h.hexdigest(), SHADER_CACHE_EXTENSION)
+    
+    def prune_binary_cache(self, current_filename):
+        """
+        Delete cached binaries from other drivers, and older binaries of the
+        same shader files as given just-written one.
+        """
+        driver, vert, frag = os.path.basename(current_filename).split('.')[:3]
+        for filename in os.listdir(self.cache_dir):
+            parts = filename.split('.')
+            if filename == os.path.basename(current_filename) or \
+               parts[-1] != SHADER_CACHE_EXTENSION:
+                continue
+            if len(parts) != 5 or parts[0] != driver or parts[1:3] == [vert, frag]:
+                try: os.remove(self.cache_dir + filename)
+                except: pass
+    
+    def load_program_binary(self, vert_source_file, frag_source_file,
+                            vert_source, frag_source):
+        """
+        Return a program linked from cached binary for given sources, or None
+        if there isn't one or the driver rejects it.
+        """
+        if not self.binary_cache_supported:
+            return None
+        start_time = time.time()
+        filename = self.get_cache_filename(vert_source_file, frag_source_file,
+                                           vert_source, frag_source)
+        if not os.path.exists(filename):
+            return None
+        program = None
+        try:
+            data = open(filename, 'rb').read()
+            header_size = struct.calcsize(SHADER_CACHE_HEADER)
+            binary_format, compile_time = struct.unpack(SHADER_CACHE_HEADER, data[:header_size])
+            binary = np.frombuffer(data[header_size:], dtype=np.uint8)
+            program = GL.glCreateProgram()
+            GL.glProgramBinary(program, binary_format, binary, len(binary))
+            if GL.glGetProgramiv(program, GL.GL_LINK_STATUS) != GL.GL_TRUE:
+                raise Exception('driver rejected program binary')
+        except Exception as e:
+            # stale or corrupt binary: discard it, caller compiles from source
+            if self.log_binary_cache:
+                self.app.log("ShaderLord: couldn't load %s: %s" % (filename, e))
+            if program:
+                GL.glDeleteProgram(program)
+            try: os.remove(filename)
+            except: pass
+            return None
+        self.loaded_count += 1
+        self.load_time += time.time() - start_time
+        self.loaded_compile_time += compile_time
+        return program
+    
+    def save_program_binary(self, program, vert_source_file, frag_source_file,
+                            vert_source, frag_source, compile_time):
+        "Write given linked program's binary to cache, ignoring any failure."
+        if not self.binary_cache_supported:
+            return
+        filename = self.get_cache_filename(vert_source_file, frag_source_file,
+                                           vert_source, frag_source)
+        try:
+            length = int(GL.glGetProgramiv(program, GL.GL_PROGRAM_BINARY_LENGTH))
+            if length <= 0:
+                return
+            binary_length = np.zeros(1, dtype=np.int32)
+            binary_format = np.zeros(1, dtype=np.uint32)
+            binary = np.zeros(length, dtype=np.uint8)
+            GL.glGetProgramBinary(program, length, binary_length, binary_format, binary)
+            if not os.path.exists(self.cache_dir):
+                os.mkdir(self.cache_dir)
+            header = struct.pack(SHADER_CACHE_HEADER, int(binary_format[0]), compile_time)
+            with open(filename, 'wb') as f:
+                f.write(header + binary[:binary_length[0]].tobytes())
+            self.prune_binary_cache(filename)
+        except Exception as e:
+            if self.log_binary_cache:
+                self.app.log("ShaderLord: couldn't cache %s: %s" % (filename, e))
+    
+    def link_program(self, vert_shader, frag_shader):
+        "Link and return a program from given compiled shaders."
+        if not self.binary_cache_supported:
+            return shaders.compileProgram(vert_shader, frag_shader)
+        # binary must be flagged retrievable before linking
+        program = GL.glCreateProgram()
+        GL.glAttachShader(program, vert_shader)
+        GL.glAttachShader(program, frag_shader)
+        GL.glProgramParameteri(program, GL.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL.GL_TRUE)
+        GL.glLinkProgram(program)
+        if GL.glGetProgramiv(program, GL.GL_LINK_STATUS) != GL.GL_TRUE:
+            info = GL.glGetProgramInfoLog(program)
+            GL.glDeleteProgram(program)
+            raise RuntimeError('Link failure: %s' % info)
+        return program
+    
+    def log_startup_stats(self):
+        "Log how long shader setup took, and roughly how much the cache saved."
+        self.app.log('ShaderLord: %s programs compiled in %.3fs, %s loaded from cache in %.3fs' % (self.compiled_count, self.compile_time, self.loaded_count, self.load_time))
+        if self.loaded_count:
+            saved = self.loaded_compile_time - self.load_time
+            self.app.log('  binary cache saved ~%.3fs' % saved)
     
     def new_shader(self, vert_source_file, frag_source_file):
-        self.last_check = 0
         for shader in self.shaders:
             if shader.vert_source_file == vert_source_file and shader.frag_source_file == frag_source_file:
                 #self.app.log('%s already uses same source' % shader)
                 return shader
         s = Shader(self, vert_source_file, frag_source_file)
         self.shaders.append(s)
+        # hot reload either source file when it changes
+        self.app.fw.watch(SHADER_PATH + vert_source_file, self.file_changed)
+        self.app.fw.watch(SHADER_PATH + frag_source_file, self.file_changed)
         return s
     
-    def check_hot_reload(self):
-        if self.app.get_elapsed_time() - self.last_check < self.hot_reload_check_interval:
-            return
-        self.last_check = self.app.get_elapsed_time()
+    def file_changed(self, filename):
         for shader in self.shaders:
-            vert_shader_updated, frag_shader_updated = shader.has_updated()
-            if vert_shader_updated:
+            if filename == SHADER_PATH + shader.vert_source_file:
                 shader.recompile(GL.GL_VERTEX_SHADER)
-            if frag_shader_updated:
+            if filename == SHADER_PATH + shader.frag_source_file:
                 shader.recompile(GL.GL_FRAGMENT_SHADER)
     
     def destroy(self):
@@ -52,19 +197,29 @@ class Shader:
     
     def __init__(self, shader_lord, vert_source_file, frag_source_file):
         self.sl = shader_lord
-        # vertex shader
+        start_time = time.time()
         self.vert_source_file = vert_source_file
-        self.last_vert_change = time.time()
+        self.frag_source_file = frag_source_file
+        self.last_vert_change = self.last_frag_change = start_time
+        self.vert_shader, self.frag_shader = None, None
         vert_source = self.get_shader_source(self.vert_source_file)
+        frag_source = self.get_shader_source(self.frag_source_file)
+        # use a cached program binary for these sources if we can
+        self.program = self.sl.load_program_binary(self.vert_source_file,
+                                                  self.frag_source_file,
+                                                  vert_source, frag_source)
+        if self.program:
+            if self.log_compile:
+                self.sl.app.log('Loaded cached program for %s + %s in %.6f seconds' % (self.vert_source_file, self.frag_source_file, time.time() - start_time))
+            return
+        # vertex shader
         if self.log_compile:
             self.sl.app.log('Compiling vertex shader %s...' % self.vert_source_file)
         self.vert_shader = self.try_compile_shader(vert_source, GL.GL_VERTEX_SHADER, self.vert_source_file)
         if self.log_compile and self.vert_shader:
             self.sl.app.log('Compiled vertex shader %s in %.6f seconds' % (self.vert_source_file, time.time() - self.last_vert_change))
         # fragment shader
-        self.frag_source_file = frag_source_file
         self.last_frag_change = time.time()
-        frag_source = self.get_shader_source(self.frag_source_file)
         if self.log_compile:
             self.sl.app.log('Compiling fragment shader %s...' % self.frag_source_file)
         self.frag_shader = self.try_compile_shader(frag_source, GL.GL_FRAGMENT_SHADER, self.frag_source_file)
@@ -72,7 +227,13 @@ class Shader:
             self.sl.app.log('Compiled fragment shader %s in %.6f seconds' % (self.frag_source_file, time.time() - self.last_frag_change))
         # shader program
         if self.vert_shader and self.frag_shader:
-            self.program = shaders.compileProgram(self.vert_shader, self.frag_shader)
+            self.program = self.sl.link_program(self.vert_shader, self.frag_shader)
+            compile_time = time.time() - start_time
+            self.sl.compiled_count += 1
+            self.sl.compile_time += compile_time
+            self.sl.save_program_binary(self.program, self.vert_source_file,
+                                        self.frag_source_file, vert_source,
+                                        frag_source, compile_time)
     
     def get_shader_source(self, source_file):
         src = open(SHADER_PATH + source_file, 'rb').read()
@@ -103,19 +264,6 @@ class Shader:
             return
         return shader
     
-    def has_updated(self):
-        vert_mod_time = os.path.getmtime(SHADER_PATH + self.vert_source_file)
-        frag_mod_time = os.path.getmtime(SHADER_PATH + self.frag_source_file)
-        # return two values: vert shader changed, frag shader changed
-        vert_changed = vert_mod_time > self.last_vert_change
-        frag_changed = frag_mod_time > self.last_frag_change
-        # store new last modified time if changed
-        if vert_changed:
-            self.last_vert_change = time.time()
-        if frag_changed:
-            self.last_frag_change = time.time()
-        return vert_changed, frag_changed
-    
     def recompile(self, shader_type):
         file_to_reload = self.vert_source_file
         if shader_type == GL.GL_FRAGMENT_SHADER:
@@ -133,7 +281,18 @@ class Shader:
             self.vert_shader = new_shader
         else:
             self.frag_shader = new_shader
-        self.program = shaders.compileProgram(self.vert_shader, self.frag_shader)
+        # program may have come from binary cache, compile other shader too
+        if not self.vert_shader:
+            self.vert_shader = shaders.compileShader(self.get_shader_source(self.vert_source_file), GL.GL_VERTEX_SHADER)
+        if not self.frag_shader:
+            self.frag_shader = shaders.compileShader(self.get_shader_source(self.frag_source_file), GL.GL_FRAGMENT_SHADER)
+        start_time = time.time()
+        self.program = self.sl.link_program(self.vert_shader, self.frag_shader)
+        self.sl.save_program_binary(self.program, self.vert_source_file,
+                                    self.frag_source_file,
+                                    self.get_shader_source(self.vert_source_file),
+                                    self.get_shader_source(self.frag_source_file),
+                                    time.time() - start_time)
     
     def get_uniform_location(self, uniform_name):
         return GL.glGetUniformLocation(self.program, uniform_name)
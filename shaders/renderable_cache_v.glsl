@@ -0,0 +1,29 @@
+uniform mat4 projection;
+uniform mat4 view;
+uniform vec3 objectPosition;
+uniform vec3 objectScale;
+uniform vec2 artSize;
+
+in vec2 vertPosition;
+
+out vec2 theCoords;
+
+mat4 scale(float x, float y, float z)
+{
+    return mat4(
+        vec4(x,   0.0, 0.0, 0.0),
+        vec4(0.0, y,   0.0, 0.0),
+        vec4(0.0, 0.0, z,   0.0),
+        vec4(0.0, 0.0, 0.0, 1.0)
+    );
+}
+
+void main()
+{
+	// unit quad -> art space, where art's top left is at origin and Y goes down
+	vec4 model = vec4(vertPosition.x * artSize.x, (vertPosition.y - 1) * artSize.y, 0, 1);
+	model *= scale(objectScale.x, objectScale.y, objectScale.z);
+	model += vec4(objectPosition, 0);
+	gl_Position = projection * view * model;
+	theCoords = vertPosition;
+}
@@ -0,0 +1,73 @@
+import sys, time, builtins
+
+# command line flag that enables startup profiling
+PROFILE_STARTUP_ARG = '--profile-startup'
+
+class StartupProfiler:
+    
+    "Times module imports and Application init phases for --profile-startup."
+    
+    # number of slowest imports to list in report
+    max_imports_listed = 20
+    
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.last_phase_time = self.start_time
+        # module name: [self time, cumulative time]
+        self.import_times = {}
+        # time spent in nested imports, one entry per import in progress
+        self.import_stack = []
+        # list of (phase name, seconds)
+        self.phases = []
+        self.real_import = None
+    
+    def start_import_tracking(self):
+        self.real_import = builtins.__import__
+        builtins.__import__ = self.timed_import
+    
+    def stop_import_tracking(self):
+        if self.real_import:
+            builtins.__import__ = self.real_import
+            self.real_import = None
+    
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # already-loaded modules cost nothing worth reporting
+        if level == 0 and name in sys.modules:
+            return self.real_import(name, globals, locals, fromlist, level)
+        start_time = time.perf_counter()
+        self.import_stack.append(0)
+        try:
+            return self.real_import(name, globals, locals, fromlist, level)
+        finally:
+            total = time.perf_counter() - start_time
+            nested = self.import_stack.pop()
+            if self.import_stack:
+                self.import_stack[-1] += total
+            if level > 0:
+                # name relative imports by the module they resolve to
+                package = (globals or {}).get('__package__', None) or ''
+                name = '%s.%s' % (package, name) if name else package
+            times = self.import_times.setdefault(name, [0, 0])
+            times[0] += total - nested
+            times[1] += total
+    
+    def phase(self, phase_name):
+        "Record time elapsed since last phase as given phase."
+        now = time.perf_counter()
+        self.phases.append((phase_name, now - self.last_phase_time))
+        self.last_phase_time = now
+    
+    def get_report_lines(self):
+        lines = ['Startup profile:']
+        import_total = sum([t[0] for t in self.import_times.values()])
+        lines.append('  imports: %.3fs in %s modules, slowest (self / cumulative):' % (import_total, len(self.import_times)))
+        by_self_time = sorted(self.import_times.items(), key=lambda i: i[1][0],
+                              reverse=True)
+        for name, times in by_self_time[:self.max_imports_listed]:
+            lines.append('    %-32s %.4fs / %.4fs' % (name, times[0], times[1]))
+        total = max(self.last_phase_time - self.start_time, 0.001)
+        lines.append('  init phases:')
+        for phase_name, phase_time in self.phases:
+            lines.append('    %-32s %.4fs (%2.0f%%)' % (phase_name, phase_time, phase_time / total * 100))
+        lines.append('  total: %.3fs' % total)
+        return lines
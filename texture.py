@@ -23,6 +23,14 @@ class Texture:
         if bool(GL.glGenerateMipmap):
             GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
     
+    def update_data(self, string_data):
+        "Replace texture's contents with given data of the same size."
+        img_data = np.frombuffer(string_data, dtype=np.uint8)
+        GL.glPixelStorei(self.packing, 1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.gltex)
+        GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, self.width, self.height,
+                           GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, img_data)
+    
     def set_filter(self, new_mag_filter, new_min_filter, bind_first=True):
         if bind_first:
             GL.glBindTexture(GL.GL_TEXTURE_2D, self.gltex)
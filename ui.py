@@ -109,18 +109,24 @@ class UI:
         self.debug_text = DebugTextUI(self)
         self.pulldown = PulldownMenu(self)
         self.menu_bar = None
-        self.art_menu_bar = ArtMenuBar(self)
+        # art menu bar is created when first needed if launching into a game
+        self.art_menu_bar = None
+        if not self.app.art_mode_ui_deferred:
+            self.art_menu_bar = ArtMenuBar(self)
         self.game_menu_bar = GameMenuBar(self)
-        self.menu_bar = self.art_menu_bar
+        self.menu_bar = self.art_menu_bar or self.game_menu_bar
         self.edit_list_panel = EditListPanel(self)
         self.edit_object_panel = EditObjectPanel(self)
         self.game_selection_label = GameSelectionLabel(self)
         self.game_hover_label = GameHoverLabel(self)
         self.elements += [self.fps_counter, self.status_bar, self.popup,
                           self.message_line, self.debug_text, self.pulldown,
-                          self.art_menu_bar, self.game_menu_bar,
+                          self.game_menu_bar,
                           self.edit_list_panel, self.edit_object_panel,
                           self.game_hover_label, self.game_selection_label]
+        if self.art_menu_bar:
+            self.elements.insert(self.elements.index(self.game_menu_bar),
+                                 self.art_menu_bar)
         # add console last so it draws last
         self.elements.append(self.console)
         # grain texture
@@ -136,6 +142,18 @@ class UI:
         if not self.app.can_edit:
             self.set_game_edit_ui_visibility(False)
     
+    def init_art_menu_bar(self):
+        "Create art menu bar if it was deferred at startup."
+        if self.art_menu_bar:
+            return
+        self.art_menu_bar = ArtMenuBar(self)
+        self.elements.insert(self.elements.index(self.game_menu_bar),
+                             self.art_menu_bar)
+        e = self.art_menu_bar
+        e.art.quad_width, e.art.quad_height = UIArt.quad_width, UIArt.quad_height
+        e.reset_art()
+        e.reset_loc()
+    
     def set_scale(self, new_scale):
         old_scale = self.scale
         self.scale = new_scale
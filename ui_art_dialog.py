@@ -5,7 +5,8 @@ from ui_chooser_dialog import ChooserDialog, ChooserItemButton, ChooserItem
 
 from ui_console import OpenCommand, SaveCommand
 from art import ART_DIR, ART_FILE_EXTENSION, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_FRAME_DELAY, DEFAULT_LAYER_Z_OFFSET
-from palette import PaletteFromFile
+from palette import PaletteFromFile, MAX_COLORS
+from palette_generate import METHOD_MEDIAN_CUT, METHOD_KMEANS
 
 
 class BaseFileDialog(UIDialog):
@@ -217,8 +218,9 @@ class ConvertFileDialog(ChooserDialog):
         converters.sort(key=lambda item: item.format_name.lower())
         i = 0
         for converter in converters:
-            item = self.chooser_item_class(i, converter.__name__)
-            item.converter_class = converter
+            item = self.chooser_item_class(i, converter.class_name)
+            # class itself is loaded only if chosen
+            item.converter_info = converter
             item.label = converter.format_name
             item.description = converter.format_description
             items.append(item)
@@ -230,12 +232,12 @@ class ImportFileDialog(ConvertFileDialog):
     title = 'Choose an importer'
     
     def get_converters(self):
-        return self.ui.app.get_importers()
+        return self.ui.app.get_importer_infos()
     
     def confirm_pressed(self):
         # open file select dialog so user can choose what to import
         item = self.get_selected_item()
-        self.ui.app.importer = item.converter_class
+        self.ui.app.importer = self.ui.app.load_converter_class(item.converter_info)
         if not self.ui.app.importer:
             return
         self.dismiss()
@@ -267,12 +269,12 @@ class ExportFileDialog(ConvertFileDialog):
     title = 'Choose an exporter'
     
     def get_converters(self):
-        return self.ui.app.get_exporters()
+        return self.ui.app.get_exporter_infos()
     
     def confirm_pressed(self):
         # open file select dialog so user can choose what to import
         item = self.get_selected_item()
-        self.ui.app.exporter = item.converter_class
+        self.ui.app.exporter = self.ui.app.load_converter_class(item.converter_info)
         if not self.ui.app.exporter:
             return
         self.dismiss()
@@ -666,15 +668,17 @@ class PaletteFromFileDialog(UIDialog):
     field0_label = 'Filename to create palette from:'
     field1_label = 'Filename for new palette:'
     field2_label = 'Colors in new palette:'
+    field3_label = 'Refine colors with k-means (slower)'
     field0_width = field1_width = UIDialog.default_field_width
     field2_width = UIDialog.default_short_field_width
     fields = [
         Field(label=field0_label, type=str, width=field0_width, oneline=False),
         Field(label=field1_label, type=str, width=field1_width, oneline=False),
-        Field(label=field2_label, type=int, width=field2_width, oneline=True)
+        Field(label=field2_label, type=int, width=field2_width, oneline=True),
+        Field(label=field3_label, type=bool, width=0, oneline=True)
     ]
     confirm_caption = 'Create'
-    invalid_color_error = 'Palettes must be between 2 and 256 colors.'
+    invalid_color_error = 'Palettes must be between 2 and %s colors.' % (MAX_COLORS - 1)
     bad_output_filename_error = 'Enter a filename for the new palette.'
     
     def get_initial_field_text(self, field_number):
@@ -682,12 +686,15 @@ class PaletteFromFileDialog(UIDialog):
         # sets fields 0 and 1
         if field_number == 2:
             return str(256)
+        elif field_number == 3:
+            return UIDialog.true_field_text
         return ''
     
     def valid_colors(self, colors):
         try: c = int(colors)
         except: return False
-        return 2 <= c <= 256
+        # color 0 is reserved for transparency
+        return 2 <= c <= MAX_COLORS - 1
     
     def is_input_valid(self):
         valid_colors = self.valid_colors(self.field_texts[2])
@@ -703,7 +710,9 @@ class PaletteFromFileDialog(UIDialog):
         src_filename = self.field_texts[0]
         palette_filename = self.field_texts[1]
         colors = int(self.field_texts[2])
-        new_pal = PaletteFromFile(self.ui.app, src_filename, palette_filename, colors)
+        method = METHOD_KMEANS if self.field_texts[3].strip() else METHOD_MEDIAN_CUT
+        new_pal = PaletteFromFile(self.ui.app, src_filename, palette_filename,
+                                  colors, method)
         self.dismiss()
 
 
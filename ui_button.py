@@ -1,9 +1,6 @@
 
 from ui_colors import UIColors
-
-TEXT_LEFT = 0
-TEXT_CENTER = 1
-TEXT_RIGHT = 2
+from art import TEXT_LEFT, TEXT_CENTER, TEXT_RIGHT
 
 BUTTON_STATES = ['normal', 'hovered', 'clicked', 'dimmed']
 
@@ -76,9 +73,8 @@ class UIButton:
         elif self.y + self.height > self.element.art.height:
             return
         fg, bg = self.get_state_colors(self.state)
-        for y in range(self.height):
-            for x in range(self.width):
-                self.element.art.set_tile_at(0, 0, self.x + x, self.y + y, None, fg, bg)
+        self.element.art.set_tiles_in_region(0, 0, self.x, self.y, self.width,
+                                             self.height, None, fg, bg)
     
     def hover(self):
         self.log_event('hovered')
@@ -115,9 +111,8 @@ class UIButton:
         if self.x + len(text) > self.element.art.width:
             return
         if self.clear_before_caption_draw:
-            for ty in range(self.height):
-                for tx in range(self.width):
-                    self.element.art.set_char_index_at(0, 0, self.x+tx, y+ty, 0)
+            self.element.art.set_tiles_in_region(0, 0, self.x, y, self.width,
+                                                 self.height, 0)
         # leave FG color None; should already have been set
         self.element.art.write_string(0, 0, self.x, y, text, None)
     
@@ -122,12 +122,8 @@ class ImportCommand(ConsoleCommand):
     def execute(console, args):
         if len(args) < 2:
             return 'Usage: imp [ArtImporter class name] [filename]'
-        importers = console.ui.app.get_importers()
         importer_classname, filename = args[0], args[1]
-        importer_class = None
-        for c in importers:
-            if c.__name__ == importer_classname:
-                importer_class = c
+        importer_class = console.ui.app.get_importer_by_name(importer_classname)
         if not importer_class:
             console.ui.app.log("Couldn't find importer class %s" % importer_classname)
         if not os.path.exists(filename):
@@ -139,27 +135,24 @@ class ExportCommand(ConsoleCommand):
     def execute(console, args):
         if len(args) < 2:
             return 'Usage: exp [ArtExporter class name] [filename]'
-        exporters = console.ui.app.get_exporters()
         exporter_classname, filename = args[0], args[1]
-        exporter_class = None
-        for c in exporters:
-            if c.__name__ == exporter_classname:
-                exporter_class = c
+        exporter_class = console.ui.app.get_exporter_by_name(exporter_classname)
         if not exporter_class:
             console.ui.app.log("Couldn't find exporter class %s" % exporter_classname)
         exporter = exporter_class(console.ui.app, filename)
 
 class PaletteFromImageCommand(ConsoleCommand):
-    description = 'Convert given image into a palette file.'
+    description = 'Convert given image, or folder of images, into a palette file.'
     def execute(console, args):
         if len(args) == 0:
-            return 'Usage: getpal [image filename]'
+            return 'Usage: getpal [image filename or folder]'
         src_filename = ' '.join(args)
         new_pal = PaletteFromFile(console.ui.app, src_filename, src_filename)
         if not new_pal.init_success:
             return
         #console.ui.app.load_palette(new_pal.filename)
         console.ui.app.palettes.append(new_pal)
+        console.ui.app.pl.watch(new_pal)
         console.ui.active_art.set_palette(new_pal)
         console.ui.popup.set_active_palette(new_pal)
 
@@ -194,6 +187,15 @@ class SpawnObjectCommand(ConsoleCommand):
         class_name = ' '.join(args)
         console.ui.app.gw.spawn_object_of_class(class_name)
 
+class CollisionBenchmarkCommand(ConsoleCommand):
+    description = 'Time collision with N dynamic circles vs N static boxes.'
+    def execute(console, args):
+        if not console.ui.app.game_mode:
+            return 'Collision benchmark needs a game loaded.'
+        count = int(args[0]) if len(args) > 0 else 200
+        ticks = int(args[1]) if len(args) > 1 else 10
+        return console.ui.app.gw.cl.run_benchmark(count, ticks)
+
 class CommandListCommand(ConsoleCommand):
     description = 'Show the list of console commands.'
     def execute(console, args):
@@ -246,6 +248,7 @@ commands = {
     'game': LoadGameStateCommand,
     'savegame': SaveGameStateCommand,
     'spawn': SpawnObjectCommand,
+    'colbench': CollisionBenchmarkCommand,
     'help': CommandListCommand,
     'scr': RunArtScriptCommand,
     'screv': RunEveryArtScriptCommand,
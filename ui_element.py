@@ -260,6 +260,9 @@ class UIArt(Art):
 class UIRenderable(TileRenderable):
     
     grain_strength = 0.2
+    # UI art changes often and is cheap to draw
+    use_render_cache = False
+    cull_to_camera = False
     
     def get_projection_matrix(self):
         # don't use projection matrix, ie identity[0][0]=aspect;
@@ -273,27 +276,43 @@ class UIRenderable(TileRenderable):
 class FPSCounterUI(UIElement):
     
     tile_y = 1
-    tile_width, tile_height = 12, 2
+    tile_width, tile_height = 28, 3
     snap_right = True
     game_mode_visible = True
     all_modes_visible = True
     visible = False
+    # (fps text, ms text, collision text, color) last written to art
+    last_text = None
     
     def update(self):
         bg = 0
-        self.art.clear_frame_layer(0, 0, bg)
         color = self.ui.colors.white
         # yellow or red if framerate dips
         if self.ui.app.fps < 30:
             color = self.ui.colors.yellow
         if self.ui.app.fps < 10:
             color = self.ui.colors.red
-        text = '%.1f fps' % self.ui.app.fps
-        x = self.tile_width - 1
-        self.art.write_string(0, 0, x, 0, text, color, None, True)
+        fps_text = '%.1f fps' % self.ui.app.fps
         # display last tick time; frame_time includes delay, is useless
-        text = '%.1f ms ' % self.ui.app.frame_time
-        self.art.write_string(0, 0, x, 1, text, color, None, True)
+        ms_text = '%.1f ms ' % self.ui.app.frame_time
+        # in game mode, show collision time, passes, pairs tested,
+        # overlaps resolved, and sleeping shapes
+        col_text = ''
+        if self.ui.app.game_mode and self.ui.app.gw.collision_enabled:
+            stats = self.ui.app.gw.cl.stats
+            col_text = 'col %.1fms %sp %st %sr %sz ' % (stats.time, stats.passes,
+                                                       stats.pairs_tested,
+                                                       stats.overlaps_resolved,
+                                                       stats.sleeping)
+        # skip rewriting art if what it shows hasn't changed
+        if (fps_text, ms_text, col_text, color) == self.last_text:
+            return
+        self.last_text = (fps_text, ms_text, col_text, color)
+        self.art.clear_frame_layer(0, 0, bg)
+        x = self.tile_width - 1
+        self.art.write_string(0, 0, x, 0, fps_text, color, None, True)
+        self.art.write_string(0, 0, x, 1, ms_text, color, None, True)
+        self.art.write_string(0, 0, x, 2, col_text, color, None, True)
     
     def render(self):
         # always show FPS if low
@@ -369,11 +388,14 @@ class DebugTextUI(UIElement):
     def __init__(self, ui):
         UIElement.__init__(self, ui)
         self.lines = []
+        # lines last written to art
+        self.last_lines = []
     
     def reset_art(self):
         self.tile_width = ceil(self.ui.width_tiles)
         self.art.resize(self.tile_width, self.tile_height)
         self.art.clear_frame_layer(0, 0, 0, self.ui.colors.white)
+        self.last_lines = []
         UIElement.reset_loc(self)
     
     def post_lines(self, lines):
@@ -383,6 +405,10 @@ class DebugTextUI(UIElement):
             self.lines += [lines]
     
     def update(self):
+        # lines are usually reposted unchanged every frame
+        if self.lines == self.last_lines:
+            return
+        self.last_lines = self.lines[:]
         self.art.clear_frame_layer(0, 0, 0, self.ui.colors.white)
         for y,line in enumerate(self.lines):
             self.art.write_string(0, 0, 0, y, line)
@@ -98,6 +98,8 @@ class StatusBarUI(UIElement):
     layer_label = 'layer:'
     frame_label = 'frame:'
     zoom_label = '%'
+    # get_art_key() result when art was last rewritten
+    last_art_key = None
     right_items_width = len(tile_label) + len(layer_label) + len(frame_label) + (len('X/Y') + 2) * 2 + len('XX/YY') + 2 + len(zoom_label) + 10
     button_names = {
         CharToggleButton: 'char_toggle',
@@ -255,6 +257,7 @@ class StatusBarUI(UIElement):
         # must resize here, as window width will vary
         self.art.resize(self.tile_width, self.tile_height)
         # write chars/colors to the art
+        self.last_art_key = None
         self.rewrite_art()
         self.x_renderable.scale_x = self.char_art.width
         self.x_renderable.scale_y = -self.char_art.height
@@ -270,7 +273,17 @@ class StatusBarUI(UIElement):
         self.fg_art.geo_changed = True
         self.bg_art.geo_changed = True
     
+    def get_art_key(self):
+        "Return tuple of everything that determines what rewrite_art draws."
+        captions = tuple([b.caption for b in self.buttons])
+        return (self.art.width, self.get_tile_text()) + captions
+    
     def rewrite_art(self):
+        # runs every update, but what we show rarely changes
+        art_key = self.get_art_key()
+        if art_key == self.last_art_key:
+            return
+        self.last_art_key = art_key
         bg = self.ui.colors.white
         self.art.clear_frame_layer(0, 0, bg)
         # if user is making window reeeeally skinny, bail
@@ -355,6 +368,26 @@ class StatusBarUI(UIElement):
     def reset_loc(self):
         UIElement.reset_loc(self)
     
+    def get_tile_text(self):
+        "Return (text, color index) of cursor's current tile coordinates."
+        art = self.ui.active_art
+        tile = 'X/Y'
+        color = self.ui.colors.white
+        if self.ui.app.cursor and art:
+            tile_x, tile_y = self.ui.app.cursor.get_tile()
+            tile_y = int(tile_y)
+            # user-facing coordinates are always base 1
+            tile_x += 1
+            tile_y += 1
+            if tile_x <= 0 or tile_x > art.width:
+                color = self.dim_color
+            if tile_y <= 0 or tile_y > art.height:
+                color = self.dim_color
+            tile_x = str(tile_x).rjust(3)
+            tile_y = str(tile_y).rjust(3)
+            tile = '%s,%s' % (tile_x, tile_y)
+        return tile, color
+    
     def write_right_elements(self):
         """
         fills in right-justified parts of status bar, eg current
@@ -374,21 +407,7 @@ class StatusBarUI(UIElement):
         self.zoom_set_button.x = x
         x -= padding
         # tile
-        tile = 'X/Y'
-        color = light
-        if self.ui.app.cursor and art:
-            tile_x, tile_y = self.ui.app.cursor.get_tile()
-            tile_y = int(tile_y)
-            # user-facing coordinates are always base 1
-            tile_x += 1
-            tile_y += 1
-            if tile_x <= 0 or tile_x > art.width:
-                color = self.dim_color
-            if tile_y <= 0 or tile_y > art.height:
-                color = self.dim_color
-            tile_x = str(tile_x).rjust(3)
-            tile_y = str(tile_y).rjust(3)
-            tile = '%s,%s' % (tile_x, tile_y)
+        tile, color = self.get_tile_text()
         self.art.write_string(0, 0, x, 0, tile, color, dark, True)
         # tile label
         x -= len(tile)